@@ -0,0 +1,60 @@
+import os
+from flask import Flask
+
+
+# ------------------------------ Application factory
+# create_app() only wires things together: no tables are created, no rows are seeded and nothing
+# heavy (numpy, alembic, Pillow) is imported, so a new worker is ready to serve quickly.
+# The database is set up explicitly with the CLI (see application/cli.py):
+#     flask init-db       create or upgrade the schema
+#     flask seed-admin    create the Admin account
+
+# Templates, static files and instance/ live at the root of the project, next to main.py
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def create_app(config_object=None):
+    from .config import Config
+    from .controllers import register_error_handlers
+    from .database import db, login_manager
+    from .blueprints import register_blueprints
+    from . import cache, cli, fragments, http_cache, identity, instrumentation, metrics, profiler
+    from . import stats
+    # Imported for its ORM events, which keep the genres of the trending rows up to date (see application/trending.py)
+    from . import trending  # noqa: F401
+
+    app = Flask('main', root_path=ROOT_PATH, instance_path=os.path.join(ROOT_PATH, 'instance'))
+    app.config.from_object(config_object or Config)
+
+    db.init_app(app)
+    login_manager.init_app(app)
+
+    # Timing, SQL count and rows of every request, and the slow-query log
+    instrumentation.init_app(app)
+    # /metrics, added up over the worker processes of the machine
+    metrics.init_app(app)
+    # Sampling profiler for the admins, when PROFILING_ENABLED
+    profiler.init_app(app)
+
+    # Backend of the caches shared by the workers and nodes (CACHE_BACKEND)
+    cache.init_app(app)
+    # Dashboard counters, reconciled with the tables every STATS_RECONCILE_SECONDS
+    stats.init_app(app)
+
+    # Load the user into the current session (from the identity cache, see application/identity.py)
+    @login_manager.user_loader
+    def load_user(user_id):
+        return identity.get_user(user_id)
+
+    # {% cache %} blocks in the templates
+    fragments.init_app(app)
+
+    # {{ static_url(...) }} in the templates, and immutable caching of the fingerprinted URLs
+    http_cache.init_app(app)
+
+    # Routes, from the blueprints enabled in CASSETTE_BLUEPRINTS (all of them by default)
+    register_blueprints(app)
+    register_error_handlers(app)
+
+    cli.register_commands(app)
+    return app
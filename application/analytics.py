@@ -0,0 +1,121 @@
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import func
+from .cache import TTLCache
+from .database import db
+from .models import Plays, Songs
+
+
+# ------------------------------ Dashboard aggregates
+# The dashboard charts are drawn in the browser from compact, columnar series:
+#   {'labels': [...], 'plays': [...]}
+# Plays are aggregated once per day in SQL (GROUP BY day), and that daily series is cached;
+# any date range and granularity (day, week, month, year) is then re-bucketed from it in Python.
+# The cache is cleared whenever a batch of plays is written (see application/plays.py).
+
+GRANULARITIES = ('day', 'week', 'month', 'year')
+MAX_BUCKETS = 1000
+SECONDS_PER_DAY = 86400
+
+series_cache = TTLCache(maxsize=256, ttl=300, name='analytics')
+
+
+def invalidate():
+    series_cache.clear()
+
+
+def _timestamp(day):
+    return int(datetime.combine(day, datetime.min.time(), timezone.utc).timestamp())
+
+
+# Function: Total plays per day (UTC), for every day that has plays
+def daily_plays():
+    def compute():
+        day_number = Plays.date_created // SECONDS_PER_DAY
+        rows = (db.session.query(day_number, func.sum(Plays.play_count))
+                .group_by(day_number)
+                .all())
+        return {date(1970, 1, 1) + timedelta(days=int(day)): int(count) for day, count in rows}
+    return series_cache.get_or_set('daily_plays', compute)
+
+
+def _bucket(day, granularity):
+    if granularity == 'day':
+        return day.isoformat()
+    if granularity == 'week':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if granularity == 'month':
+        return f"{day.year}-{day.month:02d}"
+    return str(day.year)
+
+
+def _next_bucket_day(day, granularity):
+    if granularity == 'day':
+        return day + timedelta(days=1)
+    if granularity == 'week':
+        return day + timedelta(days=7 - day.weekday())
+    if granularity == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return date(day.year + 1, 1, 1)
+
+
+# Function: Plays per bucket between two dates (both included); empty buckets are kept as 0
+def usage_series(start=None, end=None, granularity='month'):
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    def compute():
+        days = daily_plays()
+        first, last = start or min(days, default=None), end or max(days, default=None)
+        if first is None or last is None:
+            return {'granularity': granularity, 'labels': [], 'plays': []}
+
+        labels, counts = [], {}
+        day = first
+        while day <= last:
+            label = _bucket(day, granularity)
+            labels.append(label)
+            counts[label] = 0
+            if len(labels) > MAX_BUCKETS:
+                raise ValueError(f"Too many {granularity}s in the range, pick a larger granularity")
+            day = _next_bucket_day(day, granularity)
+        for day, count in days.items():
+            if first <= day <= last:
+                counts[_bucket(day, granularity)] += count
+
+        return {'granularity': granularity,
+                'start': first.isoformat(),
+                'end': last.isoformat(),
+                'labels': labels,
+                'plays': [counts[label] for label in labels]}
+
+    return series_cache.get_or_set(('usage', start, end, granularity), compute)
+
+
+# Function: Plays per song between two dates, most played first
+# With creator_id, only the songs uploaded by that creator.
+def song_plays_series(start=None, end=None, limit=50, creator_id=None):
+    def compute():
+        plays_in_range = db.session.query(Plays.song_id, func.sum(Plays.play_count).label('plays'))
+        if start:
+            plays_in_range = plays_in_range.filter(Plays.date_created >= _timestamp(start))
+        if end:
+            plays_in_range = plays_in_range.filter(Plays.date_created < _timestamp(end + timedelta(days=1)))
+        plays_in_range = plays_in_range.group_by(Plays.song_id).subquery()
+
+        total = func.coalesce(plays_in_range.c.plays, 0)
+        query = (db.session.query(Songs.song_id, Songs.title, total)
+                 .outerjoin(plays_in_range, plays_in_range.c.song_id == Songs.song_id))
+        if creator_id is not None:
+            query = query.filter(Songs.user_id == creator_id)
+        rows = query.order_by(total.desc(), Songs.song_id).limit(limit).all()
+
+        return {'song_ids': [song_id for song_id, _, _ in rows],
+                'labels': [title for _, title, _ in rows],
+                'plays': [int(plays) for _, _, plays in rows]}
+
+    return series_cache.get_or_set(('song_plays', start, end, limit, creator_id), compute)
+
+
+def parse_date(value):
+    return date.fromisoformat(value) if value else None
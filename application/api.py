@@ -1,9 +1,176 @@
-from flask_restful import Resource, reqparse
-from main import *
-from application.database import *
-from application.models import *
-import math
-import jsonify
+from flask import current_app, request, g, json, Response
+from flask_login import current_user
+from flask_restful import Resource, abort
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from sqlalchemy import select
+from sqlalchemy.orm import load_only, selectinload
+from werkzeug.security import check_password_hash
+from datetime import datetime
+from functools import wraps
+import base64
+import hashlib
+import os
+from application import analytics, identity, instrumentation, profiler
+from application.database import db
+from application.models import Users, Genres, Songs, Playlists, PlaylistSong
+from application.uploads import delete_songs, save_song
+
+
+# ------------------------------ Helpers for the REST API
+# - Token auth: POST /api/login returns a signed token, sent back as "Authorization: Bearer <token>"
+#   (a logged-in browser session works too).
+# - Cursor pagination: list responses carry "next_cursor", passed back as ?cursor=...
+# - Sparse fieldsets: ?fields=title,singer returns (and loads) only those columns.
+# - Batch get: /api/songs?ids=1,2,3
+# - Song filters on indexed columns: ?genre=Rock, ?min_duration=120&max_duration=300 (seconds)
+# - Strong ETags on every GET, with 304 Not Modified on If-None-Match.
+
+TOKEN_SALT = 'cassette-api-token'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BATCH_SIZE = 100
+
+SONG_FIELDS = ('song_id', 'title', 'singer', 'genre', 'release_date', 'duration',
+               'cover', 'user_id', 'flagged', 'lyrics')
+SONG_DEFAULT_FIELDS = tuple(field for field in SONG_FIELDS if field != 'lyrics')
+# Fields computed from another column: genre is the name of the genre_id, duration is duration_ms in seconds
+# (lyrics are in the song_lyrics table)
+SONG_COLUMNS = {'genre': 'genre_id', 'duration': 'duration_ms'}
+PLAYLIST_FIELDS = ('playlist_id', 'user_id', 'title', 'description', 'created_at', 'access')
+PLAYLIST_ACCESS = ('public', 'private')
+
+
+def _text(value):
+    return isinstance(value, str) and value.strip() != ''
+
+
+# Editable fields of a song, and the values they accept
+SONG_EDITS = {
+    'title': _text,
+    'singer': _text,
+    'genre': _text,
+    'release_date': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'lyrics': lambda value: value is None or isinstance(value, str),
+}
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=TOKEN_SALT)
+
+
+def make_token(user):
+    return _serializer().dumps({'user_id': user.user_id})
+
+
+# Function: Resolve the user of an API call, from the bearer token or the session
+def api_user():
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        try:
+            payload = _serializer().loads(header[len('Bearer '):],
+                                          max_age=current_app.config['API_TOKEN_MAX_AGE'])
+        except SignatureExpired:
+            abort(401, message='Token expired, log in again')
+        except BadSignature:
+            abort(401, message='Invalid token')
+        user = identity.get_user(payload['user_id'])
+    elif current_user.is_authenticated:
+        user = current_user._get_current_object()
+    else:
+        user = None
+
+    if user is None:
+        abort(401, message='Authentication required')
+    if user.blacklist:
+        abort(403, message='You have been blacklisted! Contact the Admin.')
+    return user
+
+
+# Decorator: Resource methods that need a logged-in user (available as g.api_user)
+def token_required(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        g.api_user = api_user()
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def admin_required(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        g.api_user = api_user()
+        if g.api_user.role != 0:
+            abort(403, message='Admin only')
+        return func(*args, **kwargs)
+    return wrapper
+
+
+# Function: JSON response with a strong ETag (a hash of the exact body), answering 304 when it matches
+def etag_response(payload, status=200):
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str)
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    response.set_etag(hashlib.sha256(body.encode()).hexdigest()[:32])
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Authorization')
+    return response.make_conditional(request)
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except (ValueError, UnicodeDecodeError):
+        abort(400, message='Invalid cursor')
+
+
+def page_size():
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return min(max(limit, 1), MAX_PAGE_SIZE)
+
+
+# Function: Fields asked with ?fields=..., checked against the allowed ones (the id is always included)
+def requested_fields(allowed, default, id_field):
+    fields = request.args.get('fields')
+    if not fields:
+        return list(default)
+    fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        abort(400, message=f"Unknown fields: {', '.join(unknown)}")
+    return [id_field] + [field for field in fields if field != id_field]
+
+
+def serialize(row, fields):
+    data = {field: getattr(row, field) for field in fields}
+    for field, value in data.items():
+        if isinstance(value, datetime):
+            data[field] = value.isoformat()
+    return data
+
+
+# Function: Parse ?ids=1,2,3
+def requested_ids():
+    try:
+        ids = [int(song_id) for song_id in request.args['ids'].split(',') if song_id.strip()]
+    except ValueError:
+        abort(400, message='ids must be a comma separated list of numbers')
+    if len(ids) > MAX_BATCH_SIZE:
+        abort(400, message=f'At most {MAX_BATCH_SIZE} ids per request')
+    return ids
+
+
+# Function: One page of a query ordered by its id column, plus the cursor of the next page
+def paginate(query, id_column):
+    cursor = request.args.get('cursor')
+    if cursor:
+        query = query.filter(id_column > decode_cursor(cursor))
+    limit = page_size()
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    next_cursor = encode_cursor(getattr(rows[limit - 1], id_column.key)) if len(rows) > limit else None
+    return rows[:limit], next_cursor
 
 
 # APIs for Index
@@ -15,40 +182,382 @@ class IndexAPI(Resource):
 # API for login a user, so that the user can access protected api calls
 class APILogin(Resource):
     def post(self):
-        pass
+        payload = request.get_json(silent=True) or request.form
+        email = payload.get('email', '')
+        password = payload.get('password', '')
+
+        user = Users.query.filter_by(email=email).first()
+        if not user or not check_password_hash(user.password, password):
+            abort(401, message='Invalid credentials')
+        if user.blacklist:
+            abort(403, message='You have been blacklisted! Contact the Admin.')
+
+        return {'token': make_token(user),
+                'token_type': 'Bearer',
+                'expires_in': current_app.config['API_TOKEN_MAX_AGE'],
+                'user': {'user_id': user.user_id, 'name': user.name, 'role': user.role}}
 
 
 # CRUD APIs for Songs
 class SongsAPI(Resource):
-    def get(self, song_id):
-        pass
+    @token_required
+    def get(self, song_id=None):
+        fields = requested_fields(SONG_FIELDS, SONG_DEFAULT_FIELDS, 'song_id')
+        query = Songs.query.options(load_only(*[getattr(Songs, SONG_COLUMNS.get(field, field))
+                                                for field in fields if field != 'lyrics']))
+        if 'lyrics' in fields:
+            # One more query for the lyrics of the whole page
+            query = query.options(selectinload(Songs.lyrics_row))
+        if g.api_user.role != 0:
+            query = query.filter(Songs.flagged == False)
+
+        # Single song
+        if song_id is not None:
+            song = query.filter(Songs.song_id == song_id).first()
+            if song is None:
+                abort(404, message=f'Song {song_id} not found')
+            return etag_response(serialize(song, fields))
 
+        # Batch get, in the order of the ids asked for
+        if 'ids' in request.args:
+            ids = requested_ids()
+            songs = {song.song_id: song for song in query.filter(Songs.song_id.in_(ids)).all()}
+            return etag_response({'data': [serialize(songs[song_id], fields) for song_id in ids if song_id in songs],
+                                  'missing': [song_id for song_id in ids if song_id not in songs]})
+
+        # Listing, with optional filters
+        search_query = request.args.get('q')
+        if search_query:
+            query = query.filter(Songs.title.ilike(f'%{search_query}%') |
+                                 Songs.singer.ilike(f'%{search_query}%'))
+        if request.args.get('genre'):
+            query = query.filter(Songs.genre_id.in_(select(Genres.genre_id)
+                                                    .where(Genres.matching(request.args['genre']))))
+        if request.args.get('min_duration', type=float) is not None:
+            query = query.filter(Songs.duration_ms >= request.args.get('min_duration', type=float) * 1000)
+        if request.args.get('max_duration', type=float) is not None:
+            query = query.filter(Songs.duration_ms <= request.args.get('max_duration', type=float) * 1000)
+        if request.args.get('user_id', type=int):
+            query = query.filter(Songs.user_id == request.args.get('user_id', type=int))
+
+        songs, next_cursor = paginate(query, Songs.song_id)
+        return etag_response({'data': [serialize(song, fields) for song in songs],
+                              'next_cursor': next_cursor})
+
+    @token_required
     def put(self, song_id):
-        pass
+        song = db.session.get(Songs, song_id)
+        if song is None:
+            abort(404, message=f'Song {song_id} not found')
+        if song.user_id != g.api_user.user_id:
+            abort(403, message='You can only edit your own songs')
 
+        payload = request.get_json(silent=True) or {}
+        invalid = [field for field, valid in SONG_EDITS.items() if field in payload and not valid(payload[field])]
+        if invalid:
+            abort(400, message=f"Invalid fields: {', '.join(invalid)}")
+        for field in SONG_EDITS:
+            if field in payload:
+                setattr(song, field, payload[field])
+        try:
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            abort(400, message=f'Error editing the song: {error}')
+        return serialize(song, SONG_FIELDS)
+
+    @token_required
     def delete(self, song_id):
-        pass
+        song = db.session.get(Songs, song_id)
+        if song is None:
+            abort(404, message=f'Song {song_id} not found')
+        if g.api_user.role != 0 and song.user_id != g.api_user.user_id:
+            abort(403, message='You can only delete your own songs')
+
+        try:
+            # With the related entries, from other models
+            delete_songs([song_id])
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            abort(400, message=f'Error deleting the song: {error}')
+        return '', 204
 
+    # Multipart upload, same fields as the upload form (title, singer, genre, release_date, lyrics,
+    # music_file and an optional cover_file)
+    @token_required
     def post(self):
-        pass
+        if g.api_user.role != 2:
+            abort(403, message='Only creators can upload songs')
+        missing = [field for field in ('title', 'singer', 'genre', 'release_date') if not request.form.get(field)]
+        if 'music_file' not in request.files:
+            missing.append('music_file')
+        if missing:
+            abort(400, message=f"Missing fields: {', '.join(missing)}")
+        if not request.form['release_date'].isdigit():
+            abort(400, message='Invalid fields: release_date')
+
+        try:
+            song = save_song(current_app._get_current_object(), g.api_user.user_id, request.form, request.files)
+        except Exception as error:
+            db.session.rollback()
+            abort(400, message=f'Error uploading the song: {error}')
+        return serialize(song, SONG_DEFAULT_FIELDS), 201
+
+
+# Lyrics of a song, line by line (with the start of every line for time-synced lyrics),
+# and ?position_ms=... gives the index of the line sung at that position of the song
+class SongLyricsAPI(Resource):
+    @token_required
+    def get(self, song_id):
+        song = db.session.get(Songs, song_id)
+        if song is None or (song.flagged and g.api_user.role != 0):
+            abort(404, message=f'Song {song_id} not found')
+        if song.lyrics_row is None:
+            abort(404, message=f'Song {song_id} has no lyrics')
+        data = {'song_id': song_id,
+                'format': song.lyrics_row.format,
+                'lines': [{'start_ms': start, 'text': line} for start, line in song.lyrics_row.lines()]}
+        position = request.args.get('position_ms', type=int)
+        if position is not None:
+            data['current_line'] = song.lyrics_row.line_at(position)
+        return etag_response(data)
+
+
+# Genres, with their number of songs (the most common first)
+class GenresAPI(Resource):
+    @token_required
+    def get(self):
+        genres = (db.session.query(Genres.genre_id, Genres.name, Genres.song_count)
+                  .filter(Genres.song_count > 0)
+                  .order_by(Genres.song_count.desc(), Genres.name)
+                  .all())
+        return etag_response({'data': [{'genre_id': genre_id, 'name': name, 'song_count': song_count}
+                                       for genre_id, name, song_count in genres]})
+
+
+# Trending songs (see application/trending.py), of every genre or of ?genre_id=...: the songs with
+# their score, the number of plays they got counting a play half as much every TRENDING_HALF_LIFE_HOURS
+class TrendingAPI(Resource):
+    @token_required
+    def get(self):
+        from application import trending
+        scored = trending.top_songs(page_size(), request.args.get('genre_id', type=int))
+        return etag_response({'data': [dict(serialize(song, SONG_DEFAULT_FIELDS), score=round(score, 3))
+                                       for song, score in scored]})
+
+
+# Faceted browsing (see application/facets.py): ?genre=<genre_id>&year=2020&year=2021&creator=<user_id>&rating=4
+# returns the matching song_ids (newest first, paginated with next_cursor) and the count of every facet value
+class BrowseAPI(Resource):
+    @token_required
+    def get(self):
+        from application import facets
+        filters = facets.filters_from_args(request.args)
+        before = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        song_ids, total, counts, next_cursor = facets.browse(filters, limit=page_size(), before=before)
+        labels = facets.labels(counts)
+        return etag_response({'song_ids': song_ids,
+                              'total': total,
+                              'facets': {facet: [{'value': value, 'label': labels[facet].get(value, str(value)),
+                                                  'count': count} for value, count in values]
+                                         for facet, values in counts.items()},
+                              'next_cursor': encode_cursor(next_cursor) if next_cursor is not None else None})
 
 
 # CRUD APIs for Playlists
 class PlaylistsAPI(Resource):
-    def get(self):
-        pass
+    @staticmethod
+    def _visible(query):
+        # Own playlists, and everybody's public ones
+        if g.api_user.role == 0:
+            return query
+        return query.filter((Playlists.user_id == g.api_user.user_id) | (Playlists.access == 'public'))
 
-    def put(self):
-        pass
+    @staticmethod
+    def _own_playlist(playlist_id):
+        playlist = db.session.get(Playlists, playlist_id)
+        if playlist is None:
+            abort(404, message=f'Playlist {playlist_id} not found')
+        if playlist.user_id != g.api_user.user_id and g.api_user.role != 0:
+            abort(403, message='You can only change your own playlists')
+        return playlist
 
-    def delete(self):
-        pass
+    # Function: 400 for an unknown access, or song ids that aren't listed songs
+    @staticmethod
+    def _check(payload):
+        if 'access' in payload and payload['access'] not in PLAYLIST_ACCESS:
+            abort(400, message=f"access must be one of: {', '.join(PLAYLIST_ACCESS)}")
+        if 'song_ids' in payload:
+            song_ids = payload['song_ids']
+            if not isinstance(song_ids, list) or \
+                    not all(isinstance(song_id, int) and not isinstance(song_id, bool) for song_id in song_ids):
+                abort(400, message='song_ids must be a list of numbers')
+            found = {song_id for (song_id,) in db.session.query(Songs.song_id)
+                     .filter(Songs.song_id.in_(set(song_ids)), Songs.flagged == False)} if song_ids else set()
+            unknown = sorted(set(song_ids) - found)
+            if unknown:
+                abort(400, message=f"Unknown songs: {', '.join(map(str, unknown))}")
 
+    @staticmethod
+    def _set_songs(playlist, song_ids):
+        PlaylistSong.query.filter_by(playlist_id=playlist.playlist_id).delete()
+        db.session.add_all([PlaylistSong(playlist_id=playlist.playlist_id, song_id=song_id)
+                            for song_id in song_ids])
+
+    @staticmethod
+    def _song_ids(playlist_id):
+        return [song_id for (song_id,) in db.session.query(PlaylistSong.song_id)
+                .filter_by(playlist_id=playlist_id).order_by(PlaylistSong.id)]
+
+    @token_required
+    def get(self, playlist_id=None):
+        fields = requested_fields(PLAYLIST_FIELDS + ('song_ids',), PLAYLIST_FIELDS, 'playlist_id')
+        columns = [getattr(Playlists, field) for field in fields if field != 'song_ids']
+        query = self._visible(Playlists.query.options(load_only(*columns)))
+
+        if playlist_id is not None:
+            playlist = query.filter(Playlists.playlist_id == playlist_id).first()
+            if playlist is None:
+                abort(404, message=f'Playlist {playlist_id} not found')
+            data = serialize(playlist, [field for field in fields if field != 'song_ids'])
+            data['song_ids'] = self._song_ids(playlist_id)
+            return etag_response(data)
+
+        if request.args.get('scope') == 'mine':
+            query = query.filter(Playlists.user_id == g.api_user.user_id)
+        playlists, next_cursor = paginate(query, Playlists.playlist_id)
+        data = [serialize(playlist, [field for field in fields if field != 'song_ids']) for playlist in playlists]
+        if 'song_ids' in fields:
+            # All the song lists of the page in one query
+            song_ids = {playlist.playlist_id: [] for playlist in playlists}
+            for row_playlist_id, song_id in (db.session.query(PlaylistSong.playlist_id, PlaylistSong.song_id)
+                                             .filter(PlaylistSong.playlist_id.in_(song_ids.keys()))
+                                             .order_by(PlaylistSong.id)):
+                song_ids[row_playlist_id].append(song_id)
+            for item in data:
+                item['song_ids'] = song_ids[item['playlist_id']]
+        return etag_response({'data': data, 'next_cursor': next_cursor})
+
+    @token_required
+    def put(self, playlist_id):
+        playlist = self._own_playlist(playlist_id)
+        payload = request.get_json(silent=True) or {}
+        self._check(payload)
+        for field in ('title', 'description', 'access'):
+            if field in payload:
+                setattr(playlist, field, payload[field])
+        try:
+            if 'song_ids' in payload:
+                self._set_songs(playlist, payload['song_ids'])
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            abort(400, message=f'Error editing the playlist: {error}')
+        data = serialize(playlist, PLAYLIST_FIELDS)
+        data['song_ids'] = self._song_ids(playlist_id)
+        return data
+
+    @token_required
+    def delete(self, playlist_id):
+        playlist = self._own_playlist(playlist_id)
+        try:
+            PlaylistSong.query.filter_by(playlist_id=playlist_id).delete()
+            db.session.delete(playlist)
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            abort(400, message=f'Error deleting the playlist: {error}')
+        return '', 204
+
+    @token_required
     def post(self):
-        pass
+        payload = request.get_json(silent=True) or {}
+        if not payload.get('title'):
+            abort(400, message='Missing fields: title')
+        self._check(payload)
+        try:
+            playlist = Playlists(user_id=g.api_user.user_id,
+                                 title=payload['title'],
+                                 description=payload.get('description'),
+                                 created_at=datetime.now(),
+                                 access=payload.get('access', 'public'))
+            db.session.add(playlist)
+            db.session.flush()
+            self._set_songs(playlist, payload.get('song_ids', []))
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            abort(400, message=f'Error creating the playlist: {error}')
+        data = serialize(playlist, PLAYLIST_FIELDS)
+        data['song_ids'] = self._song_ids(playlist.playlist_id)
+        return data, 201
+
+
+# Function: Common query parameters of the graph APIs: ?start=YYYY-MM-DD&end=YYYY-MM-DD&limit=50
+def graph_range():
+    try:
+        start = analytics.parse_date(request.args.get('start'))
+        end = analytics.parse_date(request.args.get('end'))
+    except ValueError:
+        abort(400, message='start and end must be dates, as YYYY-MM-DD')
+    if start and end and start > end:
+        abort(400, message='start must be before end')
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_PAGE_SIZE)
+    return start, end, limit
 
 
 # API for fetching Graphs for Admin Dashboard
+# ?series=monthly_usage,song_plays picks the series, ?granularity=day|week|month|year buckets the usage
 class AdminGraphsAPI(Resource):
+    @admin_required
+    def get(self):
+        start, end, limit = graph_range()
+        series = request.args.get('series', 'monthly_usage,song_plays').split(',')
+        granularity = request.args.get('granularity', 'month')
+
+        payload = {}
+        try:
+            if 'monthly_usage' in series:
+                payload['monthly_usage'] = analytics.usage_series(start, end, granularity)
+            if 'song_plays' in series:
+                payload['song_plays'] = analytics.song_plays_series(start, end, limit)
+        except ValueError as error:
+            abort(400, message=str(error))
+        return etag_response(payload)
+
+
+# API for the Song VS Plays graph of the Creator Dashboard: plays of the creator's own songs
+class CreatorGraphsAPI(Resource):
+    @token_required
+    def get(self):
+        if g.api_user.role != 2:
+            abort(403, message='Creators only')
+        start, end, limit = graph_range()
+        return etag_response({'song_plays': analytics.song_plays_series(start, end, limit,
+                                                                        creator_id=g.api_user.user_id)})
+
+
+# API for the request timings of the admins: per endpoint, percentiles of the last requests
+# (wall_ms, db_ms, render_ms, sql statements, rows), as seen by the worker process answering
+class AdminPerformanceAPI(Resource):
+    @admin_required
+    def get(self):
+        return {'pid': os.getpid(),
+                'window': instrumentation.SAMPLE_WINDOW,
+                'endpoints': instrumentation.summary()}
+
+
+# API for profiling the workers (PROFILING_ENABLED): ?seconds=10 samples the requests being served
+# by every worker for that long, and returns their stacks in the collapsed format of flamegraph.pl
+class AdminProfileAPI(Resource):
+    @admin_required
     def get(self):
-        pass
+        if not profiler.enabled():
+            abort(404, message='Profiling is off, set PROFILING_ENABLED=1')
+        seconds = min(max(request.args.get('seconds', 10, type=float), 1), profiler.MAX_SECONDS)
+        stacks, workers = profiler.profile_workers(seconds)
+        return Response(profiler.format_stacks(stacks), mimetype='text/plain',
+                        headers={'X-Profile-Workers': str(workers),
+                                 'Content-Disposition': 'attachment; filename=profile.folded',
+                                 'Cache-Control': 'no-store'})
@@ -0,0 +1,202 @@
+from datetime import datetime
+import logging
+import shutil
+import subprocess
+import wave
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Audio feature extraction
+# Every song is summarised by a fixed-length vector of FEATURE_DIM float32 values:
+#     0      tempo (BPM)
+#     1 - 2  loudness, mean and standard deviation of the frame RMS in dB
+#     3 - 4  spectral centroid, mean and standard deviation (Hz)
+#     5      spectral rolloff (85% of the energy, Hz)
+#     6      spectral bandwidth (Hz)
+#     7      zero crossing rate
+#     8      spectral flatness
+#     9 - 15 share of the energy in 7 log-spaced frequency bands
+# Everything below works on decoded mono PCM with plain NumPy.
+
+FEATURE_DIM = 16
+SAMPLE_RATE = 22050
+FRAME_SIZE = 2048
+HOP_SIZE = 512
+MAX_SECONDS = 120
+BLOCK_FRAMES = 256
+BAND_EDGES = np.geomspace(60, SAMPLE_RATE / 2, 8)
+EPS = 1e-10
+
+
+# Function: Decode an audio file into mono float32 PCM at SAMPLE_RATE
+# WAV files are read with the standard library, everything else (mp3) goes through ffmpeg, if installed.
+def decode_pcm(file_path, sample_rate=SAMPLE_RATE, max_seconds=MAX_SECONDS):
+    if file_path.lower().endswith('.wav'):
+        return _decode_wav(file_path, sample_rate, max_seconds)
+
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        logger.warning("ffmpeg not found, skipping feature extraction for %s", file_path)
+        return None
+
+    command = [ffmpeg, '-v', 'quiet', '-i', file_path, '-t', str(max_seconds),
+               '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), '-']
+    result = subprocess.run(command, capture_output=True, timeout=120)
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768.0
+
+
+def _decode_wav(file_path, sample_rate, max_seconds):
+    with wave.open(file_path, 'rb') as wav_file:
+        channels = wav_file.getnchannels()
+        width = wav_file.getsampwidth()
+        source_rate = wav_file.getframerate()
+        raw = wav_file.readframes(min(wav_file.getnframes(), source_rate * max_seconds))
+
+    if width == 1:
+        pcm = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128.0
+    elif width == 2:
+        pcm = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif width == 4:
+        pcm = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648.0
+    else:
+        return None
+
+    # Down-mix to mono, and resample with a linear interpolation
+    pcm = pcm.reshape(-1, channels).mean(axis=1)
+    if source_rate != sample_rate and len(pcm) > 1:
+        duration = len(pcm) / source_rate
+        target_times = np.arange(int(duration * sample_rate)) / sample_rate
+        pcm = np.interp(target_times, np.arange(len(pcm)) / source_rate, pcm).astype(np.float32)
+    return pcm
+
+
+# Function: Estimate the tempo from the spectral flux, with an autocorrelation over 60 - 200 BPM
+def _estimate_tempo(flux, sample_rate):
+    if len(flux) < 4:
+        return 0.0
+    frame_rate = sample_rate / HOP_SIZE
+    flux = flux - flux.mean()
+    size = 1 << int(np.ceil(np.log2(2 * len(flux))))
+    spectrum = np.fft.rfft(flux, size)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum))[:len(flux)]
+
+    min_lag = max(1, int(frame_rate * 60 / 200))
+    max_lag = min(len(autocorrelation) - 1, int(frame_rate * 60 / 60))
+    if max_lag <= min_lag:
+        return 0.0
+    # Weighting the lags with a log-normal prior around 120 BPM, to avoid half/double tempo picks
+    lags = np.arange(min_lag, max_lag + 1)
+    prior = np.exp(-0.5 * np.log2(60.0 * frame_rate / lags / 120.0) ** 2)
+    lag = lags[int(np.argmax(autocorrelation[min_lag:max_lag + 1] * prior))]
+    return 60.0 * frame_rate / lag
+
+
+# Function: Build the FEATURE_DIM vector out of decoded PCM
+# Frames are processed in blocks, so that memory stays flat for long songs.
+def extract_features(pcm, sample_rate=SAMPLE_RATE):
+    if pcm is None or len(pcm) < FRAME_SIZE:
+        return None
+
+    frames = np.lib.stride_tricks.sliding_window_view(pcm, FRAME_SIZE)[::HOP_SIZE]
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    freqs = np.fft.rfftfreq(FRAME_SIZE, 1.0 / sample_rate)
+    band_index = np.digitize(freqs, BAND_EDGES) - 1
+
+    rms, centroid, rolloff, bandwidth, zcr, flatness, flux = [], [], [], [], [], [], []
+    band_energy = np.zeros(len(BAND_EDGES) - 1)
+    previous = None
+
+    for start in range(0, len(frames), BLOCK_FRAMES):
+        block = frames[start:start + BLOCK_FRAMES]
+        magnitude = np.abs(np.fft.rfft(block * window, axis=1))
+        power = magnitude ** 2
+        total = power.sum(axis=1) + EPS
+
+        rms.append(np.sqrt(np.mean(block ** 2, axis=1)))
+        block_centroid = (power * freqs).sum(axis=1) / total
+        centroid.append(block_centroid)
+        bandwidth.append(np.sqrt((power * (freqs - block_centroid[:, None]) ** 2).sum(axis=1) / total))
+        cumulative = np.cumsum(power, axis=1)
+        rolloff.append(freqs[np.argmax(cumulative >= 0.85 * cumulative[:, -1:], axis=1)])
+        zcr.append(np.mean(np.abs(np.diff(np.signbit(block), axis=1)), axis=1))
+        flatness.append(np.exp(np.mean(np.log(magnitude + EPS), axis=1)) / (np.mean(magnitude, axis=1) + EPS))
+
+        for band in range(len(band_energy)):
+            band_energy[band] += power[:, band_index == band].sum()
+
+        # Onset strength: positive change of the log spectrum between consecutive frames
+        log_magnitude = np.log1p(magnitude)
+        if previous is not None:
+            log_magnitude_with_previous = np.vstack([previous, log_magnitude])
+        else:
+            log_magnitude_with_previous = log_magnitude
+        flux.append(np.maximum(np.diff(log_magnitude_with_previous, axis=0), 0).sum(axis=1))
+        previous = log_magnitude[-1:]
+
+    rms = np.concatenate(rms)
+    loudness = 20 * np.log10(rms + EPS)
+    centroid = np.concatenate(centroid)
+
+    vector = np.empty(FEATURE_DIM, dtype=np.float32)
+    vector[0] = _estimate_tempo(np.concatenate(flux), sample_rate)
+    vector[1] = loudness.mean()
+    vector[2] = loudness.std()
+    vector[3] = centroid.mean()
+    vector[4] = centroid.std()
+    vector[5] = np.concatenate(rolloff).mean()
+    vector[6] = np.concatenate(bandwidth).mean()
+    vector[7] = np.concatenate(zcr).mean()
+    vector[8] = np.concatenate(flatness).mean()
+    vector[9:] = band_energy / (band_energy.sum() + EPS)
+    return vector
+
+
+# Function: Decode + extract, straight from a file on disk
+def extract_file_features(file_path):
+    try:
+        return extract_features(decode_pcm(file_path))
+    except (OSError, ValueError, wave.Error, subprocess.SubprocessError) as error:
+        logger.warning("Could not extract features from %s: %s", file_path, error)
+        return None
+
+
+# Function: Pack/unpack the vector into the bytes stored in SongFeatures.vector
+def vector_to_bytes(vector):
+    return np.asarray(vector, dtype='<f4').tobytes()
+
+
+def bytes_to_vector(data):
+    return np.frombuffer(data, dtype='<f4')
+
+
+# Function: Extract and save the features of one song (runs as a background job after the upload)
+def store_song_features(song_id):
+    from .database import db
+    from .models import Songs, SongFeatures
+
+    song = db.session.get(Songs, song_id)
+    if song is None:
+        return None
+
+    vector = extract_file_features(song.file_path)
+    if vector is None:
+        return None
+
+    try:
+        features = db.session.get(SongFeatures, song_id)
+        if features is None:
+            features = SongFeatures(song_id=song_id, created_at=datetime.now())
+            db.session.add(features)
+        features.vector = vector_to_bytes(vector)
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()
+        logger.error("Error saving the features of song %s: %s", song_id, error)
+        return None
+    finally:
+        db.session.close()
+    return vector
@@ -0,0 +1,197 @@
+import numpy as np
+
+
+# ------------------------------ Compressed bitmaps
+# Sets of song_ids stored like Roaring bitmaps: the ids are split by their high 16 bits into
+# containers of up to 65536 values, each kept in the smallest of two forms:
+#     array     sorted uint16 of the low 16 bits, for up to ARRAY_MAX values (2 bytes per id)
+#     bitmap    1024 uint64 words, one bit per value (8 KB, whatever the number of ids)
+# so sparse sets (a creator's songs) take a few bytes per id, and dense ones (a popular genre)
+# an eighth of a byte. AND, OR and counts work container by container with NumPy.
+
+ARRAY_MAX = 4096
+WORDS = 1024
+HIGH_SHIFT = 16
+LOW_MASK = 0xFFFF
+
+_POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+_ONE = np.uint64(1)
+
+
+def _is_bitmap(container):
+    return container.dtype == np.uint64
+
+
+def _cardinality(container):
+    if _is_bitmap(container):
+        return int(_POPCOUNT[container.view(np.uint8)].sum(dtype=np.int64))
+    return len(container)
+
+
+def _words(lows):
+    words = np.zeros(WORDS, dtype=np.uint64)
+    np.bitwise_or.at(words, lows >> 6, _ONE << (lows & 63).astype(np.uint64))
+    return words
+
+
+def _lows(words):
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder='little')).astype(np.uint16)
+
+
+# Function: The container of sorted, unique low values, in its smallest form (None when empty)
+def _container(lows):
+    if len(lows) == 0:
+        return None
+    if len(lows) <= ARRAY_MAX:
+        return lows
+    return _words(lows)
+
+
+# Function: Container of words, turned back into an array when it got sparse (None when empty)
+def _shrink(words):
+    count = _cardinality(words)
+    if count == 0:
+        return None
+    return _lows(words) if count <= ARRAY_MAX else words
+
+
+def _test(words, lows):
+    return ((words[lows >> 6] >> (lows & 63).astype(np.uint64)) & _ONE).astype(bool)
+
+
+def _and(first, second):
+    if _is_bitmap(first) and _is_bitmap(second):
+        return _shrink(first & second)
+    if _is_bitmap(first):
+        first, second = second, first
+    if _is_bitmap(second):
+        return _container(first[_test(second, first)])
+    return _container(np.intersect1d(first, second, assume_unique=True))
+
+
+def _or(first, second):
+    if _is_bitmap(first) and _is_bitmap(second):
+        return first | second
+    if _is_bitmap(first):
+        first, second = second, first
+    if _is_bitmap(second):
+        words = second.copy()
+        np.bitwise_or.at(words, first >> 6, _ONE << (first & 63).astype(np.uint64))
+        return words
+    return _container(np.union1d(first, second))
+
+
+class Bitmap:
+    __slots__ = ('containers',)
+
+    def __init__(self, containers=None):
+        self.containers = containers if containers is not None else {}     # high bits: container
+
+    # Function: Bitmap of song_ids (any order, duplicates allowed)
+    @classmethod
+    def from_ids(cls, ids):
+        ids = np.unique(np.asarray(ids, dtype=np.uint32))
+        containers = {}
+        if len(ids):
+            highs = ids >> HIGH_SHIFT
+            for chunk in np.split(ids, np.flatnonzero(np.diff(highs)) + 1):
+                containers[int(chunk[0] >> HIGH_SHIFT)] = _container((chunk & LOW_MASK).astype(np.uint16))
+        return cls(containers)
+
+    # Function: OR of many bitmaps
+    @classmethod
+    def union(cls, bitmaps):
+        result = cls()
+        for bitmap in bitmaps:
+            result = result | bitmap
+        return result
+
+    def __len__(self):
+        return sum(_cardinality(container) for container in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    def __contains__(self, song_id):
+        container = self.containers.get(song_id >> HIGH_SHIFT)
+        if container is None:
+            return False
+        low = song_id & LOW_MASK
+        if _is_bitmap(container):
+            return bool((int(container[low >> 6]) >> (low & 63)) & 1)
+        position = np.searchsorted(container, low)
+        return position < len(container) and container[position] == low
+
+    def __and__(self, other):
+        if len(other.containers) < len(self.containers):
+            self, other = other, self
+        containers = {}
+        for high, container in self.containers.items():
+            if high in other.containers:
+                result = _and(container, other.containers[high])
+                if result is not None:
+                    containers[high] = result
+        return Bitmap(containers)
+
+    def __or__(self, other):
+        containers = dict(self.containers)
+        for high, container in other.containers.items():
+            containers[high] = _or(containers[high], container) if high in containers else container
+        return Bitmap(containers)
+
+    def add(self, song_id):
+        high, low = song_id >> HIGH_SHIFT, song_id & LOW_MASK
+        container = self.containers.get(high)
+        if container is None:
+            self.containers[high] = np.array([low], dtype=np.uint16)
+        elif _is_bitmap(container):
+            container[low >> 6] |= _ONE << np.uint64(low & 63)
+        else:
+            position = np.searchsorted(container, low)
+            if position == len(container) or container[position] != low:
+                self.containers[high] = _container(np.insert(container, position, np.uint16(low)))
+
+    def discard(self, song_id):
+        high, low = song_id >> HIGH_SHIFT, song_id & LOW_MASK
+        container = self.containers.get(high)
+        if container is None:
+            return
+        if _is_bitmap(container):
+            container[low >> 6] &= ~(_ONE << np.uint64(low & 63))
+            result = _shrink(container)
+        else:
+            result = container[container != low]
+            result = result if len(result) else None
+        if result is None:
+            del self.containers[high]
+        else:
+            self.containers[high] = result
+
+    # Function: The song_ids, sorted (uint32)
+    def to_array(self):
+        if not self.containers:
+            return np.empty(0, dtype=np.uint32)
+        return np.concatenate([(np.uint32(high) << HIGH_SHIFT) | self._lows(high).astype(np.uint32)
+                               for high in sorted(self.containers)])
+
+    # Function: The largest song_ids below "before" (all of them when None), at most "limit", descending
+    def last(self, limit, before=None):
+        ids = []
+        for high in sorted(self.containers, reverse=True):
+            if before is not None and (high << HIGH_SHIFT) >= before:
+                continue
+            lows = self._lows(high).astype(np.int64) + (high << HIGH_SHIFT)
+            if before is not None:
+                lows = lows[lows < before]
+            ids.extend(lows[::-1][:limit - len(ids)].tolist())
+            if len(ids) >= limit:
+                break
+        return ids
+
+    def _lows(self, high):
+        container = self.containers[high]
+        return _lows(container) if _is_bitmap(container) else container
+
+    # Function: Memory used by the containers, in bytes
+    def nbytes(self):
+        return sum(container.nbytes for container in self.containers.values())
@@ -0,0 +1,61 @@
+from importlib import import_module
+import logging
+from flask import Flask, has_request_context, request
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Blueprints
+# The routes are split by area. Only the blueprints listed in the CASSETTE_BLUEPRINTS setting
+# are imported and registered, so e.g. a streaming-only node can run with "playback,api"
+# and never load the admin, creator or settings code.
+
+BLUEPRINTS = {
+    'auth': 'application.blueprints.auth',
+    'catalog': 'application.blueprints.catalog',
+    'playback': 'application.blueprints.playback',
+    'creator': 'application.blueprints.creator',
+    'admin': 'application.blueprints.admin',
+    'api': 'application.blueprints.api',
+}
+
+
+# Function: Blueprint names from a setting like "playback,api" (empty or "all" means every blueprint)
+def enabled_blueprints(setting):
+    if not setting or setting == 'all':
+        return list(BLUEPRINTS)
+    names = [name.strip() for name in setting.split(',') if name.strip()]
+    unknown = [name for name in names if name not in BLUEPRINTS]
+    if unknown:
+        raise ValueError(f"Unknown blueprints: {', '.join(unknown)} (known: {', '.join(BLUEPRINTS)})")
+    return names
+
+
+def register_blueprints(app):
+    for name in enabled_blueprints(app.config.get('CASSETTE_BLUEPRINTS')):
+        app.register_blueprint(import_module(BLUEPRINTS[name]).bp)
+    app.url_build_error_handlers.append(_disabled_blueprint_urls(app))
+
+
+# Function: url_for() for the routes of blueprints that are not loaded on this node
+# (e.g. a streaming node redirecting to the user dashboard). The blueprint is imported once, only
+# to build its URLs, and its routes are still not served here: the proxy sends them to another node.
+def _disabled_blueprint_urls(app):
+    url_maps = {}
+
+    def build_url(error, endpoint, values):
+        name = endpoint.partition('.')[0]
+        if name not in BLUEPRINTS or name in app.blueprints:
+            raise error
+        if name not in url_maps:
+            logger.info("Building URLs of the %s blueprint, which is not loaded on this node", name)
+            url_app = Flask(app.import_name, root_path=app.root_path)
+            url_app.register_blueprint(import_module(BLUEPRINTS[name]).bp)
+            url_maps[name] = url_app.url_map
+        # url_for() passes its own options (_anchor, _external, ...) along with the route values
+        route_values = {key: value for key, value in values.items() if not key.startswith('_')}
+        script_name = request.script_root if has_request_context() else ''
+        url = url_maps[name].bind('', script_name=script_name or '/').build(endpoint, route_values)
+        return url + f"#{values['_anchor']}" if values.get('_anchor') else url
+
+    return build_url
@@ -0,0 +1,189 @@
+import logging
+from flask import Blueprint, render_template, redirect, url_for, flash
+from flask_login import login_required, current_user
+from application.database import db
+from application.models import Users, Songs, Albums, AlbumSong, Playlists, PlaylistSong, Queue, Ratings
+from application.stats import admin_stats
+from application import trending
+from application.uploads import delete_songs
+from sqlalchemy import select
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------ Admin blueprint
+# Admin dashboard, user management and flagging of songs/albums
+bp = Blueprint('admin', __name__)
+
+
+# -------------------------------------Route to handle Admin Dashboard functionality
+@bp.route('/admin_dashboard', methods=['GET', 'POST'])
+@login_required
+def admin_dashboard():
+    user = db.get_or_404(Users, current_user.user_id)
+
+    # Counts and listen counts, from the maintained counters (see application/stats.py)
+    stats = admin_stats()
+    # Most played songs of the last days, from the maintained scores (see application/trending.py)
+    trending_songs = trending.top_songs(10)
+
+    return render_template('admin_dashboard.html',
+                           current_user_level=0,
+                           user=user,
+                           trending_songs=trending_songs,
+                           **stats)
+
+
+# -------------------------------------Route to list all the users
+@bp.route('/admin_dashboard/all_users', methods=['GET', 'POST'])
+@login_required
+def all_users():
+    user = db.get_or_404(Users, current_user.user_id)
+    users = db.session.query(Users)
+    return render_template('all_users.html',
+                           user=user,
+                           users=users,
+                           current_user_level=current_user.role)
+
+
+# -------------------------------------Route to Flag a song
+@bp.route('/flag_song/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def flag_song(song_id):
+    song_to_flag = Songs.query.filter_by(song_id=song_id).first()
+    song_name = song_to_flag.title
+    # If statement, to remove flag from a song
+    if song_to_flag.flagged:
+        try:
+            song_to_flag.flagged = False
+            db.session.commit()
+
+        except Exception as error:
+            db.session.rollback()
+            flash(f"Error removing flag from song: {error}")
+        finally:
+            db.session.close()
+            flash(f"Removed flag from Song '{song_name}' successfully!")
+        return redirect(url_for('catalog.all_songs'))
+
+    # Else block, to remove Flag from a song
+    else:
+        try:
+            song_to_flag.flagged = True
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            flash(f"Error flagging song: {error}")
+        finally:
+            db.session.close()
+            flash(f"Song '{song_name}' flagged successfully!")
+        return redirect(url_for('catalog.all_songs'))
+
+
+# -------------------------------------Route to Flag a song
+@bp.route('/flag_album/<int:album_id>', methods=['GET', 'POST'])
+@login_required
+def flag_album(album_id):
+    album_to_flag = Albums.query.filter_by(album_id=album_id).first()
+    album_name = album_to_flag.title
+    # If statement, to remove flag from a song
+    if album_to_flag.flagged:
+        try:
+            album_to_flag.flagged = False
+            db.session.commit()
+
+        except Exception as error:
+            db.session.rollback()
+            flash(f"Error removing flag from album: {error}")
+        finally:
+            db.session.close()
+            flash(f"Removed flag from Song '{album_name}' successfully!")
+        return redirect(url_for('catalog.all_albums'))
+
+    # Else block, to remove Flag from an album
+    else:
+        try:
+            album_to_flag.flagged = True
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            flash(f"Error flagging album: {error}")
+        finally:
+            db.session.close()
+            flash(f"Album '{album_name}' flagged successfully!")
+        return redirect(url_for('catalog.all_albums'))
+
+
+# -------------------------------------Route for deleting a user (Through Admins access)
+@bp.route('/admin_dashboard/all_users/delete_user/<int:user_id>', methods=['GET', 'POST'])
+def delete_user(user_id):
+
+    # To stop the Admin from self-destruction
+    if user_id != current_user.user_id:
+
+        try:
+            user_to_delete = Users.query.filter_by(user_id=user_id).first()
+
+            # Delete related entries from other tables
+            playlist_ids = select(Playlists.playlist_id).where(Playlists.user_id == user_id)
+            PlaylistSong.query.filter(PlaylistSong.playlist_id.in_(playlist_ids)).delete(synchronize_session=False)
+            Playlists.query.filter_by(user_id=user_id).delete()
+            Queue.query.filter_by(user_id=user_id).delete()
+            Ratings.query.filter_by(user_id=user_id).delete()
+
+            # Delete the user's songs (and the songs of the user's albums), with their related entries
+            album_song_ids = select(AlbumSong.song_id).join(Albums, AlbumSong.album_id == Albums.album_id) \
+                .where(Albums.user_id == user_id)
+            delete_songs(song_id for (song_id,) in db.session.query(Songs.song_id)
+                         .filter((Songs.user_id == user_id) | Songs.song_id.in_(album_song_ids)))
+            for album in Albums.query.filter_by(user_id=user_id).all():
+                db.session.delete(album)
+
+            # Delete the user
+            db.session.delete(user_to_delete)
+            db.session.commit()
+            logger.info("User, related data, songs, and albums deleted successfully")
+        except Exception as error:
+            db.session.rollback()
+            logger.exception("Error deleting user: %s", error)
+        finally:
+            db.session.close()
+        return redirect(url_for('admin.all_users'))
+
+    else:
+        flash("You cannot delete our own credentials!")
+
+
+# -------------------------------------Route to blacklist a user
+@bp.route('/admin_dashboard/all_users/blacklist_user/<int:user_id>', methods=['GET', 'POST'])
+@login_required
+def blacklist_user(user_id):
+    user_to_blacklist = Users.query.filter_by(user_id=user_id).first()
+    user_name = user_to_blacklist.name
+    # If statement, to whitelist a user
+    if user_to_blacklist.blacklist:
+        try:
+            user_to_blacklist.blacklist = False
+            db.session.commit()
+
+        except Exception as error:
+            db.session.rollback()
+            flash(f"Error whitelisting user: {error}")
+        finally:
+            db.session.close()
+            flash(f"User '{user_name}' whitelisted successfully!")
+        return redirect(url_for('admin.all_users'))
+
+    # Else block, to blacklist a user
+    else:
+        try:
+            user_to_blacklist.blacklist = True
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            flash(f"Error blacklisting user: {error}")
+        finally:
+            db.session.close()
+            flash(f"User '{user_name}' blacklisted successfully!")
+        return redirect(url_for('admin.all_users'))
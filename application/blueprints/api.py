@@ -0,0 +1,23 @@
+from flask import Blueprint
+from flask_restful import Api
+from application.api import IndexAPI, APILogin, SongsAPI, SongLyricsAPI, GenresAPI, BrowseAPI, TrendingAPI, \
+    PlaylistsAPI, AdminGraphsAPI, CreatorGraphsAPI, AdminPerformanceAPI, AdminProfileAPI
+
+
+# ------------------------------ REST API blueprint
+# The resources live in application/api.py
+bp = Blueprint('api', __name__)
+
+api = Api(bp)
+api.add_resource(IndexAPI, '/api')
+api.add_resource(APILogin, '/api/login')
+api.add_resource(SongsAPI, '/api/songs', '/api/songs/<int:song_id>')
+api.add_resource(SongLyricsAPI, '/api/songs/<int:song_id>/lyrics')
+api.add_resource(GenresAPI, '/api/genres')
+api.add_resource(BrowseAPI, '/api/browse')
+api.add_resource(TrendingAPI, '/api/trending')
+api.add_resource(PlaylistsAPI, '/api/playlists', '/api/playlists/<int:playlist_id>')
+api.add_resource(AdminGraphsAPI, '/api/admin/graphs')
+api.add_resource(CreatorGraphsAPI, '/api/creator/graphs')
+api.add_resource(AdminPerformanceAPI, '/api/admin/performance')
+api.add_resource(AdminProfileAPI, '/api/admin/profile')
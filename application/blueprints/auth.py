@@ -0,0 +1,270 @@
+import logging
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_user, login_required, logout_user, current_user
+from werkzeug.security import generate_password_hash, check_password_hash
+from application.database import db
+from application.models import Users
+from application import identity, play_queue
+from application.http_cache import conditional_page
+from datetime import datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------ Auth blueprint
+# Landing page, registration, login/logout, profiles and account settings
+bp = Blueprint('auth', __name__)
+
+
+# Route for the Index page
+@bp.route('/')
+def index():
+    return render_template("index.html")
+
+
+# -------------------------------------Route for New User Registration page
+@bp.route('/user_registration', methods=['GET', 'POST'])
+def user_registration():
+    if request.method == 'POST':
+        name = request.form['name']
+        email = request.form['email']
+        password = request.form['password']
+
+        if "@" in email:
+            pass
+        else:
+            error = "Enter a valid email!"
+            flash("Enter a valid email!")
+            return render_template("user_registration.html", error=error)
+
+        existing_user = Users.query.filter_by(email=email).first()
+        if existing_user:
+
+            # Admin login
+            if existing_user.role == 0:
+                login_user(existing_user)
+                # Redirect to admin dashboard or admin-specific page
+                return redirect(url_for('admin.admin_dashboard'))
+
+            # User login
+            elif existing_user.role == 1 or existing_user.role == 2:
+                # Redirect to normal user dashboard or user-specific page
+                login_user(existing_user)
+                return redirect(url_for('catalog.user_dashboard'))
+        else:
+            hashed_password = generate_password_hash(password)
+            try:
+                new_user = Users(name=name,
+                                 email=email,
+                                 password=hashed_password,
+                                 created_at=datetime.now(),
+                                 role=1,
+                                 dark_mode=False)
+                db.session.add(new_user)
+                db.session.commit()
+                flash('Account created successfully', category='success')
+                user = Users.query.filter_by(email=email).first()
+                login_user(user)
+                return redirect(url_for('catalog.user_dashboard'))
+            except Exception as error:
+                db.session.rollback()
+                flash('Error creating account. Please try again.', category='error')
+                logger.exception(error)
+            finally:
+                db.session.close()
+    return render_template("user_registration.html")
+
+
+# -------------------------------------Route for Login page
+@bp.route('/admin_login', methods=['GET', 'POST'])
+def admin_login():
+    error = None
+    endpoint_title = "admin_login"
+
+    if request.method == 'POST':
+        email = request.form['email']
+        password = request.form['password']
+        user = Users.query.filter_by(email=email).first()
+
+        if "@" in email:
+            pass
+        else:
+            error = "Enter a valid email!"
+            return render_template("login.html", error=error)
+
+        if user and check_password_hash(user.password, password):
+
+            # Admin login
+            if user.role == 0:
+                login_user(user)
+                # Redirect to admin dashboard or admin-specific page
+                flash('You were successfully logged in as an Admin!')
+                return redirect(url_for('admin.admin_dashboard'))
+
+            # User login
+            elif user.role == 1 or user.role == 2:
+                # Redirect to User Login Page
+                flash('Log in as a Standard User!')
+                return redirect(url_for('auth.login'))
+        else:
+            error = 'Invalid credentials'
+            logger.info(error)
+    return render_template('admin_login.html', endpoint_title=endpoint_title)
+
+
+# -------------------------------------Route for Login page
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    error = None
+    endpoint_title = "login"
+
+    if request.method == 'POST':
+        email = request.form['email']
+        password = request.form['password']
+        user = Users.query.filter_by(email=email).first()
+
+        if "@" in email:
+            pass
+        else:
+            error = "Enter a valid email!"
+            return render_template("login.html", error=error)
+
+        if user and check_password_hash(user.password, password):
+
+            if not user.blacklist:
+                # Admin login
+                if user.role == 0:
+                    # Redirect to admin dashboard or admin-specific page
+                    flash('Log in as an Admin!')
+                    return redirect(url_for('auth.admin_login'))
+
+                # User login
+                elif user.role == 1 or user.role == 2:
+                    # Redirect to normal user dashboard or user-specific page
+                    login_user(user)
+                    flash('You were successfully logged in as a Standard User!')
+                    return redirect(url_for('catalog.user_dashboard'))
+            else:
+                flash('You have been blacklisted! Contact the Admin.')
+                return redirect(url_for('auth.login'))
+        else:
+            error = 'Invalid credentials'
+            logger.info(error)
+    return render_template('login.html', endpoint_title=endpoint_title)
+
+
+# -------------------------------------Route for User account settings page
+@bp.route('/user_settings', methods=['GET'])
+@login_required
+def user_settings():
+    if current_user.role == 1:
+        user = db.get_or_404(Users, current_user.user_id)
+        return render_template('user_settings.html',
+                               current_user_level=1,
+                               user=user)
+    elif current_user.role == 2:
+        redirect(url_for('creator_settings.html'))
+    else:
+        redirect(url_for('auth.error_404'))
+
+
+# Route for user profile
+# Function: Validators of a profile page (users have no updated_at: the ETag covers what the page shows)
+def profile_validators(user_id):
+    selected_user = identity.get_user(user_id)
+    if selected_user is None:
+        return None, None
+    return None, (user_id, selected_user.name, selected_user.role, selected_user.profile_pic)
+
+
+@bp.route('/profile/<int:user_id>', methods=['GET', 'POST'])
+@login_required
+@conditional_page(profile_validators)
+def profile(user_id):
+    selected_user = db.get_or_404(Users, user_id)
+    user = db.get_or_404(Users, current_user.user_id)
+    return render_template('profile.html',
+                           selected_user=selected_user,
+                           user=user)
+
+
+# Route for uploading profile picture
+@bp.route('/profile_picture', methods=['GET', 'POST'])
+@login_required
+def profile_picture():
+    user = db.get_or_404(Users, current_user.user_id)
+
+    if request.method == 'POST':
+        try:
+            # Save the new profile picture into the profie_image folder
+            profile_image = request.files['profile_image']
+            profile_image_file_path = f'static/profile_pic/{user.name}.jpg'  # Unique path for cover file
+            profile_image.save(profile_image_file_path)
+
+            # Update the new profile picture into the user object
+            logout_user()
+            user.profile_pic = profile_image_file_path
+            db.session.commit()
+            flash("Login again. Profile picture updated!")
+        except Exception as error:
+            db.session.rollback()
+            flash('Error uploading the profile picture. Please try again.', category='error')
+            logger.exception(error)
+        finally:
+            db.session.close()
+
+        # Redirect to the user profile
+        return redirect(url_for('auth.login'))
+
+    return render_template('profile_picture.html',
+                           user=user)
+
+
+# -------------------------------------Route for Logout functionality
+@bp.route('/logout')
+@login_required
+def logout():
+
+    # Clear the queue list associated with the user
+    if current_user.is_authenticated:
+        try:
+            play_queue.clear(current_user.user_id)
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            flash('Error clearing the queue for the current user. Please try again.', category='error')
+            logger.exception(error)
+        finally:
+            db.session.close()
+
+    logout_user()
+    flash('Logged out successfully', category='success')
+    return redirect(url_for('auth.login'))
+
+
+# -------------------------------------Toggle Dark/Light Mode
+# @bp.route('/toggle_dark_mode/<str:current_route>', methods=['GET', 'POST'])
+@bp.route('/toggle_dark_mode', methods=['GET', 'POST'])
+def toggle_dark_mode():
+    if current_user.dark_mode == False:
+        current_user.dark_mode = True
+        # Write the logic for SQLAlchemy to change the detail for dark_mode
+    else:
+        current_user.dark_mode = False
+    return redirect(url_for('catalog.user_dashboard'))
+
+
+# -------------------------------------Route to test if the trigger mechanism is working
+@bp.route('/trigger_flash')
+def trigger_flash():
+    flash('This is a test flash message!', 'info')  # Flash a test message
+    return redirect(url_for('auth.index'))
+
+
+# -------------------------------------Route for error code: 404
+@bp.route('/404')
+def error_404():
+    user = db.get_or_404(Users, current_user.user_id)
+    return render_template('404.html',
+                           user=user)
@@ -0,0 +1,674 @@
+import logging
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from application.database import db
+from application.models import Users, Genres, Songs, Albums, AlbumSong, Playlists, PlaylistSong, Ratings
+from application import catalog_snapshot, play_queue, trending
+from application.cache import SharedCache
+from application.http_cache import conditional_page
+from application.playback import to_minute_seconds
+from datetime import datetime
+from sqlalchemy import func, select
+import math
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------ Catalog blueprint
+# User dashboard, browsing songs/albums/playlists, playlists and ratings
+bp = Blueprint('catalog', __name__)
+
+# Songs on the "Trending now" shelf of the user dashboard
+TRENDING_SHELF_SIZE = 10
+# Ids of the search results (when there is no snapshot) and of the songs by rating, in the shared
+# cache (see application/cache.py), dropped by any change to the catalog or the ratings
+RESULTS_CACHE_SECONDS = 300
+IN_CHUNK = 500
+
+results_cache = SharedCache('search', maxsize=256, ttl=RESULTS_CACHE_SECONDS)
+
+
+# ------------------------------ Listings and search
+# Read from the catalog snapshot shared by the workers when it is up to date (see
+# application/catalog_snapshot.py), from the database otherwise. The rows have the same attributes.
+# The ids of the database search results are cached, the rows are then loaded by primary key.
+
+# Function: Rows of a model by id, in the order of the ids
+def _rows_by_id(model, ids):
+    key = model.__mapper__.primary_key[0]
+    rows = {}
+    for start in range(0, len(ids), IN_CHUNK):
+        for row in model.query.filter(key.in_(ids[start:start + IN_CHUNK])):
+            rows[getattr(row, key.key)] = row
+    return [rows[row_id] for row_id in ids if row_id in rows]
+
+
+# Function: Every song, read as the listing iterates
+def listed_songs():
+    snapshot = catalog_snapshot.get_snapshot()
+    return snapshot.all_songs() if snapshot is not None else db.session.query(Songs)
+
+
+# Function: Every album, with its creator (album.user)
+def listed_albums():
+    snapshot = catalog_snapshot.get_snapshot()
+    if snapshot is None:
+        return db.session.query(Albums)
+    albums = list(snapshot.all_albums())
+    creator_ids = {album.user_id for album in albums}
+    creators = {creator.user_id: creator
+                for creator in Users.query.filter(Users.user_id.in_(creator_ids))} if creator_ids else {}
+    for album in albums:
+        album.user = creators.get(album.user_id)
+    return albums
+
+
+# Function: Songs whose title, singer or genre contains the search query (case-insensitive)
+def search_songs(search_query):
+    snapshot = catalog_snapshot.get_snapshot()
+    if snapshot is not None:
+        return snapshot.search_songs(search_query)
+    song_ids = results_cache.get_or_set(('songs', search_query), lambda: db.session.execute(
+        select(Songs.song_id).where(
+            Songs.title.ilike(f'%{search_query}%') |
+            Songs.singer.ilike(f'%{search_query}%') |
+            Songs.genre_id.in_(select(Genres.genre_id).where(Genres.name.ilike(f'%{search_query}%'))))
+    ).scalars().all(), tags=('catalog',))
+    return _rows_by_id(Songs, song_ids)
+
+
+# Function: Albums whose title contains the search query (case-insensitive)
+def search_albums(search_query):
+    snapshot = catalog_snapshot.get_snapshot()
+    if snapshot is not None:
+        return snapshot.search_albums(search_query)
+    album_ids = results_cache.get_or_set(('albums', search_query), lambda: db.session.execute(
+        select(Albums.album_id).where(Albums.title.ilike(f'%{search_query}%'))
+    ).scalars().all(), tags=('catalog',))
+    return _rows_by_id(Albums, album_ids)
+
+
+# Function: (song, average rating) of the rated songs, best first
+def songs_by_rating():
+    ranking = results_cache.get_or_set('by_rating', lambda: [tuple(row) for row in db.session.execute(
+        select(Ratings.song_id, func.avg(Ratings.rating))
+        .group_by(Ratings.song_id)
+        .order_by(func.avg(Ratings.rating).desc())
+    )], tags=('catalog', 'ratings'))
+    songs = {song.song_id: song for song in _rows_by_id(Songs, [song_id for song_id, _ in ranking])}
+    return [(songs[song_id], avg_rating) for song_id, avg_rating in ranking if song_id in songs]
+
+
+# -------------------------------------Route to handle the User Dashboard functionality
+@bp.route('/user_dashboard', methods=['GET', 'POST'])
+@login_required
+def user_dashboard():
+    user = db.get_or_404(Users, current_user.user_id)
+    songs = listed_songs()
+    playlists = Playlists.query.filter_by(user_id=current_user.user_id)
+    queue = play_queue.LazyItems(current_user.user_id)
+
+    # Sorted Songs by average Rating
+    # The "Recommended Songs" section inside the else-block in Search Results
+    # isn't taking this as an input
+    sorted_songs = songs_by_rating()
+
+    # "Trending now" shelf, from the maintained scores (see application/trending.py)
+    trending_songs = trending.top_songs(TRENDING_SHELF_SIZE)
+
+    # Search Functionality
+    if request.method == 'GET':
+
+        # fetching the search_query
+        search_query = request.args.get('search_query', '').lower()
+
+        # Checking if the search query is empty
+        if len(search_query) == 0:
+            return render_template('user_dashboard.html',
+                                   current_user_level=1,
+                                   user=user,
+                                   songs=songs,
+                                   sorted_songs=sorted_songs,
+                                   trending_songs=trending_songs,
+                                   playlists=playlists,
+                                   queue=queue)
+        else:
+            pass
+
+        # Filtering songs from the Songs table from the database
+        filtered_songs = search_songs(search_query)
+
+        # Filtering albums from the Albums table from the database
+        filtered_albums = search_albums(search_query)
+
+        # Filtering by Artists(Creators)
+        filtered_creators = Users.query.filter(Users.name.ilike(f'%{search_query}%')).all()
+
+        # A boolean output, just to use in the logic in "for" loop for Search component in Jinja2
+        if len(filtered_songs) > 0:
+            filtered_songs_bool = True
+        else:
+            filtered_songs_bool = False
+
+        # A boolean output for no input in Search component in Jinja2
+        if search_query != "":
+            search_query_bool = True
+        else:
+            search_query_bool = False
+
+        return render_template('user_dashboard.html',
+                               current_user_level=1,
+                               search_query=search_query,
+                               search_query_bool=search_query_bool,
+                               filtered_songs=filtered_songs,
+                               filtered_songs_bool=filtered_songs_bool,
+                               user=user,
+                               songs=songs,
+                               playlists=playlists,
+                               queue=queue,
+                               sorted_songs=sorted_songs,
+                               trending_songs=trending_songs)
+
+    # Music Streaming functionality
+    if request.method == 'POST':
+        if 'stream' in request.form:
+            song_id = request.form.get('song_id')
+            song_to_stream = Songs.query.filter_by(song_id=song_id).first()
+            return render_template('user_dashboard.html',
+                                   current_user_level=1,
+                                   user=user,
+                                   songs=songs,
+                                   playlists=playlists,
+                                   queue=queue,
+                                   song_to_stream=song_to_stream,
+                                   song_to_stream_duration=to_minute_seconds(song_to_stream.duration),
+                                   sorted_songs=sorted_songs,
+                                   trending_songs=trending_songs)
+    else:
+        return render_template('user_dashboard.html',
+                               current_user_level=1,
+                               user=user,
+                               songs=songs,
+                               playlists=playlists,
+                               queue=queue,
+                               sorted_songs=sorted_songs,
+                               trending_songs=trending_songs)
+
+
+# -------------------------------------Route for viewing a song
+@bp.route('/view_song/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def view_song(song_id):
+    user = db.get_or_404(Users, current_user.user_id)
+    song = db.session.query(Songs).filter_by(song_id=song_id).first()
+    average_rating = db.session.query(func.avg(Ratings.rating)) \
+        .join(Songs, Ratings.song_id == Songs.song_id) \
+        .scalar()
+    if average_rating is not None:
+        rating = math.floor(average_rating)
+    else:
+        rating = 0
+
+    # Music Streaming functionality
+    if request.method == 'POST':
+        if 'stream' in request.form:
+            song_id = request.form.get('song_id')
+            song_to_stream = Songs.query.filter_by(song_id=song_id).first()
+            return render_template('view_song.html',
+                                   current_user_level=1,
+                                   user=user,
+                                   playlist=playlist,
+                                   song=song,
+                                   rating=rating,
+                                   song_to_stream=song_to_stream,
+                                   song_to_stream_duration=to_minute_seconds(song_to_stream.duration))
+
+    else:
+        return render_template('view_song.html',
+                               current_user_level=1,
+                               user=user,
+                               song=song,
+                               rating=rating,
+                               song_duration=to_minute_seconds(song.duration))
+
+
+# NEED TO IMPLEMENT THE RATING FUNCTION FOR ANY SONG IN THE "view_song" ROUTE
+
+
+# -------------------------------------Route for deleting a playlist
+@bp.route('/delete_playlist/<int:playlist_id>', methods=['GET', 'POST'])
+@login_required
+def delete_playlist(playlist_id):
+    playlist_to_delete = Playlists.query.filter_by(playlist_id=playlist_id).first()
+
+    # deleting from Admin account
+    if current_user.role == 0:
+        if playlist_to_delete:
+            # Delete the playlist from the database
+            try:
+                # Delete related entries first, from other models
+                PlaylistSong.query.filter_by(playlist_id=playlist_id).delete()
+                # Add other related deletions as necessary
+
+                # And then, delete the playlist
+                db.session.delete(playlist_to_delete)
+                db.session.commit()
+            except Exception as error:
+                db.session.rollback()
+                flash('Error deleting the playlist. Please try again.', category='error')
+                logger.exception(error)
+            finally:
+                db.session.close()
+                flash("Playlist is deleted from the database")
+                return redirect(url_for('admin.admin_dashboard'))
+        else:
+            flash("couldn't find any playlist with that playlist_id")
+        return redirect(url_for('admin.admin_dashboard'))
+    
+    # deleting from Standard User account
+    if current_user.role == 1:
+        if playlist_to_delete:
+            if playlist_to_delete.user_id == current_user.user_id:
+                # Delete the playlist from the database
+                try:
+                    # Delete related entries first, from other models
+                    PlaylistSong.query.filter_by(playlist_id=playlist_id).delete()
+                    # Add other related deletions as necessary
+
+                    # And then, delete the playlist
+                    db.session.delete(playlist_to_delete)
+                    db.session.commit()
+                except Exception as error:
+                    db.session.rollback()
+                    flash('Error deleting the playlist. Please try again.', category='error')
+                    logger.exception(error)
+                finally:
+                    db.session.close()
+                    flash("Playlist is deleted from the database.")
+                    return redirect(url_for('catalog.user_dashboard'))
+            else:
+                flash("You can only delete your own playlists!")
+            return redirect(url_for('catalog.user_dashboard'))
+        else:
+            flash("couldn't find any playlist with that playlist_id.")
+        return redirect(url_for('catalog.user_dashboard'))
+
+    # deleting from Creator account
+    elif current_user.role == 2:
+        if playlist_to_delete:
+            if current_user.user_id == playlist_to_delete.user_id:
+                # Delete the playlist from the database
+                try:
+                    # Delete related entries first, from other models
+                    PlaylistSong.query.filter_by(playlist_id=playlist_id).delete()
+                    # Add other related deletions as necessary
+
+                    # And then, delete the playlist
+                    db.session.delete(playlist_to_delete)
+                    db.session.commit()
+                    logger.info("Playlist is deleted from the database")
+                except Exception as error:
+                    db.session.rollback()
+                    flash('Error deleting the playlist. Please try again.', category='error')
+                    logger.exception(error)
+                finally:
+                    db.session.close()
+                    flash("Playlist is deleted from the database")
+                    return redirect(url_for('creator.creator_dashboard'))
+            else:
+                flash("You can only delete your own playlists!")
+            return redirect(url_for('creator.creator_dashboard'))
+        else:
+            flash("couldn't find any playlist with that playlist_id")
+        return redirect(url_for('creator.creator_dashboard'))
+
+    else:
+        return redirect(url_for('creator.my_playlists'))
+
+
+# -------------------------------------Route for viewing lyrics
+@bp.route('/view_lyrics/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def view_lyrics(song_id):
+    user = db.get_or_404(Users, current_user.user_id)
+    song = db.session.query(Songs).filter_by(song_id=song_id).first()
+    # The lyrics are only loaded here, line by line (with their start in ms for time-synced lyrics)
+    lyrics = song.lyrics_row if song else None
+    return render_template('view_lyrics.html',
+                           current_user_level=1,
+                           user=user,
+                           song=song,
+                           lyrics=lyrics,
+                           lyrics_lines=lyrics.lines() if lyrics else [])
+
+
+# -------------------------------------Route for creating a playlist
+@bp.route('/create_playlist', methods=['GET', 'POST'])
+@login_required
+def create_playlist():
+    user = db.get_or_404(Users, current_user.user_id)
+    if request.method == 'POST':
+        title = request.form['title']
+        access = request.form['access']
+        description = request.form['description']
+        existing_playlist = Playlists.query.filter_by(title=title).first()
+        if not existing_playlist:
+            try:
+                user_id = user.user_id
+                new_playlist = Playlists(user_id=user_id,
+                                         title=title,
+                                         description=description,
+                                         created_at=datetime.now(),
+                                         access=access)
+                db.session.add(new_playlist)
+                db.session.commit()
+            except Exception as error:
+                db.session.rollback()
+                flash('Error creating a new playlist. Please try again.', category='error')
+                logger.exception(error)
+            finally:
+                db.session.close()
+            return redirect(url_for('catalog.user_dashboard'))
+        else:
+            return redirect(url_for('catalog.user_dashboard'))
+    else:
+        return render_template('create_playlist.html',
+                               current_user_level=1,
+                               user=user)
+
+
+# -------------------------------------Route for creating a playlist
+@bp.route('/playlist/<int:playlist_id>', methods=['GET', 'POST'])
+@login_required
+def playlist(playlist_id):
+    user = db.get_or_404(Users, current_user.user_id)
+    playlist = Playlists.query.get_or_404(playlist_id)
+    playlist_songs = playlist.songs
+
+    # Music Streaming functionality
+    if request.method == 'POST':
+        if 'stream' in request.form:
+            song_id = request.form.get('song_id')
+            song_to_stream = Songs.query.filter_by(song_id=song_id).first()
+            return render_template('playlist.html',
+                                   current_user_level=1,
+                                   user=user,
+                                   playlist=playlist,
+                                   song_to_stream=song_to_stream,
+                                   playlist_songs=playlist_songs,
+                                   song_to_stream_duration=to_minute_seconds(song_to_stream.duration))
+
+    return render_template('playlist.html',
+                           current_user_level=1,
+                           user=user,
+                           playlist=playlist,
+                           playlist_songs=playlist_songs)
+
+
+# -------------------------------------Route for creating a playlist
+@bp.route('/add_to_playlist/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def add_to_playlist(song_id):
+    user = db.get_or_404(Users, current_user.user_id)
+    playlists = db.session.query(Playlists).filter_by(user_id=current_user.user_id).all()
+    return render_template('add_to_playlist.html',
+                           current_user_level=1,
+                           user=user,
+                           song_id=song_id,
+                           playlists=playlists)
+
+
+# -------------------------------------Route for creating a playlist
+@bp.route('/add_to_playlist_song/<int:playlist_id>/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def add_to_playlist_song(playlist_id, song_id):
+    try:
+        new_playlist_song = PlaylistSong(playlist_id=playlist_id,
+                                         song_id=song_id)
+        db.session.add(new_playlist_song)
+        db.session.commit()
+    except Exception as error:
+        db.session.rollback()
+        flash('Error creating a new PlaylistSong item. Please try again.', category='error')
+        logger.exception(error)
+    finally:
+        db.session.close()
+        # Redirecting to playlist endpoint, to display the current playlist
+        return redirect(url_for('catalog.playlist', playlist_id=playlist_id))
+
+
+# -------------------------------------Route for creating a playlist
+# Function: Validators of the album page: the album, its songs, and whether the user has albums
+def album_validators(album_id):
+    album_changed = db.session.query(Albums.updated_at).filter_by(album_id=album_id).scalar()
+    songs_changed, songs_count, last_album_song = (
+        db.session.query(func.max(Songs.updated_at), func.count(AlbumSong.id), func.max(AlbumSong.id))
+        .select_from(AlbumSong)
+        .join(Songs, Songs.song_id == AlbumSong.song_id)
+        .filter(AlbumSong.album_id == album_id)
+        .one()
+    )
+    has_albums = db.session.query(Albums.query.filter_by(user_id=current_user.user_id).exists()).scalar()
+    last_modified = max(filter(None, (album_changed, songs_changed)), default=None)
+    return last_modified, (album_id, album_changed, songs_count, last_album_song, has_albums)
+
+
+@bp.route('/album/<int:album_id>', methods=['GET', 'POST'])
+@login_required
+@conditional_page(album_validators)
+def album(album_id):
+    user = db.get_or_404(Users, current_user.user_id)
+    album = Albums.query.get_or_404(album_id)
+    album_songs = album.songs
+
+    # Music Streaming functionality
+    if request.method == 'POST':
+        if 'stream' in request.form:
+            song_id = request.form.get('song_id')
+            song_to_stream = Songs.query.filter_by(song_id=song_id).first()
+            return render_template('album.html',
+                                   current_user_level=current_user.role,
+                                   user=user,
+                                   album=album,
+                                   album_songs=album_songs,
+                                   song_to_stream=song_to_stream,
+                                   song_to_stream_duration=to_minute_seconds(song_to_stream.duration))
+
+    # current_album = Albums.query.filter_by(album_id=album_id).first()
+    # songs = ""
+    # if current_album:
+    #     songs = current_album.songs
+
+    if Albums.query.filter_by(user_id=current_user.user_id).first():
+
+        return render_template('album.html',
+                               current_user_level=2,
+                               user=user,
+                               album=album,
+                               album_songs=album_songs)
+    else:
+        return render_template('album.html',
+                               current_user_level=1,
+                               user=user,
+                               album=album,
+                               album_songs=album_songs)
+
+
+# -------------------------------------Route to handle the User Dashboard functionality
+@bp.route('/all_songs', methods=['GET', 'POST'])
+@login_required
+def all_songs():
+    user = db.get_or_404(Users, current_user.user_id)
+    songs = listed_songs()
+
+    if current_user.role == 0:
+
+        # Search Functionality
+        if request.method == 'GET':
+
+            # fetching the search_query
+            search_query = request.args.get('search_query', '').lower()
+
+            # Checking if the search query is empty
+            if len(search_query) == 0:
+                return render_template('all_songs.html',
+                                       current_user_level=1,
+                                       user=user,
+                                       songs=songs)
+            else:
+                pass
+
+            # Filtering songs from the Songs table from the database
+            filtered_songs = search_songs(search_query)
+
+            # A boolean output, just to use in the logic in "for" loop for Search component in Jinja2
+            if len(filtered_songs) > 0:
+                filtered_songs_bool = True
+            else:
+                filtered_songs_bool = False
+
+            # A boolean output for no input in Search component in Jinja2
+            if search_query != "":
+                search_query_bool = True
+            else:
+                search_query_bool = False
+
+            return render_template('all_songs.html',
+                                   current_user_level=0,
+                                   search_query=search_query,
+                                   search_query_bool=search_query_bool,
+                                   filtered_songs=filtered_songs,
+                                   filtered_songs_bool=filtered_songs_bool,
+                                   user=user,
+                                   songs=songs)
+        else:
+            return render_template('all_songs.html',
+                                   current_user_level=0,
+                                   user=user,
+                                   songs=songs)
+    else:
+        # Search Functionality
+        if request.method == 'GET':
+
+            # fetching the search_query
+            search_query = request.args.get('search_query', '').lower()
+
+            # Checking if the search query is empty
+            if len(search_query) == 0:
+                return render_template('all_songs.html',
+                                       current_user_level=1,
+                                       user=user,
+                                       songs=songs)
+            else:
+                pass
+
+            # Filtering songs from the Songs table from the database
+            filtered_songs = search_songs(search_query)
+
+            # A boolean output, just to use in the logic in "for" loop for Search component in Jinja2
+            if len(filtered_songs) > 0:
+                filtered_songs_bool = True
+            else:
+                filtered_songs_bool = False
+
+            # A boolean output for no input in Search component in Jinja2
+            if search_query != "":
+                search_query_bool = True
+            else:
+                search_query_bool = False
+
+            return render_template('all_songs.html',
+                                   current_user_level=1,
+                                   search_query=search_query,
+                                   search_query_bool=search_query_bool,
+                                   filtered_songs=filtered_songs,
+                                   filtered_songs_bool=filtered_songs_bool,
+                                   user=user,
+                                   songs=songs)
+
+        else:
+            return render_template('all_songs.html',
+                                   current_user_level=1,
+                                   user=user,
+                                   songs=songs)
+
+
+# -------------------------------------Route to handle the User Dashboard functionality
+# Function: Validators of the list pages: the last change and the number of rows of a table
+def table_validators(model):
+    def validators():
+        last_modified, count = db.session.query(func.max(model.updated_at), func.count()).select_from(model).one()
+        return last_modified, (count,)
+    return validators
+
+
+@bp.route('/all_albums', methods=['GET', 'POST'])
+@login_required
+@conditional_page(table_validators(Albums))
+def all_albums():
+    user = db.get_or_404(Users, current_user.user_id)
+    albums = listed_albums()
+    return render_template('all_albums.html',
+                           current_user_level=1,
+                           user=user,
+                           albums=albums)
+
+
+# -------------------------------------Route to handle the User Dashboard functionality
+@bp.route('/all_playlists', methods=['GET', 'POST'])
+@login_required
+@conditional_page(table_validators(Playlists))
+def all_playlists():
+    user = db.get_or_404(Users, current_user.user_id)
+    playlists = db.session.query(Playlists)
+
+    return render_template('all_playlists.html',
+                           current_user_level=1,
+                           user=user,
+                           playlists=playlists)
+
+
+# -------------------------------------Route for browsing the songs by genre, year, creator and rating
+@bp.route('/browse', methods=['GET'])
+@login_required
+def browse():
+    from application import facets  # numpy, only loaded by the workers that use it
+    user = db.get_or_404(Users, current_user.user_id)
+    filters = facets.filters_from_args(request.args)
+    song_ids, total, counts, next_cursor = facets.browse(filters, before=request.args.get('before', type=int))
+    songs = {song.song_id: song for song in Songs.query.filter(Songs.song_id.in_(song_ids))} if song_ids else {}
+    return render_template('browse.html',
+                           current_user_level=1,
+                           user=user,
+                           filters=filters,
+                           counts=counts,
+                           labels=facets.labels(counts),
+                           songs=[songs[song_id] for song_id in song_ids if song_id in songs],
+                           total=total,
+                           next_cursor=next_cursor)
+
+
+# -------------------------------------Route to handle Ratings of songs
+@bp.route('/rate/<int:song_id>/<int:rating>', methods=['GET', 'POST'])
+@login_required
+def rate(song_id, rating):
+    user = db.get_or_404(Users, current_user.user_id)
+
+    # if rating in [0, 1, 3, 4, 5]:
+    if 0 <= rating <= 5:
+        try:
+            new_rating = Ratings(rating=rating,
+                                 user_id=user.user_id,
+                                 song_id=song_id)
+            db.session.add(new_rating)
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            flash('Error giving ratings to a song. Please try again.', category='error')
+            logger.exception(error)
+        finally:
+            db.session.close()
+        return redirect(url_for('catalog.view_song', song_id=song_id))
+    else:
+        return redirect(url_for('auth.error_404'))
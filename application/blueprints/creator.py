@@ -0,0 +1,473 @@
+import logging
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from application.database import db
+from application.models import Users, Songs, Albums, AlbumSong, Playlists
+from application.stats import creator_stats
+from application.playback import to_minute_seconds, make_cover_variants
+from application import jobs
+from application.uploads import AUDIO_DIR, COVERS_DIR, delete_songs, save_song, store_upload, stored_hash
+from mutagen.mp3 import MP3
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------ Creator blueprint
+# Creator registration and dashboard, uploading/editing songs and managing albums
+bp = Blueprint('creator', __name__)
+
+
+# -------------------------------------Route for Creator registration
+@bp.route('/creator_registration', methods=['GET', 'POST'])
+@login_required
+def creator_registration():
+    user = db.get_or_404(Users, current_user.user_id)
+
+    return render_template('creator_registration.html',
+                           current_user_level=1,
+                           user=user)
+
+
+# -------------------------------------Route for Creator dashboard
+@bp.route('/creator_dashboard', methods=['GET', 'POST'])
+@login_required
+def creator_dashboard():
+    endpoint_title = "Creator Dashboard"
+    # If Normal User account detected, redirect to the creator registration page
+    if current_user.role == 1:
+        return redirect(url_for('creator.creator_registration'))
+    else:
+        user = db.get_or_404(Users, current_user.user_id)
+        # Counts, average rating and the plays of the creator's songs, from the maintained
+        # counters (see application/stats.py)
+        stats = creator_stats(current_user.user_id)
+
+        return render_template('creator_dashboard.html',
+                               current_user_level=2,
+                               endpoint_title=endpoint_title,
+                               user=user,
+                               **stats)
+
+
+# -------------------------------------Route for User role change to Creator role
+@bp.route('/update_role', methods=['GET', 'POST'])
+@login_required
+def update_current_user_role():
+    if current_user:
+        # Assuming the role 1 should be updated to 2
+        if current_user.role == 1:
+            try:
+                current_user.role = 2  # Change the user's role from 1 to 2
+                db.session.commit()
+            except Exception as error:
+                db.session.rollback()
+                flash('Error updating role of the selected account. Please try again.', category='error')
+                logger.exception(error)
+            finally:
+                db.session.close()
+            return redirect(url_for('creator.upload_song'))
+        else:
+            return redirect(url_for('creator.creator_dashboard'))
+    return "User not found"
+
+
+# -------------------------------------Route for Welcoming page for new Creator accounts to upload their first song
+@bp.route('/upload_song', methods=['GET', 'POST'])
+@login_required
+def upload_song():
+    user = db.get_or_404(Users, current_user.user_id)
+
+    return render_template('upload_song.html',
+                           current_user_level=2,
+                           user=user)
+
+
+# -------------------------------------Route for uploading a song
+@bp.route('/upload_song_form', methods=['GET', 'POST'])
+@login_required
+def upload_song_form():
+    user = db.get_or_404(Users, current_user.user_id)
+
+    if request.method == 'POST' and user.role == 2:
+        try:
+            title = request.form['title']
+            save_song(current_app._get_current_object(), user.user_id, request.form, request.files)
+            flash("'" + title + "' has been successfully uploaded!")
+        except Exception as error:
+            db.session.rollback()
+            flash('Error uploading the new song. Please try again.', category='error')
+            logger.exception(error)
+        finally:
+            db.session.close()
+
+        # Redirect to the Creator Dashboard
+        return redirect(url_for('creator.creator_dashboard'))
+
+    return render_template('upload_song_form.html',
+                           current_user_level=2,
+                           user=user)
+
+
+# -------------------------------------Route for listing  a User's Songs
+@bp.route('/creator_dashboard/my_songs', methods=['GET', 'POST'])
+@login_required
+def my_songs():
+    user = db.get_or_404(Users, current_user.user_id)
+    songs = Songs.query.filter_by(user_id=current_user.user_id)
+
+    # Need to add functionality for that "Play" button beside playlist name
+
+    return render_template('my_songs.html',
+                           current_user_level=2,
+                           user=user,
+                           songs=songs)
+
+
+# -------------------------------------Route for editing songs
+@bp.route('/edit_song/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def edit_song(song_id):
+    user = db.get_or_404(Users, current_user.user_id)
+    song = db.session.query(Songs).filter_by(song_id=song_id).first()
+    
+    # Checking if the song exists
+    if song:
+        # Double-checking if that current user was also the uploader of that song
+        if current_user.role == 2 and user and song.user_id == current_user.user_id:
+            if request.method == 'POST':
+                try:
+                    # Update song details based on the form data
+                    song.title = request.form['title']
+                    song.singer = request.form['singer']
+                    song.genre = request.form['genre']
+                    song.release_date = request.form['release_date']
+                    song.lyrics = request.form['lyrics']
+
+                    # Update the music file if provided, stored like the uploads (see application/uploads.py)
+                    music_file = request.files.get('music_file')
+                    if music_file:
+                        song.file_path = store_upload(music_file, AUDIO_DIR, '.mp3')
+                        song.file_hash = stored_hash(song.file_path)
+                        # Update the duration of the song
+                        song.duration_ms = round(MP3(song.file_path).info.length * 1000)
+
+                    # Update the cover file if provided
+                    cover_file = request.files.get('cover_file')
+                    if cover_file:
+                        song.cover = store_upload(cover_file, COVERS_DIR, '.jpg')
+                        make_cover_variants(song.cover)
+
+                    # Commit the changes to the database
+                    db.session.commit()
+
+                    # A new file sounds different: extract its audio features again, in the background
+                    if music_file:
+                        from application import audio_features  # numpy, only loaded once a song is uploaded
+                        jobs.enqueue(current_app._get_current_object(), audio_features.store_song_features, song_id)
+                except Exception as error:
+                    db.session.rollback()
+                    flash('Error Editing the song. Please try again.', category='error')
+                    logger.exception(error)
+                finally:
+                    db.session.close()
+                    # Redirect to the Creator Dashboard
+                    return redirect(url_for('creator.my_songs'))
+                    # return redirect(url_for('catalog.view_song', song_id=song.song_id))
+
+            return render_template('edit_song.html',
+                                current_user_level=2,
+                                user=user,
+                                song=song)
+        else:
+            return redirect(url_for('catalog.view_song', song_id=song.song_id))
+    else:
+        # Handle the case where the song ID doesn't exist
+        # (e.g., show an error message)
+        pass
+
+
+# -------------------------------------Route for deleting a song
+@bp.route('/delete_song/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def delete_song(song_id):
+    song_to_delete = Songs.query.filter_by(song_id=song_id).first()
+    song_name = song_to_delete.title
+
+    # deleting from Admin account
+    if current_user.role == 0:
+        if song_to_delete:
+            # Delete the song from the database
+            try:
+                # Delete the song, with the related entries from other models
+                delete_songs([song_id])
+                db.session.commit()
+            except Exception as error:
+                db.session.rollback()
+                flash('Error deleting the song. Please try again.', category='error')
+                logger.exception(error)
+            finally:
+                db.session.close()
+                flash(("Song " + song_name + "is deleted from the database"))
+                return redirect(url_for('admin.admin_dashboard'))
+        else:
+            logger.info("couldn't find any song with that song_id")
+        return redirect(url_for('admin.admin_dashboard'))
+
+    # deleting from Creator account
+    elif current_user.role == 2 and current_user.user_id == song_to_delete.user_id:
+        if song_to_delete:
+            # Delete the song from the database
+            try:
+                # Delete the song, with the related entries from other models
+                delete_songs([song_id])
+                db.session.commit()
+                logger.info("Song is deleted from the database")
+            except Exception as error:
+                db.session.rollback()
+                flash('Error deleting the song. Please try again.', category='error')
+                logger.exception(error)
+            finally:
+                db.session.close()
+                flash(("Song '" + song_name + "' is deleted from the database"))
+                return redirect(url_for('creator.creator_dashboard'))
+        else:
+            logger.info("couldn't find any song with that song_id")
+        return redirect(url_for('creator.creator_dashboard'))
+
+    else:
+        return redirect(url_for('catalog.view_song'), song_id)
+
+
+# -------------------------------------Route for deleting an album
+@bp.route('/delete_album/<int:album_id>', methods=['GET', 'POST'])
+@login_required
+def delete_album(album_id):
+    album_to_delete = Albums.query.filter_by(album_id=album_id).first()
+    album_name = album_to_delete.title
+    # Deleting from Admin account
+    if current_user.role == 0:
+        if album_to_delete:
+            try:
+                # Delete related entries first, from other models
+                AlbumSong.query.filter_by(album_id=album_id).delete()
+                # Add additional deletions as needed for related tables
+
+                # Then delete the album
+                db.session.delete(album_to_delete)
+                db.session.commit()
+            except Exception as error:
+                db.session.rollback()
+                flash('Error deleting the album. Please try again.', category='error')
+                logger.exception(error)
+            finally:
+                db.session.close()
+                flash(f"Album '{album_name}' is deleted from the database")
+                return redirect(url_for('admin.admin_dashboard'))
+        else:
+            flash("Couldn't find any album with that album_id")
+        return redirect(url_for('admin.admin_dashboard'))
+
+    # Deleting from Creator account
+    elif current_user.role == 2 and current_user.user_id == album_to_delete.user_id:
+        if album_to_delete:
+            try:
+                # Delete related entries first, from other models
+                AlbumSong.query.filter_by(album_id=album_id).delete()
+                # Add additional deletions as needed for related tables
+
+                # Then delete the album
+                db.session.delete(album_to_delete)
+                db.session.commit()
+                logger.info("Album is deleted from the database")
+            except Exception as error:
+                db.session.rollback()
+                flash('Error deleting the album. Please try again.', category='error')
+                logger.exception(error)
+            finally:
+                db.session.close()
+                flash(f"Album '{album_name}' is deleted from the database")
+                return redirect(url_for('creator.creator_dashboard'))
+        else:
+            logger.info("Couldn't find any album with that album_id")
+        return redirect(url_for('creator.creator_dashboard'))
+
+    else:
+        return redirect(url_for('creator.my_albums'), album_id)
+
+
+# -------------------------------------Route for listing  a User's playlist
+@bp.route('/creator_dashboard/my_playlists', methods=['GET', 'POST'])
+@login_required
+def my_playlists():
+    user = db.get_or_404(Users, current_user.user_id)
+    playlists = Playlists.query.filter_by(user_id=current_user.user_id)
+
+    # Need to add functionality for that "Play" button beside playlist name
+
+    return render_template('my_playlists.html',
+                           current_user_level=current_user.role,
+                           user=user,
+                           playlists=playlists)
+
+
+# -------------------------------------Route for uploading a song
+@bp.route('/create_album', methods=['GET', 'POST'])
+@login_required
+def create_album():
+    user = db.get_or_404(Users, current_user.user_id)
+    title = ""
+
+    if request.method == 'POST' and user.role == 2:
+        try:
+            title = request.form['title']
+            genre = request.form['genre']
+            release_date = request.form['release_date']
+            description = request.form['description']
+            user_id = user.user_id
+
+            # Save the album cover picture into the uploads folder
+            cover_file = request.files['cover_file']
+            cover_file_path = f'static/covers/{title}.jpg'  # Unique path for cover file
+            cover_file.save(cover_file_path)
+
+            # Save the new song object into the database
+            new_album = Albums(
+                title=title,
+                genre=genre,
+                release_date=release_date,
+                description=description,
+                cover=cover_file_path,
+                user_id=user_id
+            )
+            db.session.add(new_album)
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            flash('Error uploading the new song. Please try again.', category='error')
+            logger.exception(error)
+        finally:
+            db.session.close()
+
+            # Fetching the album_id of the newly created album
+            new_album = Albums.query.filter_by(title=title).first()
+
+            # Redirect to the Creator Dashboard
+            return redirect(url_for('catalog.album', album_id=new_album.album_id))
+
+    return render_template('create_album.html',
+                           current_user_level=2,
+                           user=user)
+
+
+# Route for Creator's own albums
+@bp.route('/creator_albums/<int:album_id>', methods=['GET', 'POST'])
+@login_required
+def creator_albums(album_id):
+    user = db.get_or_404(Users, current_user.user_id)
+    album = Albums.query.get_or_404(album_id)
+    album_songs = album.songs
+
+    # Music Streaming functionality
+    if request.method == 'POST':
+        if 'stream' in request.form:
+            song_id = request.form.get('song_id')
+            song_to_stream = Songs.query.filter_by(song_id=song_id).first()
+            return render_template('album.html',
+                                   current_user_level=1,
+                                   user=user,
+                                   album=album,
+                                   song_to_stream=song_to_stream,
+                                   album_songs=album_songs,
+                                   song_to_stream_duration=to_minute_seconds(song_to_stream.duration))
+
+    return render_template('my_albums.html',
+                           current_user_level=1,
+                           user=user,
+                           album=album,
+                           album_songs=album_songs)
+
+
+# -------------------------------------Route for page, showing adding song into an album
+@bp.route('/add_to_album/<int:album_id>', methods=['GET', 'POST'])
+@login_required
+def add_to_album(album_id):
+    user = db.get_or_404(Users, current_user.user_id)
+    album = db.get_or_404(Albums, album_id)
+
+    # Code to filter out songs that are already in the current album
+    songs = (db.session.query(Songs)
+             .filter(Songs.user_id == current_user.user_id)
+             .all())
+
+    if Albums.query.filter_by(user_id=current_user.user_id).first():
+        return render_template('add_to_album.html',
+                               current_user_level=2,
+                               user=user,
+                               songs=songs,
+                               album=album,
+                               album_id=album_id)
+
+    else:
+        return redirect(url_for('catalog.album', album_id=album_id))
+
+
+# -------------------------------------Route for adding song into an album
+@bp.route('/add_to_album_song/<int:album_id>/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def add_to_album_song(album_id, song_id):
+
+    if (Albums.query.filter_by(user_id=current_user.user_id).first()
+            and Songs.query.filter_by(user_id=current_user.user_id).first()):
+        try:
+            new_album_song = AlbumSong(album_id=album_id,
+                                       song_id=song_id)
+            db.session.add(new_album_song)
+            db.session.commit()
+        except Exception as error:
+            db.session.rollback()
+            flash('Error creating a new AlbumSong item. Please try again.', category='error')
+            logger.exception(error)
+        finally:
+            db.session.close()
+            # Redirecting to album endpoint, to display the current playlist
+            return redirect(url_for('catalog.album', album_id=album_id))
+
+    else:
+        return redirect(url_for('catalog.album', album_id=album_id))
+
+
+# -------------------------------------Route for listing  a User's playlist
+@bp.route('/creator_dashboard/my_albums', methods=['GET', 'POST'])
+@login_required
+def my_albums():
+    user = db.get_or_404(Users, current_user.user_id)
+    albums = db.session.query(Albums).filter_by(user_id=current_user.user_id).all()
+
+    if len(albums) == 0:
+        album_count_bool = False
+    else:
+        album_count_bool = True
+
+    # Need to add functionality for that "Play" button beside playlist name
+
+    return render_template('my_albums.html',
+                           current_user_level=2,
+                           user=user,
+                           albums=albums,
+                           album_count_bool=album_count_bool)
+
+
+# -------------------------------------Route for Creator account settings page
+@bp.route('/creator_settings', methods=['GET', 'POST'])
+@login_required
+def creator_settings():
+    if current_user.role == 2:
+        user = db.get_or_404(Users, current_user.user_id)
+        return render_template('creator_settings.html',
+                               current_user_level=2,
+                               user=user)
+    elif current_user.role == 1:
+        redirect(url_for('user_settings.html'))
+    else:
+        redirect(url_for('auth.error_404'))
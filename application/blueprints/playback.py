@@ -0,0 +1,320 @@
+import logging
+from flask import Blueprint, current_app, request, redirect, url_for, flash, jsonify, send_file, abort
+from flask_login import login_required, current_user
+from application.controllers import similarity_index_path
+from application.database import db
+from application.models import Songs, Albums, Playlists, Queue, QueueState
+from application import metrics, play_queue, plays
+from application.playback import song_payload
+import os
+
+
+logger = logging.getLogger(__name__)
+# One record per stream start: high volume, sampled by LOG_SAMPLING (see application/logs.py)
+stream_logger = logging.getLogger('cassette.streams')
+
+
+# ------------------------------ Playback blueprint
+# Streaming, the play queue and the Now Playing APIs used by control_audio.js, and the "sounds like" radio.
+# A streaming-only node can run with just this blueprint (and the api one).
+bp = Blueprint('playback', __name__)
+
+
+# -------------------------------------Route to handle adding songs to the queue
+@bp.route('/add_to_queue/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def add_to_queue(song_id):
+
+    song = db.session.get(Songs, song_id)
+    if song:
+        try:
+            play_queue.append(current_user.user_id, song.song_id)  # Add the song to the end of the user's queue
+            db.session.commit()
+            flash('Song added to your queue successfully', category='success')
+        except Exception as error:
+            db.session.rollback()
+            flash('Error adding song into the selected queue. Please try again.', category='error')
+            logger.exception(error)
+        finally:
+            db.session.close()
+    else:
+        flash('Song not found', category='error')
+
+    # Redirect back to the page the song was added from
+    return redirect(request.referrer or url_for('catalog.user_dashboard'))
+
+
+# -------------------------------------Route for the "Play all" buttons of playlists and albums
+# Replaces the queue with every song of the playlist/album, in one INSERT ... SELECT
+@bp.route('/play_all/<string:source>/<int:source_id>', methods=['GET', 'POST'])
+@login_required
+def play_all(source, source_id):
+    try:
+        if source == 'playlist':
+            db.get_or_404(Playlists, source_id)
+            added = play_queue.enqueue_playlist(current_user.user_id, source_id, replace=True)
+        elif source == 'album':
+            db.get_or_404(Albums, source_id)
+            added = play_queue.enqueue_album(current_user.user_id, source_id, replace=True)
+        else:
+            return redirect(url_for('auth.error_404'))
+        play_queue.step(current_user.user_id, 1)
+        db.session.commit()
+        flash(f"{added} songs added to your queue!")
+    except Exception as error:
+        db.session.rollback()
+        flash('Error adding the songs into your queue. Please try again.', category='error')
+        logger.exception(error)
+    finally:
+        db.session.close()
+
+    return redirect(url_for('catalog.user_dashboard'))
+
+
+# -------------------------------------Route to stream the audio file of a song
+# Served with Range support, so the browser can seek and prefetch without downloading the whole file
+@bp.route('/stream/<int:song_id>', methods=['GET'])
+@login_required
+def stream_song(song_id):
+    song = db.get_or_404(Songs, song_id)
+    if song.flagged or not os.path.exists(song.file_path):
+        abort(404)
+    # The browser fetches the rest of the song (seeking, prefetching) with more Range requests
+    if request.range is None or request.range.ranges[0][0] == 0:
+        stream_logger.info("song_id=%s user_id=%s", song_id, current_user.user_id)
+    response = send_file(os.path.abspath(song.file_path), mimetype='audio/mpeg', conditional=True)
+
+    # Active streams and bytes served (at /metrics): the body is sent after this returns, and the
+    # server closes it once it's done. The file is passed through to the server as it is (so it can
+    # use sendfile), where response.call_on_close() wouldn't run: its close() is extended instead.
+    if response.status_code in (200, 206) and hasattr(response.response, 'close'):
+        metrics.gauge_add('cassette_active_streams', 1)
+        body = response.response
+        close_body = body.close
+        content_length = response.content_length or 0
+
+        def close():
+            try:
+                close_body()
+            finally:
+                metrics.gauge_add('cassette_active_streams', -1)
+                metrics.inc('cassette_stream_bytes_total', content_length)
+
+        body.close = close
+    return response
+
+
+# -------------------------------------Now Playing API (JSON), used by control_audio.js
+# GET: the current song of the queue. POST {"song_id": ...}: start streaming a song.
+# Both return the song to play, and the next song of the queue, to prefetch.
+@bp.route('/api/now_playing', methods=['GET', 'POST'])
+@login_required
+def now_playing():
+    user_id = current_user.user_id
+
+    if request.method == 'POST':
+        payload = request.get_json(silent=True) or request.form.to_dict()
+        try:
+            song = db.session.get(Songs, int(payload.get('song_id')))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'song_id must be a number'}), 400
+        if song is None or song.flagged:
+            return jsonify({'error': 'Song not found'}), 404
+        plays.record(current_app._get_current_object(), user_id, song.song_id)
+    else:
+        state = db.session.get(QueueState, user_id)
+        current = db.session.get(Queue, state.current_queue_id) if state and state.current_queue_id else None
+        song = current.song if current is not None else None
+
+    next_row = play_queue.peek(user_id)
+    return jsonify({'song': song_payload(song),
+                    'next': song_payload(next_row.song) if next_row is not None else None})
+
+
+# -------------------------------------Queue API (JSON), used by control_audio.js
+# Function: Current state of the user's queue, as JSON
+def queue_response(user_id, current=None):
+    state = play_queue.get_state(user_id)
+    rows = play_queue.items(user_id)
+    if current is None and state.current_queue_id is not None:
+        current = next((row for row in rows if row.queue_id == state.current_queue_id), None)
+    return jsonify({'items': [play_queue.serialize(row) for row in rows],
+                    'current': play_queue.serialize(current),
+                    'next': play_queue.serialize(play_queue.peek(user_id)),
+                    'shuffle': state.shuffle_seed is not None,
+                    'repeat': state.repeat})
+
+
+@bp.route('/api/queue', methods=['GET', 'POST', 'DELETE'])
+@login_required
+def queue_api():
+    user_id = current_user.user_id
+    payload = request.get_json(silent=True) or request.form
+
+    try:
+        if request.method == 'POST':
+            song = db.get_or_404(Songs, int(payload.get('song_id', 0)))
+            play_queue.append(user_id, song.song_id, play_next=bool(payload.get('play_next')))
+        elif request.method == 'DELETE':
+            play_queue.clear(user_id)
+        response = queue_response(user_id)
+        db.session.commit()
+        return response
+    except ValueError:
+        db.session.rollback()
+        return jsonify({'error': 'song_id must be a number'}), 400
+
+
+@bp.route('/api/queue/<int:queue_id>', methods=['DELETE'])
+@login_required
+def queue_item_api(queue_id):
+    if not play_queue.remove(current_user.user_id, queue_id):
+        return jsonify({'error': 'Queue item not found'}), 404
+    response = queue_response(current_user.user_id)
+    db.session.commit()
+    return response
+
+
+# Moves a queue item before another one ("before": queue_id), or to the end ("before": null)
+@bp.route('/api/queue/<int:queue_id>/move', methods=['POST'])
+@login_required
+def queue_move_api(queue_id):
+    payload = request.get_json(silent=True) or {}
+    if play_queue.move(current_user.user_id, queue_id, payload.get('before')) is None:
+        return jsonify({'error': 'Queue item not found'}), 404
+    response = queue_response(current_user.user_id)
+    db.session.commit()
+    return response
+
+
+@bp.route('/api/queue/<int:queue_id>/play', methods=['POST'])
+@login_required
+def queue_play_api(queue_id):
+    current = play_queue.play(current_user.user_id, queue_id)
+    if current is None:
+        return jsonify({'error': 'Queue item not found'}), 404
+    plays.record(current_app._get_current_object(), current_user.user_id, current.song_id)
+    response = queue_response(current_user.user_id, current)
+    db.session.commit()
+    return response
+
+
+# Bulk enqueue of a whole playlist or album ("replace": true to replace the queue)
+@bp.route('/api/queue/<string:source>/<int:source_id>', methods=['POST'])
+@login_required
+def queue_enqueue_api(source, source_id):
+    payload = request.get_json(silent=True) or {}
+    replace = bool(payload.get('replace'))
+    if source == 'playlist':
+        db.get_or_404(Playlists, source_id)
+        play_queue.enqueue_playlist(current_user.user_id, source_id, replace=replace)
+    elif source == 'album':
+        db.get_or_404(Albums, source_id)
+        play_queue.enqueue_album(current_user.user_id, source_id, replace=replace)
+    else:
+        return jsonify({'error': 'Unknown source, use playlist or album'}), 404
+
+    current = play_queue.step(current_user.user_id, 1) if replace else None
+    if current is not None:
+        plays.record(current_app._get_current_object(), current_user.user_id, current.song_id)
+    response = queue_response(current_user.user_id, current)
+    db.session.commit()
+    return response
+
+
+# Moves to the next/previous song. "auto": true when the song ended by itself (for repeat one)
+@bp.route('/api/queue/next', methods=['POST'])
+@login_required
+def queue_next_api():
+    payload = request.get_json(silent=True) or {}
+    current = play_queue.step(current_user.user_id, 1, auto=bool(payload.get('auto')))
+    if current is not None:
+        plays.record(current_app._get_current_object(), current_user.user_id, current.song_id)
+    response = queue_response(current_user.user_id, current)
+    db.session.commit()
+    return response
+
+
+@bp.route('/api/queue/previous', methods=['POST'])
+@login_required
+def queue_previous_api():
+    current = play_queue.step(current_user.user_id, -1)
+    if current is not None:
+        plays.record(current_app._get_current_object(), current_user.user_id, current.song_id)
+    response = queue_response(current_user.user_id, current)
+    db.session.commit()
+    return response
+
+
+@bp.route('/api/queue/shuffle', methods=['POST'])
+@login_required
+def queue_shuffle_api():
+    payload = request.get_json(silent=True) or {}
+    play_queue.set_shuffle(current_user.user_id, bool(payload.get('enabled')))
+    response = queue_response(current_user.user_id)
+    db.session.commit()
+    return response
+
+
+@bp.route('/api/queue/repeat', methods=['POST'])
+@login_required
+def queue_repeat_api():
+    payload = request.get_json(silent=True) or {}
+    try:
+        play_queue.set_repeat(current_user.user_id, payload.get('mode', 'off'))
+    except ValueError as error:
+        return jsonify({'error': str(error)}), 400
+    response = queue_response(current_user.user_id)
+    db.session.commit()
+    return response
+
+
+# -------------------------------------Route to fetch the songs that sound like a song (JSON)
+@bp.route('/api/similar/<int:song_id>', methods=['GET'])
+@login_required
+def similar_songs(song_id):
+    from application import similarity  # numpy, only loaded by the workers that use it
+    k = min(max(request.args.get('k', 10, type=int), 1), 100)
+
+    # Fetching a few extra neighbours, as deleted and flagged songs are dropped below
+    neighbours = similarity.similar_songs(similarity_index_path(), song_id, k=k + 10)
+    distances = dict(neighbours)
+    songs = Songs.query.filter(Songs.song_id.in_(distances.keys()), Songs.flagged == False).all()
+    songs.sort(key=lambda song: distances[song.song_id])
+
+    return jsonify({'song_id': song_id,
+                    'similar': [{'song_id': song.song_id,
+                                 'title': song.title,
+                                 'singer': song.singer,
+                                 'genre': song.genre,
+                                 'cover': song.cover,
+                                 'distance': round(distances[song.song_id], 4)} for song in songs[:k]]})
+
+
+# -------------------------------------Route to start a "sounds like" radio, seeded from a song
+# It replaces the current user's queue with the songs of the station
+@bp.route('/radio/<int:song_id>', methods=['GET', 'POST'])
+@login_required
+def radio(song_id):
+    from application import similarity
+    song = db.get_or_404(Songs, song_id)
+    length = min(max(request.args.get('length', 25, type=int), 2), 100)
+
+    try:
+        station = list(similarity.radio(similarity_index_path(), song.song_id, length=length))
+        playable = {song_id for (song_id,) in db.session.query(Songs.song_id)
+                    .filter(Songs.song_id.in_(station), Songs.flagged == False)}
+
+        play_queue.replace(current_user.user_id, [station_song_id for station_song_id in station
+                                                  if station_song_id in playable])
+        play_queue.step(current_user.user_id, 1)
+        db.session.commit()
+        flash(f"Radio started: songs that sound like '{song.title}' are in your queue!")
+    except Exception as error:
+        db.session.rollback()
+        flash('Error starting the radio. Please try again.', category='error')
+        logger.exception(error)
+    finally:
+        db.session.close()
+
+    return redirect(url_for('catalog.user_dashboard'))
@@ -0,0 +1,232 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from . import cache_backends, metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------ In-process cache
+# A small LRU cache whose entries also expire after "ttl" seconds.
+# It is per process (every worker keeps its own copy), so it suits values that are
+# expensive to compute and fine to serve a little stale, e.g. the dashboard aggregates.
+# Named caches count their hits and misses (cassette_cache_requests_total at /metrics).
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize=128, ttl=60, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] < time.monotonic():
+                del self._data[key]
+                entry = _MISSING
+            if entry is not _MISSING:
+                self._data.move_to_end(key)
+        if self.name is not None:
+            metrics.inc('cassette_cache_requests_total', cache=self.name,
+                        result='miss' if entry is _MISSING else 'hit')
+        return default if entry is _MISSING else entry[1]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # Function: Cached value of "key", computing (and storing) it with compute() on a miss
+    def get_or_set(self, key, compute, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ------------------------------ Shared cache
+# The same interface (get, set, get_or_set, delete, incr), on the backend of CACHE_BACKEND (see
+# application/cache_backends.py), so that every worker and node sees the same entries:
+#     local          (default) each SharedCache keeps its own in-process LRU, as a TTLCache would
+#     filesystem     files in CACHE_URL (a directory, defaults to instance/cache)
+#     redis          a Redis-protocol server at CACHE_URL (redis://host:port/db, e.g. "flask cache-server")
+#
+# Tags: set(key, value, tags=('catalog',)) stores the entry with the current version of its tags, and
+# get() treats it as a miss once one of them has changed: invalidate_tags('catalog') drops every entry
+# tagged with it at once, in every process reading the same tag store. The tags are kept in the shared
+# backend, or with the local one in files under instance/cache_tags (every worker of the machine).
+# A version is a random string: a tag evicted from the store gets a new one, which only costs misses.
+#
+# The cache is an optimization: when the backend fails, the error is logged and the call behaves as a
+# miss (get) or does nothing (set, delete).
+
+KEY_PREFIX = 'cassette:'
+# Longer keys are hashed
+MAX_KEY_LENGTH = 200
+
+_backend = None
+_tag_store = None
+
+
+# Function: Backend of the shared caches, from CACHE_BACKEND and CACHE_URL
+def init_app(app):
+    global _backend, _tag_store
+    kind = app.config['CACHE_BACKEND']
+    url = app.config['CACHE_URL']
+    if kind == 'local':
+        _backend = None
+        _tag_store = cache_backends.FileBackend(os.path.join(app.instance_path, 'cache_tags'))
+    elif kind == 'filesystem':
+        _backend = _tag_store = cache_backends.FileBackend(url or os.path.join(app.instance_path, 'cache'))
+    elif kind == 'redis':
+        _backend = _tag_store = cache_backends.RedisBackend(url or 'redis://127.0.0.1:6379/0')
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND {kind!r}, expected local, filesystem or redis")
+
+
+def _failed(action, error):
+    logger.warning("Cache %s failed: %s", action, error)
+    metrics.inc('cassette_cache_errors_total')
+
+
+# Before init_app (scripts importing the models), the tags live in the process
+_process_tags = cache_backends.LocalBackend(maxsize=4096)
+
+
+def _tags():
+    return _tag_store or _process_tags
+
+
+def _new_version():
+    return os.urandom(6).hex()
+
+
+# Function: Current versions of tags (a tuple), None when the tag store can't be read
+def tag_versions(*tags):
+    if not tags:
+        return ()
+    store = _tags()
+    keys = [f"{KEY_PREFIX}tag:{tag}" for tag in tags]
+    try:
+        versions = store.get_many(keys)
+        for index, version in enumerate(versions):
+            if version is None:
+                # First use (or evicted): whoever adds it first sets the version everyone reads
+                store.add(keys[index], _new_version())
+                versions[index] = store.get_many([keys[index]])[0]
+    except (OSError, cache_backends.CacheError) as error:
+        _failed('read of the tags', error)
+        return None
+    return tuple(versions)
+
+
+# Function: Give tags new versions, dropping every entry stored with them
+def invalidate_tags(*tags):
+    store = _tags()
+    for tag in tags:
+        try:
+            store.set(f"{KEY_PREFIX}tag:{tag}", _new_version())
+        except (OSError, cache_backends.CacheError) as error:
+            _failed(f'invalidation of the tag {tag!r}', error)
+
+
+# Function: Claim a periodic task for "seconds": True for the one process that gets it, among every worker
+# (and node, with a shared CACHE_BACKEND) using the same tag store; False once claimed, or when it can't be read
+def claim(name, seconds):
+    try:
+        return _tags().add(f"{KEY_PREFIX}claim:{name}", 1, seconds)
+    except (OSError, cache_backends.CacheError) as error:
+        _failed(f'claim of {name!r}', error)
+        return False
+
+
+class SharedCache:
+    def __init__(self, name, maxsize=128, ttl=60):
+        self.name = name
+        self.ttl = ttl
+        self._local = cache_backends.LocalBackend(maxsize=maxsize, ttl=ttl)
+
+    def _backend(self):
+        return _backend or self._local
+
+    def _key(self, key):
+        key = f"{KEY_PREFIX}{self.name}:{key!r}"
+        if len(key) > MAX_KEY_LENGTH:
+            key = f"{KEY_PREFIX}{self.name}:{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+        return key
+
+    def get(self, key, default=None):
+        try:
+            entry = self._backend().get_many([self._key(key)])[0]
+        except (OSError, cache_backends.CacheError) as error:
+            _failed(f'read of {self.name}', error)
+            entry = None
+        # (tags, their versions when stored, value), or the int of a counter (incr)
+        if isinstance(entry, tuple) and entry[0] and entry[1] != tag_versions(*entry[0]):
+            entry = None
+        metrics.inc('cassette_cache_requests_total', cache=self.name, result='miss' if entry is None else 'hit')
+        if entry is None:
+            return default
+        return entry[2] if isinstance(entry, tuple) else entry
+
+    def _store(self, key, value, ttl, tags, versions):
+        if versions is None:
+            return
+        try:
+            self._backend().set(self._key(key), (tuple(tags), versions, value), self.ttl if ttl is None else ttl)
+        except (OSError, cache_backends.CacheError) as error:
+            _failed(f'write of {self.name}', error)
+
+    def set(self, key, value, ttl=None, tags=()):
+        self._store(key, value, ttl, tags, tag_versions(*tags))
+
+    # Function: Cached value of "key", computing (and storing) it with compute() on a miss
+    def get_or_set(self, key, compute, ttl=None, tags=()):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            # The versions are read before computing: a change committed meanwhile makes the entry stale
+            versions = tag_versions(*tags)
+            value = compute()
+            self._store(key, value, ttl, tags, versions)
+        return value
+
+    def delete(self, key):
+        try:
+            self._backend().delete(self._key(key))
+        except (OSError, cache_backends.CacheError) as error:
+            _failed(f'delete of {self.name}', error)
+
+    # Function: Add "amount" to a counter (a missing one starts at 0), None when the backend failed
+    def incr(self, key, amount=1):
+        try:
+            return self._backend().incr(self._key(key), amount)
+        except (OSError, cache_backends.CacheError) as error:
+            _failed(f'increment of {self.name}', error)
+            return None
+
+    # Function: Drop the entries of this process (the local backend; shared entries expire, or use tags)
+    def clear(self):
+        self._local.clear()
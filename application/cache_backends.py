@@ -0,0 +1,310 @@
+import hashlib
+import os
+import pickle
+import socket
+import struct
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows: add() and incr() of the filesystem backend are then not atomic
+    fcntl = None
+
+
+# ------------------------------ Cache backends
+# Where the shared caches of application/cache.py keep their entries. Every backend has the same
+# small interface, on string keys:
+#     get_many(keys)                  values (None for the missing ones)
+#     set(key, value, ttl)            ttl in seconds, None: no expiry
+#     add(key, value, ttl)            set only if the key is missing, True if it was
+#     delete(*keys)
+#     incr(key, amount)               the new value (a missing key counts as 0)
+#     clear()
+# and "shared": whether the other processes (and nodes) see the entries.
+#
+#     LocalBackend        in-process LRU (TTLCache), values kept as they are
+#     FileBackend         one file per key in a directory: shared by the processes of the machine, or
+#                         by every node when the directory is on shared storage
+#     RedisBackend        any server speaking the Redis protocol (RESP), e.g. Redis, or the stand-in of
+#                         application/cache_server.py ("flask cache-server")
+# The shared backends store integers as decimal strings (so that incr works on them) and everything
+# else pickled: only point them at a cache that the app's nodes alone can write to.
+
+
+class CacheError(Exception):
+    pass
+
+
+# Function: Bytes stored for a value, and back
+def dumps(value):
+    if type(value) is int:
+        return str(value).encode()
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data):
+    if data is None:
+        return None
+    # Pickles start with the PROTO opcode (0x80), never with a digit or a sign
+    if data[:1] == b'\x80':
+        return pickle.loads(data)
+    return int(data)
+
+
+class LocalBackend:
+    shared = False
+
+    def __init__(self, maxsize=1024, ttl=60):
+        from .cache import TTLCache  # application/cache.py imports this module
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        return [self._entries.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        self._entries.set(key, value, ttl if ttl is not None else 10 ** 9)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            if self._entries.get(key) is not None:
+                return False
+            self.set(key, value, ttl)
+            return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self._entries.delete(key)
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = (self._entries.get(key) or 0) + amount
+            self.set(key, value)
+            return value
+
+    def clear(self):
+        self._entries.clear()
+
+
+# ------------------------------ Filesystem
+# File of a key: <directory>/<2 hex>/<sha1 of the key>, holding the expiry time (float64, 0: never) and the
+# value. Files are written next to their target and swapped in with os.replace, so readers never see half
+# a value. Expired files are deleted when read, and by a sweep of the directory every PRUNE_EVERY writes.
+PRUNE_EVERY = 1000
+EXPIRY = struct.Struct('<d')
+
+
+class FileBackend:
+    shared = True
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as entry_file:
+                data = entry_file.read()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        expires_at, = EXPIRY.unpack_from(data)
+        if expires_at and expires_at < time.time():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return data[EXPIRY.size:]
+
+    def _write(self, path, data, ttl):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as entry_file:
+            entry_file.write(EXPIRY.pack(time.time() + ttl if ttl is not None else 0) + data)
+        os.replace(tmp_path, path)
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune()
+
+    # add() and incr() read, then write: a lock file makes that atomic between processes
+    def _locked(self):
+        lock_file = open(os.path.join(self.directory, '.lock'), 'w')
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def get_many(self, keys):
+        return [loads(self._read(self._path(key))) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        self._write(self._path(key), dumps(value), ttl)
+
+    def add(self, key, value, ttl=None):
+        path = self._path(key)
+        with self._locked():
+            if self._read(path) is not None:
+                return False
+            self._write(path, dumps(value), ttl)
+            return True
+
+    def delete(self, *keys):
+        for key in keys:
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def incr(self, key, amount=1):
+        path = self._path(key)
+        with self._locked():
+            value = (loads(self._read(path)) or 0) + amount
+            self._write(path, dumps(value), None)
+            return value
+
+    def clear(self):
+        for directory, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename != '.lock':
+                    os.unlink(os.path.join(directory, filename))
+
+    # Function: Delete the expired files
+    def prune(self):
+        now = time.time()
+        for directory, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    with open(path, 'rb') as entry_file:
+                        expires_at, = EXPIRY.unpack(entry_file.read(EXPIRY.size))
+                    if expires_at and expires_at < now:
+                        os.unlink(path)
+                except (OSError, struct.error):
+                    continue
+
+
+# ------------------------------ Redis protocol
+# A minimal RESP client: one connection per thread (and per process, connections are not shared
+# after a fork), reconnected once when a command fails on a broken connection. When the server can't
+# be reached, the commands fail at once for RETRY_SECONDS instead of every request waiting on it.
+# URL: redis://[:password@]host[:port][/db]
+SOCKET_TIMEOUT = 2
+RETRY_SECONDS = 5
+
+
+class RedisBackend:
+    shared = True
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        if parts.scheme != 'redis':
+            raise ValueError(f"Unsupported cache URL {url!r}, expected redis://host:port/db")
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip('/') or 0)
+        self._local = threading.local()
+        self._down_until = 0
+
+    def _connect(self):
+        connection = socket.create_connection((self.host, self.port), timeout=SOCKET_TIMEOUT)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.connection = connection
+        self._local.reader = connection.makefile('rb')
+        self._local.pid = os.getpid()
+        try:
+            if self.password:
+                self._send('AUTH', self.password)
+            if self.db:
+                self._send('SELECT', self.db)
+        except CacheError:
+            self._close()
+            raise
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+        self._local.connection = None
+
+    def _send(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._local.connection.sendall(b''.join(parts))
+        return self._reply()
+
+    def _reply(self):
+        line = self._local.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by the cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise CacheError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._reply() for _ in range(length)]
+        raise CacheError(f"Unexpected reply from the cache server: {line!r}")
+
+    # Function: Run one command, on a new connection if the thread's one broke
+    def command(self, *args):
+        if self._down_until > time.monotonic():
+            raise ConnectionError(f"Cache server {self.host}:{self.port} unreachable")
+        for attempt in (1, 2):
+            try:
+                if getattr(self._local, 'connection', None) is None or self._local.pid != os.getpid():
+                    self._connect()
+                return self._send(*args)
+            except OSError:
+                self._close()
+                if attempt == 2:
+                    self._down_until = time.monotonic() + RETRY_SECONDS
+                    raise
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        return [loads(data) for data in self.command('MGET', *keys)]
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            self.command('SET', key, dumps(value))
+        else:
+            self.command('SET', key, dumps(value), 'PX', max(int(ttl * 1000), 1))
+
+    def add(self, key, value, ttl=None):
+        args = ['SET', key, dumps(value), 'NX']
+        if ttl is not None:
+            args += ['PX', max(int(ttl * 1000), 1)]
+        return self.command(*args) == 'OK'
+
+    def delete(self, *keys):
+        if keys:
+            self.command('DEL', *keys)
+
+    def incr(self, key, amount=1):
+        return self.command('INCRBY', key, amount)
+
+    def clear(self):
+        self.command('FLUSHDB')
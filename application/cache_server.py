@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Cache stand-in server
+# A small in-memory server speaking the Redis protocol (RESP), stdlib only, for the "redis"
+# CACHE_BACKEND where there is no Redis: development, tests, or a single machine.
+# It knows the commands of application/cache_backends.py and a few more:
+#     PING, GET, MGET, SET [EX s|PX ms] [NX|XX], DEL, EXISTS, INCR, INCRBY, EXPIRE, TTL,
+#     DBSIZE, FLUSHDB, FLUSHALL, SELECT, AUTH, QUIT
+# Keys expire lazily (when read) and by a sweep every SWEEP_SECONDS; past MAX_KEYS, the least
+# recently used keys are evicted, like Redis with "maxmemory-policy allkeys-lru". Nothing is
+# persisted: a restart empties the cache, which only costs misses.
+#
+# Usage: flask cache-server --host 127.0.0.1 --port 6380, then CACHE_BACKEND=redis
+#        CACHE_URL=redis://127.0.0.1:6380/0. In tests, serve_in_thread() starts one on a free port.
+
+MAX_KEYS = 100000
+MAX_DATABASES = 16
+SWEEP_SECONDS = 1
+MAX_BULK_BYTES = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class CommandError(Exception):
+    pass
+
+
+# Class: The keys of one database, {key: (expires_at or None, value)} in LRU order
+class Database:
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.data = OrderedDict()
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value, expires_at=None):
+        self.data[key] = (expires_at, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_keys:
+            self.data.popitem(last=False)
+
+    def expires_at(self, key):
+        return self.data[key][0] if self.get(key) is not None else None
+
+    def sweep(self):
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in self.data.items() if expires_at is not None and expires_at <= now]:
+            del self.data[key]
+
+
+# Function: The integer of a value (b'12'), or a command error
+def _integer(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise CommandError('ERR value is not an integer or out of range')
+
+
+class CacheServer:
+    def __init__(self, password=None, max_keys=MAX_KEYS):
+        self.password = password
+        self.databases = [Database(max_keys) for _ in range(MAX_DATABASES)]
+
+    # ------------------------------ Protocol
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            # Inline command, e.g. "PING" typed in telnet
+            return line.split()
+        count = int(line[1:])
+        args = []
+        for _ in range(count):
+            header = await reader.readline()
+            if not header.startswith(b'$'):
+                raise ProtocolError(f"expected '$', got {header[:1]!r}")
+            length = int(header[1:])
+            if length > MAX_BULK_BYTES:
+                raise ProtocolError('invalid bulk length')
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    @staticmethod
+    def _encode(reply):
+        if reply is None:
+            return b'$-1\r\n'
+        if isinstance(reply, CommandError):
+            return b'-%s\r\n' % str(reply).encode()
+        if isinstance(reply, str):
+            return b'+%s\r\n' % reply.encode()
+        if isinstance(reply, int):
+            return b':%d\r\n' % reply
+        if isinstance(reply, bytes):
+            return b'$%d\r\n%s\r\n' % (len(reply), reply)
+        return b'*%d\r\n' % len(reply) + b''.join(CacheServer._encode(item) for item in reply)
+
+    async def handle_connection(self, reader, writer):
+        session = {'db': 0, 'authenticated': self.password is None}
+        try:
+            while True:
+                try:
+                    args = await self._read_command(reader)
+                except (ProtocolError, ValueError) as error:
+                    writer.write(self._encode(CommandError(f'ERR Protocol error: {error}')))
+                    break
+                if args is None:
+                    break
+                if not args:
+                    continue
+                try:
+                    reply = self.execute(session, args)
+                except CommandError as error:
+                    reply = error
+                writer.write(self._encode(reply))
+                if args[0].upper() == b'QUIT':
+                    break
+                await writer.drain()
+        # Cancelled: the server is stopping
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    # ------------------------------ Commands
+    def execute(self, session, args):
+        name = args[0].decode('ascii', 'replace').upper()
+        args = args[1:]
+        if name == 'AUTH':
+            if self.password is None or args[-1:] != [self.password.encode()]:
+                raise CommandError('WRONGPASS invalid username-password pair or user is disabled.')
+            session['authenticated'] = True
+            return 'OK'
+        if not session['authenticated']:
+            raise CommandError('NOAUTH Authentication required.')
+        handler = getattr(self, f'_command_{name.lower()}', None)
+        if handler is None:
+            raise CommandError(f"ERR unknown command '{name}'")
+        try:
+            return handler(session, self.databases[session['db']], *args)
+        except TypeError:
+            raise CommandError(f"ERR wrong number of arguments for '{name.lower()}' command")
+
+    def _command_ping(self, session, db, message=None):
+        return 'PONG' if message is None else message
+
+    def _command_quit(self, session, db):
+        return 'OK'
+
+    def _command_select(self, session, db, index):
+        index = _integer(index)
+        if not 0 <= index < MAX_DATABASES:
+            raise CommandError('ERR DB index is out of range')
+        session['db'] = index
+        return 'OK'
+
+    def _command_get(self, session, db, key):
+        return db.get(key)
+
+    def _command_mget(self, session, db, *keys):
+        if not keys:
+            raise TypeError
+        return [db.get(key) for key in keys]
+
+    def _command_set(self, session, db, key, value, *options):
+        expires_at, condition = None, None
+        options = [option.upper() for option in options]
+        index = 0
+        while index < len(options):
+            option = options[index]
+            if option in (b'EX', b'PX') and index + 1 < len(options):
+                amount = _integer(options[index + 1])
+                if amount <= 0:
+                    raise CommandError("ERR invalid expire time in 'set' command")
+                expires_at = time.monotonic() + (amount if option == b'EX' else amount / 1000)
+                index += 2
+            elif option in (b'NX', b'XX'):
+                condition = option
+                index += 1
+            else:
+                raise CommandError('ERR syntax error')
+        exists = db.get(key) is not None
+        if (condition == b'NX' and exists) or (condition == b'XX' and not exists):
+            return None
+        db.set(key, value, expires_at)
+        return 'OK'
+
+    def _command_del(self, session, db, *keys):
+        if not keys:
+            raise TypeError
+        deleted = 0
+        for key in keys:
+            if db.get(key) is not None:
+                del db.data[key]
+                deleted += 1
+        return deleted
+
+    def _command_exists(self, session, db, *keys):
+        if not keys:
+            raise TypeError
+        return sum(1 for key in keys if db.get(key) is not None)
+
+    def _command_incrby(self, session, db, key, amount):
+        value = _integer(db.get(key) or 0) + _integer(amount)
+        db.set(key, str(value).encode(), db.expires_at(key))
+        return value
+
+    def _command_incr(self, session, db, key):
+        return self._command_incrby(session, db, key, b'1')
+
+    def _command_expire(self, session, db, key, seconds):
+        value = db.get(key)
+        if value is None:
+            return 0
+        db.set(key, value, time.monotonic() + _integer(seconds))
+        return 1
+
+    def _command_ttl(self, session, db, key):
+        if db.get(key) is None:
+            return -2
+        expires_at = db.expires_at(key)
+        return -1 if expires_at is None else max(int(round(expires_at - time.monotonic())), 0)
+
+    def _command_dbsize(self, session, db):
+        return len(db.data)
+
+    def _command_flushdb(self, session, db, *options):
+        db.data.clear()
+        return 'OK'
+
+    def _command_flushall(self, session, db, *options):
+        for database in self.databases:
+            database.data.clear()
+        return 'OK'
+
+    # ------------------------------ Serving
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(SWEEP_SECONDS)
+            for database in self.databases:
+                database.sweep()
+
+    async def serve(self, host, port, started=None, stopping=None):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        sweeper = asyncio.ensure_future(self._sweep())
+        stopping = stopping or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, stopping.set)
+            except (NotImplementedError, RuntimeError, ValueError):  # Windows, or not the main thread
+                pass
+        address = server.sockets[0].getsockname()
+        logger.info("Cache server listening on %s:%s (pid %s)", address[0], address[1], os.getpid())
+        if started is not None:
+            started(address)
+        async with server:
+            await stopping.wait()
+        sweeper.cancel()
+
+
+def run(host='127.0.0.1', port=6380, password=None, max_keys=MAX_KEYS):
+    def started(address):
+        print(f"Cache server listening on redis://{address[0]}:{address[1]}/0 (pid {os.getpid()})")
+    asyncio.run(CacheServer(password, max_keys).serve(host, port, started))
+
+
+# Class: A cache server running in a daemon thread (tests): its url, and stop()
+class ThreadedServer:
+    def __init__(self, host='127.0.0.1', port=0, password=None, max_keys=MAX_KEYS):
+        self.server = CacheServer(password, max_keys)
+        self.url = None
+        self._loop = None
+        self._stopping = None
+        ready = threading.Event()
+
+        def started(address):
+            auth = f":{password}@" if password else ''
+            self.url = f"redis://{auth}{address[0]}:{address[1]}/0"
+            ready.set()
+
+        async def main():
+            self._loop = asyncio.get_running_loop()
+            self._stopping = asyncio.Event()
+            await self.server.serve(host, port, started, self._stopping)
+
+        self._thread = threading.Thread(target=asyncio.run, args=(main(),), name='cache-server', daemon=True)
+        self._thread.start()
+        if not ready.wait(10):
+            raise RuntimeError("The cache server didn't start")
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        self._thread.join(5)
+
+
+# Function: Start a cache server in this process, on a free port by default (e.g. CACHE_URL=server.url)
+def serve_in_thread(host='127.0.0.1', port=0, password=None, max_keys=MAX_KEYS):
+    return ThreadedServer(host, port, password, max_keys)
@@ -0,0 +1,385 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from flask import current_app
+from sqlalchemy import select
+from . import jobs, metrics
+from .database import db
+from .fragments import fragment_version
+from .models import Genres, Songs, Albums
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process that needs a rebuild does it
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Catalog snapshot
+# A read-only copy of the song and album metadata shown by the listings, the search and the queue,
+# in one file that every worker maps into memory: the workers of a machine share one copy of it
+# through the page cache, and read it without a query and without building ORM objects.
+#
+# File layout (native byte order, the file never leaves the machine), every section 8-byte aligned:
+#     header          MAGIC, version, generation, built_at, catalog stamp, counts and sizes
+#     songs           one uint32 column per field of SONG_FIELDS, sorted by song_id
+#     albums          one uint32 column per field of ALBUM_FIELDS, sorted by album_id
+#     strings         (count + 1) uint32, start of every string in the heap (strings are stored once)
+#     song search     (songs + 1) uint32, start of every song's text in the song search text
+#     album search    (albums + 1) uint32, the same for the albums
+#     heap            the UTF-8 strings (titles, singers, genres, cover paths), referenced by string number
+#     search texts    lowercased "title\nsinger\ngenre\n" of every song, "title\n" of every album:
+#                     a search is a substring scan of the mapped bytes (mmap.find)
+#
+# The snapshot is built from the tables (build()) into a new file, swapped in with os.replace: a worker
+# still reading the previous generation keeps its mapping of the old file until it maps the new one.
+# Every snapshot records the "catalog" fragment version it was built from (see application/fragments.py):
+# once songs or albums change, the snapshot is stale, get_snapshot() returns None (the callers query the
+# database) and a background job rebuilds it. A snapshot older than CATALOG_SNAPSHOT_SECONDS is still
+# used, and rebuilt too (for changes made with raw SQL, which don't change the fragment version).
+# One process rebuilds at a time (a lock file next to the snapshot).
+
+MAGIC = b'CSTCAT01'
+VERSION = 1
+HEADER = struct.Struct('=8sIQd64sQQQQQQ')
+NONE = 0xFFFFFFFF
+# A process asks for at most one rebuild every REBUILD_SECONDS (a bulk import changes the catalog a lot)
+REBUILD_SECONDS = 10
+
+# Fields of the rows, stored as uint32; the TEXT_FIELDS are string numbers (NONE: no string)
+SONG_FIELDS = ('song_id', 'user_id', 'genre_id', 'release_date', 'duration_ms', 'flagged',
+               'title', 'singer', 'genre', 'cover')
+ALBUM_FIELDS = ('album_id', 'user_id', 'release_date', 'flagged', 'title', 'genre', 'cover')
+TEXT_FIELDS = {'title', 'singer', 'genre', 'cover'}
+# Fields found by the search, like the SQL search of the listings
+SONG_SEARCHED = ('title', 'singer', 'genre')
+ALBUM_SEARCHED = ('title',)
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class SongRow:
+    __slots__ = SONG_FIELDS
+
+    # Length in seconds, like Songs.duration
+    @property
+    def duration(self):
+        return self.duration_ms / 1000
+
+
+class AlbumRow:
+    __slots__ = ALBUM_FIELDS + ('user',)
+
+
+# Function: Write the snapshot file out of the rows ([(field values...)] in SONG_FIELDS/ALBUM_FIELDS order)
+def write_snapshot(path, songs, albums, stamp, generation):
+    strings = {}
+    heap = bytearray()
+    string_offsets = array('I', [0])
+
+    def intern(text):
+        if text is None:
+            return NONE
+        number = strings.get(text)
+        if number is None:
+            number = strings[text] = len(string_offsets) - 1
+            heap.extend(text.encode('utf-8'))
+            string_offsets.append(len(heap))
+        return number
+
+    def columns(rows, fields):
+        values = [array('I') for _ in fields]
+        for row in rows:
+            for column, field, value in zip(values, fields, row):
+                column.append(intern(value) if field in TEXT_FIELDS else int(value or 0))
+        return values
+
+    def search_text(rows, fields, searched):
+        positions = [fields.index(field) for field in searched]
+        text = bytearray()
+        offsets = array('I', [0])
+        for row in rows:
+            for position in positions:
+                text.extend((row[position] or '').lower().replace('\n', ' ').encode('utf-8') + b'\n')
+            offsets.append(len(text))
+        return text, offsets
+
+    song_columns = columns(songs, SONG_FIELDS)
+    album_columns = columns(albums, ALBUM_FIELDS)
+    song_text, song_text_offsets = search_text(songs, SONG_FIELDS, SONG_SEARCHED)
+    album_text, album_text_offsets = search_text(albums, ALBUM_FIELDS, ALBUM_SEARCHED)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    with open(temp_path, 'wb') as snapshot_file:
+        snapshot_file.write(HEADER.pack(MAGIC, VERSION, generation, time.time(), stamp.encode()[:64],
+                                        len(songs), len(albums), len(string_offsets) - 1, len(heap),
+                                        len(song_text), len(album_text)))
+        for section in (*song_columns, *album_columns, string_offsets, song_text_offsets, album_text_offsets,
+                        heap, song_text, album_text):
+            snapshot_file.write(b'\0' * (_align(snapshot_file.tell()) - snapshot_file.tell()))
+            snapshot_file.write(section)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(temp_path, path)
+
+
+# Class: A read-only view of a snapshot file, mapped into memory
+class CatalogSnapshot:
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(path, 'rb') as snapshot_file:
+            self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(snapshot_file.fileno())
+        self.identity = (stat.st_ino, stat.st_mtime_ns)
+        self.size = stat.st_size
+
+        (magic, version, self.generation, self.built_at, stamp, self.song_count, self.album_count,
+         string_count, heap_size, song_text_size, album_text_size) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a compatible catalog snapshot")
+        self.stamp = stamp.rstrip(b'\0').decode()
+
+        view = memoryview(self._mmap)
+        offset = HEADER.size
+
+        # Function: The next section: a uint32 column (a view of the mapped file, nothing is copied),
+        # or for the bytes sections, their (start, size) in the file
+        def section(length, column=True):
+            nonlocal offset
+            start = _align(offset)
+            offset = start + length * (4 if column else 1)
+            return view[start:offset].cast('I') if column else (start, length)
+
+        self.songs = {field: section(self.song_count) for field in SONG_FIELDS}
+        self.albums = {field: section(self.album_count) for field in ALBUM_FIELDS}
+        self._string_offsets = section(string_count + 1)
+        self._song_text_offsets = section(self.song_count + 1)
+        self._album_text_offsets = section(self.album_count + 1)
+        self._heap_start, _ = section(heap_size, column=False)
+        self._song_text = section(song_text_size, column=False)
+        self._album_text = section(album_text_size, column=False)
+
+    def _string(self, number):
+        if number == NONE:
+            return None
+        return self._mmap[self._heap_start + self._string_offsets[number]:
+                          self._heap_start + self._string_offsets[number + 1]].decode('utf-8')
+
+    def _row(self, row_class, columns, index):
+        row = row_class()
+        for field, column in columns.items():
+            value = column[index]
+            if field in TEXT_FIELDS:
+                value = self._string(value)
+            elif field == 'flagged':
+                value = bool(value)
+            setattr(row, field, value)
+        return row
+
+    def song(self, index):
+        return self._row(SongRow, self.songs, index)
+
+    def album(self, index):
+        return self._row(AlbumRow, self.albums, index)
+
+    # Function: {song_id: SongRow} of the songs in the snapshot
+    def songs_by_id(self, song_ids):
+        column = self.songs['song_id']
+        found = {}
+        for song_id in set(song_ids):
+            index = bisect_left(column, song_id)
+            if index < self.song_count and column[index] == song_id:
+                found[song_id] = self.song(index)
+        return found
+
+    # Function: Every song (by song_id), read from the file as the listing iterates
+    def all_songs(self):
+        return Rows(self.song, self.song_count)
+
+    def all_albums(self):
+        return Rows(self.album, self.album_count)
+
+    # Function: Indexes of the rows whose search text contains the (lowercased) query
+    def _search(self, text, offsets, query):
+        start, size = text
+        needle = query.lower().replace('\n', ' ').encode('utf-8')
+        indexes = []
+        position, end = start, start + size
+        while needle:
+            found = self._mmap.find(needle, position, end)
+            if found < 0:
+                break
+            index = bisect_right(offsets, found - start) - 1
+            indexes.append(index)
+            position = start + offsets[index + 1]
+        return indexes
+
+    # Function: Songs whose title, singer or genre contains the query (case-insensitive), by song_id
+    def search_songs(self, query):
+        return [self.song(index) for index in self._search(self._song_text, self._song_text_offsets, query)]
+
+    # Function: Albums whose title contains the query (case-insensitive), by album_id
+    def search_albums(self, query):
+        return [self.album(index) for index in self._search(self._album_text, self._album_text_offsets, query)]
+
+
+# The rows of a snapshot, read on iteration: a listing whose fragment is cached never decodes them
+class Rows:
+    def __init__(self, read, count):
+        self._read = read
+        self._count = count
+
+    def __iter__(self):
+        return (self._read(index) for index in range(self._count))
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+
+# ------------------------------ Building
+def snapshot_path():
+    return (current_app.config.get('CATALOG_SNAPSHOT_PATH')
+            or os.path.join(current_app.instance_path, 'catalog.snapshot'))
+
+
+def _read_header(path):
+    try:
+        with open(path, 'rb') as snapshot_file:
+            magic, version, generation, built_at, stamp, *_ = HEADER.unpack(snapshot_file.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    if magic != MAGIC or version != VERSION:
+        return None
+    return generation, built_at, stamp.rstrip(b'\0').decode()
+
+
+# Function: Build the snapshot from the tables, returns its generation
+def build(path):
+    # The stamp is read before the rows: a change committed during the build makes the snapshot stale
+    stamp = fragment_version('catalog')
+    header = _read_header(path)
+    generation = header[0] + 1 if header is not None else 1
+    try:
+        songs = db.session.execute(select(Songs.song_id, Songs.user_id, Songs.genre_id, Songs.release_date,
+                                          Songs.duration_ms, Songs.flagged, Songs.title, Songs.singer,
+                                          Genres.name, Songs.cover)
+                                   .join(Genres, Genres.genre_id == Songs.genre_id)
+                                   .order_by(Songs.song_id)).all()
+        albums = db.session.execute(select(Albums.album_id, Albums.user_id, Albums.release_date, Albums.flagged,
+                                           Albums.title, Albums.genre, Albums.cover)
+                                    .order_by(Albums.album_id)).all()
+    finally:
+        db.session.close()
+    write_snapshot(path, songs, albums, stamp, generation)
+    logger.info("Catalog snapshot generation %s built with %s songs and %s albums", generation,
+                len(songs), len(albums))
+    return generation
+
+
+# Function: Background job: rebuild the snapshot, unless another process is doing it or just did
+def _rebuild(path):
+    lock_file = open(f"{path}.lock", 'w')
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+        header = _read_header(path)
+        if header is not None and header[2] == fragment_version('catalog') \
+                and time.time() - header[1] < current_app.config['CATALOG_SNAPSHOT_SECONDS']:
+            return
+        build(path)
+    finally:
+        lock_file.close()
+
+
+# ------------------------------ Per-process access to the shared snapshot
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_rebuild_requested_at = 0
+
+
+def _request_rebuild(path):
+    global _rebuild_requested_at
+    now = time.monotonic()
+    with _snapshot_lock:
+        if now - _rebuild_requested_at < REBUILD_SECONDS:
+            return
+        _rebuild_requested_at = now
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    jobs.enqueue(current_app._get_current_object(), _rebuild, path)
+
+
+# Function: The mapped snapshot, or None when there is none or it is stale (the callers query the database)
+def get_snapshot():
+    global _snapshot
+    path = snapshot_path()
+    stamp = fragment_version('catalog')
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        stat = None
+
+    with _snapshot_lock:
+        if stat is None:
+            _snapshot = None
+        elif _snapshot is None or (stat.st_ino, stat.st_mtime_ns) != _snapshot.identity:
+            # A new generation: the previous mapping goes away with the last row read from it
+            try:
+                _snapshot = CatalogSnapshot(path)
+            except (OSError, ValueError) as error:
+                logger.error("Could not map the catalog snapshot: %s", error)
+                _snapshot = None
+        snapshot = _snapshot
+
+    if snapshot is None or snapshot.stamp != stamp:
+        _request_rebuild(path)
+        return None
+    if time.time() - snapshot.built_at > current_app.config['CATALOG_SNAPSHOT_SECONDS']:
+        _request_rebuild(path)
+    return snapshot
+
+
+# ------------------------------ Memory of the workers
+# Function: Resident memory of this process, all of it and of the snapshot mapping (Linux, from /proc)
+# [({"pid": ..., "kind": "rss" | "pss" | "snapshot_rss" | "snapshot_pss"}, bytes), ...]
+# PSS splits the pages shared by several processes between them: the snapshot's PSS of a worker
+# goes down as more workers map the same file.
+def memory_usage():
+    totals = {'rss': 0, 'pss': 0, 'snapshot_rss': 0, 'snapshot_pss': 0}
+    mapped = _snapshot.path if _snapshot is not None else None
+    try:
+        with open('/proc/self/smaps') as smaps:
+            in_snapshot = False
+            for line in smaps:
+                key, _, value = line.partition(':')
+                if ' ' in key or not value.strip().endswith('kB'):
+                    # A mapping's first line: "address perms offset dev inode path"
+                    fields = line.split(None, 5)
+                    in_snapshot = mapped is not None and len(fields) == 6 and fields[5].strip() == mapped
+                    continue
+                if key in ('Rss', 'Pss'):
+                    kilobytes = int(value.split()[0])
+                    totals[key.lower()] += kilobytes * 1024
+                    if in_snapshot:
+                        totals['snapshot_' + key.lower()] += kilobytes * 1024
+    except OSError:
+        return []
+    pid = os.getpid()
+    return [({'pid': pid, 'kind': kind}, value) for kind, value in totals.items()]
+
+
+metrics.gauge_callback('cassette_process_memory_bytes', memory_usage)
@@ -0,0 +1,233 @@
+import os
+from datetime import datetime
+import click
+from sqlalchemy import inspect
+from werkzeug.security import generate_password_hash
+from .controllers import similarity_index_path
+from .database import db
+from .models import Users, Songs, SongFeatures
+
+
+# ------------------------------ CLI commands
+# Schema and seeding are explicit steps now, instead of running on every start-up:
+#     flask init-db                  create the tables (new database) or run the migrations
+#     flask seed-admin               create the Admin account (password from ADMIN_PASSWORD)
+#     flask db ...                   Flask-Migrate, imported only when one of its commands runs
+#     flask extract-features         audio features for songs uploaded before the extractor
+#     flask build-similarity-index   rebuild the shared "sounds like" index
+#     flask reconcile-stats          recompute the dashboard counters from the tables
+#     flask import-catalog <dir>     import a directory of MP3 files (tags, covers) as songs and albums
+#     flask stream-server            async server for the audio streams and play events
+#     flask cache-server             in-memory Redis-protocol server for CACHE_BACKEND=redis
+#     flask serve                    production server: worker processes with a pool of threads each
+
+ADMIN_EMAIL = "admin@cassette.com"
+BASELINE_REVISION = '0c4586766247'
+
+
+# Function: Initialize Flask-Migrate (alembic is slow to import, so only the commands that need it do)
+def init_migrate(app):
+    if 'migrate' not in app.extensions:
+        from flask_migrate import Migrate
+        # Batch mode, so that ALTERs also work on SQLite
+        Migrate(app, db, render_as_batch=True)
+
+
+# The "flask db" group of Flask-Migrate, loaded on first use
+class MigrateCommands(click.Group):
+    def __init__(self, app):
+        super().__init__('db', help='Perform database migrations.')
+        self.app = app
+
+    def _migrate_commands(self):
+        init_migrate(self.app)
+        from flask_migrate.cli import db as migrate_commands
+        return migrate_commands
+
+    def list_commands(self, ctx):
+        return self._migrate_commands().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._migrate_commands().get_command(ctx, name)
+
+
+# Function: Whether every table and column of the models is already in the database
+def schema_is_current():
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            return False
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        if not set(table.columns.keys()) <= existing_columns:
+            return False
+    return True
+
+
+# Function: Create (new database) or upgrade (existing one) the schema
+def init_db(app):
+    init_migrate(app)
+    from flask_migrate import stamp, upgrade
+
+    inspector = inspect(db.engine)
+    if not inspector.has_table('users'):
+        db.create_all()
+        stamp()
+        return 'created'
+    if not inspector.has_table('alembic_version'):
+        # Database from before the migrations: mark what it already has, then migrate the rest
+        if schema_is_current():
+            stamp()
+            return 'stamped'
+        stamp(revision=BASELINE_REVISION)
+    upgrade()
+    return 'upgraded'
+
+
+# Function: Create the Admin account, if it is not there already
+# Also, Admin has access to most of the pages
+def seed_admin(password):
+    if Users.query.filter_by(email=ADMIN_EMAIL).first():
+        return False
+    try:
+        db.session.add(Users(name="Admin",
+                             email=ADMIN_EMAIL,
+                             password=generate_password_hash(password),
+                             created_at=datetime.now(),
+                             role=0))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+    return True
+
+
+def register_commands(app):
+    app.cli.add_command(MigrateCommands(app))
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create the tables of a new database, or run the migrations of an existing one."""
+        result = init_db(app)
+        print(f"Database {result}: {db.engine.url.render_as_string(hide_password=True)}")
+
+    @app.cli.command('seed-admin')
+    @click.option('--password', default=lambda: os.getenv('ADMIN_PASSWORD'),
+                  help='Admin password (defaults to ADMIN_PASSWORD)')
+    def seed_admin_command(password):
+        """Create the Admin account."""
+        if not password:
+            raise click.UsageError('Set ADMIN_PASSWORD or pass --password')
+        if seed_admin(password):
+            print(f"Admin account created: {ADMIN_EMAIL}")
+        else:
+            print(f"Admin account already exists: {ADMIN_EMAIL}")
+
+    @app.cli.command('extract-features')
+    def extract_features_command():
+        """Extract the audio features of the songs uploaded before the feature extractor."""
+        from . import audio_features, similarity
+        missing = (db.session.query(Songs.song_id)
+                   .outerjoin(SongFeatures, SongFeatures.song_id == Songs.song_id)
+                   .filter(SongFeatures.song_id == None)
+                   .all())
+        extracted = 0
+        for (song_id,) in missing:
+            if audio_features.store_song_features(song_id) is not None:
+                extracted += 1
+        print(f"Extracted features for {extracted} of {len(missing)} songs")
+        similarity.rebuild_index(similarity_index_path())
+
+    @app.cli.command('build-similarity-index')
+    def build_similarity_index_command():
+        """Rebuild the shared "sounds like" index file."""
+        from . import similarity
+        count = similarity.rebuild_index(similarity_index_path())
+        print(f"Similarity index rebuilt with {count} songs: {similarity_index_path()}")
+
+    @app.cli.command('reconcile-stats')
+    def reconcile_stats_command():
+        """Recompute the dashboard counters from the tables, fixing any drift."""
+        from . import stats
+        wrong = stats.reconcile()
+        print(f"Dashboard counters reconciled, {wrong} had drifted")
+
+    @app.cli.command('rebuild-trending')
+    def rebuild_trending_command():
+        """Recompute the trending scores from the recent plays."""
+        from . import trending
+        count = trending.rebuild()
+        print(f"Trending scores rebuilt for {count} songs")
+
+    @app.cli.command('build-catalog-snapshot')
+    def build_catalog_snapshot_command():
+        """Rebuild the catalog snapshot file shared by the workers."""
+        from . import catalog_snapshot
+        generation = catalog_snapshot.build(catalog_snapshot.snapshot_path())
+        print(f"Catalog snapshot generation {generation} written: {catalog_snapshot.snapshot_path()}")
+
+    @app.cli.command('import-catalog')
+    @click.argument('directory', type=click.Path(exists=True, file_okay=False))
+    @click.option('--creator', help='Email of the creator account that gets every song '
+                                    '(default: one account per artist)')
+    @click.option('--link', is_flag=True, help='Hard-link the files into static/audio/import instead of copying them')
+    @click.option('--workers', type=int, help='Processes reading the files (default: one per CPU)')
+    @click.option('--batch-size', default=500, type=int, help='Files per transaction')
+    def import_catalog_command(directory, creator, link, workers, batch_size):
+        """Import every MP3 file under a directory, with its tags and cover (run it again to resume)."""
+        from . import importer
+        creator_id = None
+        if creator:
+            user = Users.query.filter_by(email=creator).first()
+            if user is None or user.role != 2:
+                raise click.UsageError(f"No creator account with the email {creator}")
+            creator_id = user.user_id
+
+        def report(counts):
+            print(f"{counts['imported']} imported, {counts['skipped']} already there, {counts['failed']} failed")
+
+        counts = importer.import_catalog(directory, creator_id, link, workers, batch_size, report)
+        report(counts)
+        print(f"{counts['creators']} creator accounts and {counts['albums']} albums created. "
+              f"Run \"flask extract-features\" for the \"sounds like\" radio")
+
+    @app.cli.command('stream-server')
+    @click.option('--host', default='127.0.0.1', help='Interface to listen on')
+    @click.option('--port', default=8001, type=int, help='Port to listen on')
+    @click.option('--threads', default=16, type=int, help='Threads for the database and the play events')
+    def stream_server_command(host, port, threads):
+        """Serve the audio streams and play events with the asyncio server."""
+        from . import stream_server
+        stream_server.run(app, host, port, threads)
+
+    @app.cli.command('cache-server', with_appcontext=False)
+    @click.option('--host', default='127.0.0.1', help='Interface to listen on')
+    @click.option('--port', default=6380, type=int, help='Port to listen on')
+    @click.option('--password', envvar='CACHE_SERVER_PASSWORD', help='Password the clients must send (AUTH)')
+    @click.option('--max-keys', default=100000, type=int, help='Keys kept, the least recently used are evicted')
+    def cache_server_command(host, port, password, max_keys):
+        """Serve the shared caches with the in-memory Redis-protocol stand-in."""
+        from . import cache_server
+        cache_server.run(host, port, password, max_keys)
+
+    # No app context: the master forks the workers, which must not inherit one
+    @app.cli.command('serve', with_appcontext=False)
+    @click.option('--bind', help='host:port to listen on (SERVER_BIND)')
+    @click.option('--workers', type=int, help='Worker processes (SERVER_WORKERS)')
+    @click.option('--threads', type=int, help='Threads per worker (SERVER_THREADS)')
+    @click.option('--max-requests', type=int, help='Requests after which a worker is replaced, 0 never '
+                                                   '(SERVER_MAX_REQUESTS)')
+    def serve_command(bind, workers, threads, max_requests):
+        """Run the production server (SIGHUP reloads it, SIGTERM stops it gracefully)."""
+        from . import server
+        config = app.config
+        server.serve(app,
+                     bind or config['SERVER_BIND'],
+                     workers or config['SERVER_WORKERS'],
+                     threads or config['SERVER_THREADS'],
+                     max_requests=config['SERVER_MAX_REQUESTS'] if max_requests is None else max_requests,
+                     max_requests_jitter=config['SERVER_MAX_REQUESTS_JITTER'],
+                     graceful_timeout=config['SERVER_GRACEFUL_TIMEOUT'],
+                     timeout=config['SERVER_TIMEOUT'])
@@ -16,3 +16,57 @@ class Config:   # Configure database with app
     SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI')
     SQLALCHEMY_TRACK_MODIFICATIONS = os.getenv('SQLALCHEMY_TRACK_MODIFICATIONS')
     SECRET_KEY = os.getenv('SECRET_KEY')
+    # Shared, memory-mapped "sounds like" index (defaults to instance/similarity.idx)
+    SIMILARITY_INDEX_PATH = os.getenv('SIMILARITY_INDEX_PATH')
+    # Songs missing from the index (scanned exactly on every lookup) before it is rebuilt in the background
+    SIMILARITY_REBUILD_PENDING = int(os.getenv('SIMILARITY_REBUILD_PENDING', 500))
+    # Lifetime of the REST API tokens, in seconds (defaults to 7 days)
+    API_TOKEN_MAX_AGE = int(os.getenv('API_TOKEN_MAX_AGE', 7 * 24 * 3600))
+    # Blueprints to load, e.g. "playback,api" for a streaming-only node (defaults to all of them)
+    CASSETTE_BLUEPRINTS = os.getenv('CASSETTE_BLUEPRINTS', 'all')
+    # Statements slower than this (in milliseconds) are logged with their parameters and route
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+    # Logging (see application/logs.py): file, rotation, levels and sampling
+    LOG_FILE = os.getenv('LOG_FILE', 'debug.log')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    # e.g. "sqlalchemy.engine=INFO,werkzeug=WARNING"
+    LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+    # Fraction of the records kept, e.g. "cassette.streams=0.1"
+    LOG_SAMPLING = os.getenv('LOG_SAMPLING', 'cassette.streams=0.1')
+    # Spool directory of the /metrics snapshots, shared by the workers (defaults to instance/metrics)
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    # When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+    # Sampling profiler for the admins (see application/profiler.py), off by default
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+    # Where the workers exchange the profiles (defaults to instance/profiles)
+    PROFILES_DIR = os.getenv('PROFILES_DIR')
+    # The faceted browsing index of every process is rebuilt from the tables after this many seconds
+    # (see application/facets.py)
+    FACETS_REBUILD_SECONDS = int(os.getenv('FACETS_REBUILD_SECONDS', 300))
+    # A play counts half as much in the trending scores after this many hours (see application/trending.py)
+    TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 24))
+    # Catalog snapshot shared by the workers (see application/catalog_snapshot.py), defaults to
+    # instance/catalog.snapshot; it is also rebuilt when older than this many seconds
+    CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH')
+    CATALOG_SNAPSHOT_SECONDS = int(os.getenv('CATALOG_SNAPSHOT_SECONDS', 300))
+    # Dashboard counters recomputed from the tables in the background every this many seconds (0: never)
+    STATS_RECONCILE_SECONDS = int(os.getenv('STATS_RECONCILE_SECONDS', 24 * 3600))
+    # Shared caches (see application/cache.py): "local" (per process), "filesystem" or "redis", and
+    # CACHE_URL: the directory (defaults to instance/cache) or redis://host:port/db (defaults to the local Redis)
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'local')
+    CACHE_URL = os.getenv('CACHE_URL')
+    # Production server ("flask serve", see application/server.py): address, processes and threads.
+    # One process per CPU with one thread each was the fastest in benchmarks/workers.py (see README)
+    SERVER_BIND = os.getenv('SERVER_BIND', '127.0.0.1:8000')
+    SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', os.cpu_count() or 1))
+    SERVER_THREADS = int(os.getenv('SERVER_THREADS', 1))
+    # A worker is replaced after this many requests, plus up to the jitter (0: never)
+    SERVER_MAX_REQUESTS = int(os.getenv('SERVER_MAX_REQUESTS', 10000))
+    SERVER_MAX_REQUESTS_JITTER = int(os.getenv('SERVER_MAX_REQUESTS_JITTER', 1000))
+    # Seconds the requests in progress get to finish on a stop or a reload
+    SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))
+    # Seconds a worker thread waits for a stalled client before dropping the connection
+    SERVER_TIMEOUT = int(os.getenv('SERVER_TIMEOUT', 30))
@@ -0,0 +1,28 @@
+import os
+from flask import current_app, render_template
+from flask_login import current_user
+from .database import db
+from .models import Users
+
+
+# ------------------------------ Helpers shared by the blueprints and the CLI commands
+
+# Function: Path of the shared "sounds like" index file
+def similarity_index_path():
+    return (current_app.config.get('SIMILARITY_INDEX_PATH')
+            or os.path.join(current_app.instance_path, 'similarity.idx'))
+
+
+# Function: Error pages, registered on the app whatever blueprints are loaded
+def register_error_handlers(app):
+    # -------------------------------------Route for error code: 403
+    @app.errorhandler(403)
+    def not_authorized(e):
+        user = db.session.get(Users, current_user.user_id) if current_user.is_authenticated else None
+        return render_template('403.html',
+                               user=user), 403
+
+    # -------------------------------------Route for custom page_not_found error
+    @app.errorhandler(404)
+    def page_not_found(e):
+        return render_template('404.html'), 404
@@ -1,7 +1,12 @@
 from sqlalchemy.ext.declarative import declarative_base
 from flask_sqlalchemy import SQLAlchemy
+from flask_login import LoginManager
 
 
 engine = None
 Base = declarative_base()
 db = SQLAlchemy()
+
+# Login Manager, bound to the app in create_app()
+login_manager = LoginManager()
+login_manager.login_view = "auth.login"
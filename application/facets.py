@@ -0,0 +1,300 @@
+import logging
+import threading
+import time
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from .bitmaps import Bitmap
+from .database import db
+from .models import Genres, Songs, Users, Ratings
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Faceted browsing
+# An in-memory index of the songs (not flagged) by facet value, one compressed bitmap of song_ids
+# per value (see application/bitmaps.py):
+#     genre     genre_id
+#     year      release_date
+#     creator   user_id
+#     rating    rating band, the average rating of the song rounded (0 to 5, unrated songs have none)
+# A browse query ORs the values picked within a facet and ANDs the facets; the count of every value
+# is the size of its bitmap ANDed with the selection of the other facets (so picking a genre still
+# shows how many songs the other genres have).
+#
+# Every process builds its own index on the first browse, from one query on songs and one on ratings.
+# It is kept up to date incrementally:
+#     - songs and ratings changed by this process are re-read after their transaction commits
+#     - every CHECK_SECONDS, the songs updated (updated_at) and the ratings added (rating_id) since
+#       the last check are re-read, which picks up the changes of the other workers
+#     - a full rebuild every FACETS_REBUILD_SECONDS, or after bulk changes, drops what the checks
+#       can't see (songs and ratings deleted by other workers)
+# This module (and NumPy) is only imported by the first browse of a worker, which is also when its
+# ORM events start tracking the changes: there is no index to keep up to date before.
+
+FACETS = ('genre', 'year', 'creator', 'rating')
+CHECK_SECONDS = 5
+# Values listed per facet, the most common first
+MAX_VALUES = {'genre': 50, 'year': 100, 'creator': 50, 'rating': 6}
+NONE = -1
+
+
+class FacetIndex:
+    def __init__(self):
+        self.bitmaps = {facet: {} for facet in FACETS}      # facet: {value: Bitmap}
+        self.columns = {facet: np.full(0, NONE, dtype=np.int64) for facet in FACETS}   # facet: value by song_id
+        self.all = Bitmap()
+        self.built_at = time.monotonic()
+        self.checked_at = self.built_at
+        self.songs_watermark = None         # largest songs.updated_at seen
+        self.ratings_watermark = 0          # largest ratings.rating_id seen
+
+    # Function: Index of every song, from the tables
+    @classmethod
+    def build(cls):
+        index = cls()
+        index.songs_watermark, index.ratings_watermark = db.session.execute(
+            select(select(func.max(Songs.updated_at)).scalar_subquery(),
+                   select(func.max(Ratings.rating_id)).scalar_subquery())).one()
+        index.ratings_watermark = index.ratings_watermark or 0
+        rows = db.session.execute(select(Songs.song_id, Songs.genre_id, Songs.release_date, Songs.user_id)
+                                  .where(Songs.flagged == False)).all()
+        if not rows:
+            return index
+        song_ids, genres, years, creators = (np.array(column, dtype=np.int64) for column in zip(*rows))
+        index._grow(int(song_ids.max()))
+        bands = index.columns['rating']
+        for song_id, average in db.session.execute(select(Ratings.song_id, func.avg(Ratings.rating))
+                                                   .group_by(Ratings.song_id)):
+            if song_id < len(bands):
+                bands[song_id] = _band(average)
+
+        for facet, values in (('genre', genres), ('year', years), ('creator', creators),
+                              ('rating', bands[song_ids])):
+            index.columns[facet][song_ids] = values
+            order = np.argsort(values, kind='stable')
+            ordered_ids, ordered_values = song_ids[order], values[order]
+            for group in np.split(np.arange(len(order)), np.flatnonzero(np.diff(ordered_values)) + 1):
+                value = int(ordered_values[group[0]])
+                if value != NONE:
+                    index.bitmaps[facet][value] = Bitmap.from_ids(ordered_ids[group])
+        # Ratings of flagged songs are not indexed
+        bands[np.setdiff1d(np.arange(len(bands)), song_ids)] = NONE
+        index.all = Bitmap.from_ids(song_ids)
+        return index
+
+    def _grow(self, song_id):
+        size = len(self.columns['genre'])
+        if song_id >= size:
+            grown = max(song_id + 1, size * 2)
+            for facet in FACETS:
+                column = np.full(grown, NONE, dtype=np.int64)
+                column[:size] = self.columns[facet]
+                self.columns[facet] = column
+
+    # Function: Set (or remove, with values None) the facet values of one song
+    def set_song(self, song_id, values):
+        self._grow(song_id)
+        for facet in FACETS:
+            old = int(self.columns[facet][song_id])
+            new = values[facet] if values is not None else NONE
+            new = NONE if new is None else int(new)
+            if old == new:
+                continue
+            if old != NONE:
+                bitmap = self.bitmaps[facet][old]
+                bitmap.discard(song_id)
+                if not bitmap:
+                    del self.bitmaps[facet][old]
+            if new != NONE:
+                self.bitmaps[facet].setdefault(new, Bitmap()).add(song_id)
+            self.columns[facet][song_id] = new
+        if values is not None:
+            self.all.add(song_id)
+        else:
+            self.all.discard(song_id)
+
+    # Function: Re-read the facet values of some songs from the tables
+    def refresh(self, song_ids):
+        song_ids = sorted(song_ids)
+        for start in range(0, len(song_ids), 500):
+            chunk = song_ids[start:start + 500]
+            songs = {song_id: (genre_id, year, user_id) for song_id, genre_id, year, user_id, flagged in
+                     db.session.execute(select(Songs.song_id, Songs.genre_id, Songs.release_date, Songs.user_id,
+                                               Songs.flagged).where(Songs.song_id.in_(chunk)))
+                     if not flagged}
+            averages = dict(db.session.execute(select(Ratings.song_id, func.avg(Ratings.rating))
+                                               .where(Ratings.song_id.in_(list(songs)))
+                                               .group_by(Ratings.song_id)).all()) if songs else {}
+            for song_id in chunk:
+                if song_id not in songs:
+                    self.set_song(song_id, None)
+                    continue
+                genre_id, year, user_id = songs[song_id]
+                self.set_song(song_id, {'genre': genre_id, 'year': year, 'creator': user_id,
+                                        'rating': _band(averages[song_id]) if song_id in averages else None})
+
+    # Function: The songs changed by the other processes since the last check
+    def changed_songs(self):
+        song_ids = set()
+        if self.songs_watermark is not None:
+            rows = db.session.execute(select(Songs.song_id, Songs.updated_at)
+                                      .where(Songs.updated_at > self.songs_watermark)).all()
+            song_ids.update(song_id for song_id, _ in rows)
+            self.songs_watermark = max([self.songs_watermark] + [updated_at for _, updated_at in rows])
+        else:
+            self.songs_watermark = db.session.execute(select(func.max(Songs.updated_at))).scalar()
+            if self.songs_watermark is not None:
+                song_ids.update(db.session.execute(select(Songs.song_id)).scalars())
+        rows = db.session.execute(select(Ratings.rating_id, Ratings.song_id)
+                                  .where(Ratings.rating_id > self.ratings_watermark)).all()
+        song_ids.update(song_id for _, song_id in rows)
+        self.ratings_watermark = max([self.ratings_watermark] + [rating_id for rating_id, _ in rows])
+        return song_ids
+
+    # Function: Bitmap of the songs matching {facet: [values]} (values of a facet ORed, facets ANDed)
+    def select(self, filters, skip=None):
+        selection = None
+        for facet, values in filters.items():
+            if facet == skip or not values:
+                continue
+            matching = Bitmap.union(self.bitmaps[facet][value] for value in values if value in self.bitmaps[facet])
+            selection = matching if selection is None else selection & matching
+        return selection
+
+    # Function: {facet: [(value, count), ...]} for the songs matching the filters of the other facets
+    def counts(self, filters):
+        counts = {}
+        for facet in FACETS:
+            base = self.select(filters, skip=facet)
+            if base is None:
+                values = [(value, len(bitmap)) for value, bitmap in self.bitmaps[facet].items()]
+            else:
+                # The facet's value of every song of the selection, counted
+                column = self.columns[facet][base.to_array()]
+                found, found_counts = np.unique(column[column != NONE], return_counts=True)
+                values = list(zip(found.tolist(), found_counts.tolist()))
+            values.sort(key=lambda item: (-item[1], item[0]))
+            counts[facet] = values[:MAX_VALUES[facet]]
+        return counts
+
+
+# Function: Rating band of an average rating (half up: 3.5 is in band 4)
+def _band(average):
+    return min(max(int(float(average) + 0.5), 0), 5)
+
+
+# ------------------------------ Per-process index
+_index = None
+_index_lock = threading.Lock()
+_dirty = set()          # song_ids changed by this process, re-read on the next browse
+_stale = False          # bulk changes by this process: rebuild on the next browse
+
+
+# Function: The index of this process, built or brought up to date first
+def get_index():
+    global _index, _stale
+    now = time.monotonic()
+    with _index_lock:
+        if _index is None or _stale or now - _index.built_at > current_app.config['FACETS_REBUILD_SECONDS']:
+            started = time.perf_counter()
+            _stale = False
+            _dirty.clear()
+            _index = FacetIndex.build()
+            logger.info("Facet index built with %s songs in %.0f ms", len(_index.all),
+                        (time.perf_counter() - started) * 1000)
+        elif _dirty or now - _index.checked_at > CHECK_SECONDS:
+            song_ids = set(_dirty)
+            _dirty.clear()
+            if now - _index.checked_at > CHECK_SECONDS:
+                _index.checked_at = now
+                song_ids |= _index.changed_songs()
+            if song_ids:
+                _index.refresh(song_ids)
+        return _index
+
+
+# Function: Songs matching the filters (newest first, below the cursor) and the counts of every facet value
+# filters: {facet: [values]}, returns (song_ids, total, counts, next_cursor)
+def browse(filters, limit=50, before=None):
+    index = get_index()
+    with _index_lock:
+        selection = index.select(filters)
+        if selection is None:
+            selection = index.all
+        song_ids = selection.last(limit + 1, before)
+        next_cursor = song_ids[limit - 1] if len(song_ids) > limit else None
+        return song_ids[:limit], len(selection), index.counts(filters), next_cursor
+
+
+# Function: {facet: [values]} from the query string, e.g. ?genre=3&genre=5&rating=4
+def filters_from_args(args):
+    filters = {}
+    for facet in FACETS:
+        values = []
+        for value in args.getlist(facet):
+            try:
+                values.append(int(value))
+            except ValueError:
+                continue
+        if values:
+            filters[facet] = values
+    return filters
+
+
+# Function: Display names of the counted values, {facet: {value: label}}
+def labels(counts):
+    genre_ids = [value for value, _ in counts['genre']]
+    creator_ids = [value for value, _ in counts['creator']]
+    genres = dict(db.session.execute(select(Genres.genre_id, Genres.name)
+                                     .where(Genres.genre_id.in_(genre_ids))).all()) if genre_ids else {}
+    creators = dict(db.session.execute(select(Users.user_id, Users.name)
+                                       .where(Users.user_id.in_(creator_ids))).all()) if creator_ids else {}
+    return {'genre': genres,
+            'year': {value: str(value) for value, _ in counts['year']},
+            'creator': creators,
+            'rating': {value: f"{value} ★" for value, _ in counts['rating']}}
+
+
+# ------------------------------ Changes of this process
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    song_ids = set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, Songs):
+            song_ids.add(instance.song_id)
+        elif isinstance(instance, Ratings):
+            song_ids.add(instance.song_id)
+    song_ids.discard(None)
+    if song_ids:
+        session.info.setdefault('facet_songs', set()).update(song_ids)
+
+
+# Bulk deletes and updates of songs and ratings can't tell which songs they touch
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.class_ in (Songs, Ratings):
+            orm_execute_state.session.info['facets_stale'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    global _stale
+    song_ids = session.info.pop('facet_songs', None)
+    stale = session.info.pop('facets_stale', None)
+    if _index is None or not (song_ids or stale):
+        return
+    with _index_lock:
+        if stale:
+            _stale = True
+        elif song_ids:
+            _dirty.update(song_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('facet_songs', None)
+    session.info.pop('facets_stale', None)
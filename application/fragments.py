@@ -0,0 +1,143 @@
+import logging
+import os
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .cache import SharedCache, invalidate_tags, tag_versions
+from .http_cache import build_stamp
+from .models import Users, Songs, Albums, AlbumSong, Playlists, Queue, Ratings
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Template fragment cache
+# Expensive template components are wrapped in a cache block, keyed by what they show:
+#
+#     {% cache 'playlists_column', current_user.user_id, fragment_version('playlists-' ~ current_user.user_id) %}
+#         ...
+#     {% endcache %}
+#
+# The body is only rendered (and the lazy queries it iterates only run) on a miss.
+# Every key also has the stamp of the build (templates and static files, see application/http_cache.py):
+# a fragment rendered by a previous deployment, with its old markup and static URLs, is never served.
+# Rendered fragments are kept in the "fragments" shared cache (see application/cache.py), shared by all
+# the users, so a catalog-wide fragment keyed only by fragment_version('catalog') is rendered once per
+# process, or once for every node with a shared CACHE_BACKEND.
+#
+# Version stamps are the versions of the cache tags of the same names: committing a change to the models
+# below invalidates the tags, which changes the stamps in every worker at once (on the machine with the
+# local backend, on every node with a shared one), and drops the other cached values tagged with them
+# (e.g. the search results). Names:
+#     catalog            songs and albums
+#     ratings            the ratings of the songs
+#     playlists-<id>     the playlists of a user (and the user's name, shown on them)
+#     queue-<id>         the play queue of a user
+#     playlists, queue   bulk changes, which can't tell which user they touch
+
+FRAGMENT_CACHE_SIZE = 512
+FRAGMENT_TTL = 3600
+
+_fragments = SharedCache('fragments', maxsize=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_TTL)
+
+
+# Function: Stamp of one or more version names (e.g. fragment_version('catalog'))
+def fragment_version(*names):
+    versions = tag_versions(*names)
+    if versions is None:
+        # Tag store unreachable: a stamp nothing was cached under, so the fragment is rendered
+        return os.urandom(6).hex()
+    return '-'.join(versions)
+
+
+# Function: Give new stamps to version names, dropping every fragment keyed by them
+def bump(*names):
+    invalidate_tags(*names)
+
+
+# Function: Mark version names as changed by the current transaction (bumped once it commits)
+def changed(session, *names):
+    session.info.setdefault('fragment_versions', set()).update(names)
+
+
+def clear():
+    _fragments.clear()
+
+
+# {% cache key, ... %} ... {% endcache %}
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cached_fragment', [nodes.List(key_parts)]),
+                               [], [], body).set_lineno(lineno)
+
+    def _cached_fragment(self, key_parts, caller):
+        key = (build_stamp(),) + tuple(repr(part) for part in key_parts)
+        return Markup(_fragments.get_or_set(key, lambda: str(caller())))
+
+
+def init_app(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.globals['fragment_version'] = fragment_version
+
+
+# ------------------------------ Version bumps from the ORM
+def _names_for(instance):
+    if isinstance(instance, (Songs, Albums, AlbumSong)):
+        return ('catalog',)
+    if isinstance(instance, Ratings):
+        return ('ratings',)
+    if isinstance(instance, Playlists):
+        return (f'playlists-{instance.user_id}',)
+    if isinstance(instance, Queue):
+        return (f'queue-{instance.user_id}',)
+    if isinstance(instance, Users):
+        return (f'playlists-{instance.user_id}',)
+    return ()
+
+
+_BULK_NAMES = {Songs: 'catalog', Albums: 'catalog', AlbumSong: 'catalog', Ratings: 'ratings',
+               Playlists: 'playlists', Queue: 'queue', Users: 'playlists'}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    names = set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        names.update(_names_for(instance))
+    if names:
+        changed(session, *names)
+
+
+# Query(...).update()/.delete() and the like don't go through the flush.
+# The play queue marks the user it changes itself (see application/play_queue.py), so its bulk
+# statements don't invalidate the queues of all the users.
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        name = _BULK_NAMES.get(mapper.class_) if mapper is not None else None
+        marked = orm_execute_state.session.info.get('fragment_versions', ())
+        if name == 'queue' and any(marked_name.startswith('queue-') for marked_name in marked):
+            return
+        if name:
+            changed(orm_execute_state.session, name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed(session):
+    names = session.info.pop('fragment_versions', None)
+    if names:
+        bump(*names)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('fragment_versions', None)
@@ -0,0 +1,135 @@
+import hashlib
+import os
+from datetime import timezone
+from functools import wraps
+from flask import current_app, request, session, url_for
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+
+# ------------------------------ Conditional GETs of pages
+# The public pages (all albums, all playlists, an album, a profile) are the same until one of the
+# rows they show changes. Their routes are wrapped in @conditional_page(validators), where
+# validators(**view_args) returns (last_modified, parts):
+#     last_modified   the max updated_at of the rows on the page (naive UTC), or None
+#     parts           anything else the page depends on (row counts, ...), for the ETag
+#
+# The ETag also covers the logged-in user (the header shows their name, role and theme) and the
+# build (templates and static files), so the responses are "private": browsers keep them, shared
+# caches don't.
+# A browser revalidating a page it has (If-None-Match / If-Modified-Since) gets a 304 without the
+# page being rendered. Pages with flashed messages pending are rendered as usual.
+
+PAGE_CACHE_CONTROL = 'private, no-cache'
+
+
+def conditional_page(validators):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            last_modified, parts = validators(**kwargs)
+            if last_modified is not None:
+                last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+            etag = _page_etag(last_modified, parts)
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = PAGE_CACHE_CONTROL
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
+
+
+def _page_etag(last_modified, parts):
+    if current_user.is_authenticated:
+        user = (current_user.user_id, current_user.name, current_user.role, current_user.dark_mode)
+    else:
+        user = None
+    key = repr((request.endpoint, last_modified, parts, user, build_stamp()))
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+_build_stamps = {}
+# Folders of static/ holding the songs and covers: named by their content, they are not part of a build
+MEDIA_FOLDERS = ('audio', 'covers')
+
+
+# Function: Stamp of the templates and the static files (the build), computed once per process
+# A deployment changing either changes every ETag and every cached fragment (see application/fragments.py),
+# which embed the fingerprinted static URLs. It only depends on the contents, so the nodes of a build agree.
+def build_stamp():
+    template_folder = os.path.join(current_app.root_path, current_app.template_folder)
+    if template_folder not in _build_stamps:
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(template_folder)):
+            with open(os.path.join(template_folder, name), 'rb') as template_file:
+                digest.update(f"{name}:".encode() + hashlib.md5(template_file.read(), usedforsecurity=False).digest())
+        for directory, folders, filenames in os.walk(current_app.static_folder):
+            # Walked in a set order, without the media folders
+            folders[:] = sorted(folder for folder in folders
+                                if directory != current_app.static_folder or folder not in MEDIA_FOLDERS)
+            for name in sorted(filenames):
+                filename = os.path.relpath(os.path.join(directory, name), current_app.static_folder)
+                digest.update(f"{filename}:{fingerprint(filename)};".encode())
+        _build_stamps[template_folder] = digest.hexdigest()[:16]
+    return _build_stamps[template_folder]
+
+
+# ------------------------------ Fingerprinted static files
+# Templates link the files of static/ with {{ static_url('js/graphs.js') }}, which adds a hash of
+# the file's content to the URL (/static/js/graphs.js?v=3f1a9c2d7e41). A fingerprinted URL always
+# serves the same bytes, so its response is cacheable for a year by browsers and proxies alike
+# ("immutable": not even revalidated on reload). Changing a file changes its URL.
+
+STATIC_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_fingerprints = {}
+
+
+# Function: Content hash of a file in static/ (None when it doesn't exist)
+def fingerprint(filename):
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _fingerprints:
+        digest = hashlib.md5(usedforsecurity=False)
+        with open(path, 'rb') as static_file:
+            for chunk in iter(lambda: static_file.read(65536), b''):
+                digest.update(chunk)
+        _fingerprints[key] = digest.hexdigest()[:12]
+    return _fingerprints[key]
+
+
+def static_url(filename):
+    version = fingerprint(filename)
+    if version is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=version)
+
+
+def _immutable_static(response):
+    if (request.endpoint == 'static' and response.status_code == 200
+            and request.args.get('v') is not None
+            and request.args.get('v') == fingerprint(request.view_args['filename'])):
+        response.headers['Cache-Control'] = STATIC_CACHE_CONTROL
+        response.expires = None
+    return response
+
+
+def init_app(app):
+    app.jinja_env.globals['static_url'] = static_url
+    app.after_request(_immutable_static)
@@ -0,0 +1,81 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from .cache import SharedCache
+from .database import db
+from .models import Users
+
+
+# ------------------------------ Identity cache
+# Flask-Login loads the logged-in user on every request, and most routes then fetch the same row
+# again with db.get_or_404(Users, current_user.user_id).
+# The column values of recently seen users are kept in the "identity" shared cache (see
+# application/cache.py): get_user() rebuilds the row from it and merges it into the session without a
+# query (load=False). The row is then in the session's identity map, so the routes' db.get_or_404()
+# doesn't query either.
+#
+# Any change to a user (role, blacklist, profile picture, dark mode, ...) drops its entry when flushed,
+# and again once committed (another request could have cached the old row in between). With a shared
+# CACHE_BACKEND that reaches every worker and node; with the local one, the short TTL bounds how long
+# the other worker processes can keep serving the old values.
+# The password hash is never cached: it is loaded from the database if something reads it.
+
+USER_CACHE_TTL = 30
+CACHED_COLUMNS = ('user_id', 'name', 'email', 'created_at', 'role', 'profile_pic', 'blacklist', 'dark_mode')
+
+_users = SharedCache('identity', maxsize=1024, ttl=USER_CACHE_TTL)
+
+
+def _remember(user):
+    _users.set(user.user_id, {column: getattr(user, column) for column in CACHED_COLUMNS})
+
+
+# Function: The Users row of user_id, from the cache when possible (None when the user doesn't exist)
+def get_user(user_id):
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+
+    # Already in this session (e.g. loaded earlier in the request)
+    user = db.session.identity_map.get(inspect(Users).identity_key_from_primary_key((user_id,)))
+    if user is not None:
+        return user
+
+    values = _users.get(user_id)
+    if values is None:
+        user = db.session.get(Users, user_id)
+        if user is not None:
+            _remember(user)
+        return user
+
+    user = Users(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate(user_id):
+    _users.delete(user_id)
+
+
+def clear():
+    _users.clear()
+
+
+@event.listens_for(Users, 'after_update')
+@event.listens_for(Users, 'after_delete')
+def _user_changed(mapper, connection, user):
+    invalidate(user.user_id)
+    session = inspect(user).session
+    if session is not None:
+        session.info.setdefault('identity_changed', set()).add(user.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for user_id in session.info.pop('identity_changed', ()):
+        invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('identity_changed', None)
@@ -0,0 +1,257 @@
+import hashlib
+import logging
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from .database import db
+from .models import Users, Songs, Albums, AlbumSong
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Catalog import
+# "flask import-catalog <dir>": every MP3 file under a directory becomes a song, with its ID3 tags
+# (title, artist, album, genre, year, lyrics) and embedded cover.
+#
+# A pool of processes hashes the files, reads their tags, copies (or hard-links) them into
+# static/audio/import/ and writes the covers, so the work is spread over the CPUs and disks.
+# This process only writes the rows, BATCH_SIZE files per transaction:
+#     Users       one creator account per artist (album artist, or artist), without a password,
+#                 unless --creator gives the account that gets every song
+#     Albums      one per artist and album title, with the genre, year and cover of its first song
+#     Songs       file_hash is the SHA-256 of the file
+#     AlbumSong   the songs of the albums
+# A file whose hash is already in "songs" is skipped, so the import can be run again on the same
+# directory (e.g. after it was interrupted): only the files that are missing are added.
+# The audio features of the "sounds like" radio are not extracted, run "flask extract-features" after.
+
+AUDIO_EXTENSIONS = ('.mp3',)
+AUDIO_DIR = 'static/audio/import'
+COVERS_DIR = 'static/covers/import'
+BATCH_SIZE = 500
+HASH_CHUNK = 1024 * 1024
+# Files handed to a worker process at once
+CHUNK_SIZE = 16
+IMAGE_EXTENSIONS = {'image/png': '.png', 'image/gif': '.gif'}
+UNKNOWN_ARTIST = 'Unknown Artist'
+UNKNOWN_GENRE = 'Unknown'
+ARTIST_EMAIL_DOMAIN = 'import.cassette'
+
+
+# Function: Paths of the audio files under a directory, in a stable order
+def scan(directory):
+    for root, directories, files in os.walk(directory):
+        directories.sort()
+        for name in sorted(files):
+            if name.lower().endswith(AUDIO_EXTENSIONS) and not name.startswith('.'):
+                yield os.path.join(root, name)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as audio_file:
+        while chunk := audio_file.read(HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Settings of the worker processes (set once per process, not sent with every file)
+_link = False
+_skip = frozenset()
+
+
+def _init_worker(link, skip):
+    global _link, _skip
+    _link, _skip = link, skip
+
+
+# Function: Text of the first frame with this id, or None
+def _tag(tags, frame_id):
+    frames = tags.getall(frame_id) if tags is not None else []
+    for frame in frames:
+        if frame_id == 'TCON':
+            values = frame.genres  # "(17)" is "Rock"
+        else:
+            values = frame.text if isinstance(frame.text, list) else [frame.text]
+        text = str(values[0]).strip() if values else ''
+        if text:
+            return text
+    return None
+
+
+def _year(value):
+    match = re.search(r'\d{4}', value or '')
+    return int(match.group()) if match else 0
+
+
+# Function: Copy the file into the storage directory (named by its hash), or hard-link it
+def store_file(path, digest, link):
+    stored_path = f"{AUDIO_DIR}/{digest[:2]}/{digest}.mp3"
+    if not os.path.exists(stored_path):
+        os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+        temporary_path = f"{stored_path}.{os.getpid()}.tmp"
+        try:
+            os.link(path, temporary_path) if link else shutil.copyfile(path, temporary_path)
+        except OSError:
+            # Other file system (or no hard links there): copied instead
+            shutil.copyfile(path, temporary_path)
+        os.replace(temporary_path, stored_path)
+    return stored_path
+
+
+# Function: Save the embedded cover (the same picture is stored once, for all the songs of an album)
+def store_cover(picture):
+    from .playback import make_cover_variants
+    digest = hashlib.sha256(picture.data).hexdigest()
+    cover_path = f"{COVERS_DIR}/{digest[:2]}/{digest}{IMAGE_EXTENSIONS.get(picture.mime, '.jpg')}"
+    if not os.path.exists(cover_path):
+        os.makedirs(os.path.dirname(cover_path), exist_ok=True)
+        temporary_path = f"{cover_path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'wb') as cover_file:
+            cover_file.write(picture.data)
+        os.replace(temporary_path, cover_path)
+        make_cover_variants(cover_path)
+    return cover_path
+
+
+# Function: Tags and stored paths of one file (runs in the worker processes)
+def read_file(path):
+    from mutagen.mp3 import MP3
+    try:
+        digest = file_hash(path)
+        if digest in _skip:
+            return {'path': path, 'hash': digest, 'skipped': True}
+        audio = MP3(path)
+        tags = audio.tags
+        pictures = tags.getall('APIC') if tags is not None else []
+        artist = _tag(tags, 'TPE1') or UNKNOWN_ARTIST
+        return {
+            'path': path,
+            'hash': digest,
+            'title': (_tag(tags, 'TIT2') or os.path.splitext(os.path.basename(path))[0])[:255],
+            'singer': artist,
+            'album_artist': _tag(tags, 'TPE2') or artist,
+            'album': _tag(tags, 'TALB'),
+            'genre': _tag(tags, 'TCON') or UNKNOWN_GENRE,
+            'year': _year(_tag(tags, 'TDRC') or _tag(tags, 'TYER')),
+            'lyrics': _tag(tags, 'USLT'),
+            'duration_ms': round(audio.info.length * 1000),
+            'cover': store_cover(pictures[0]) if pictures else None,
+            'file_path': store_file(path, digest, _link),
+        }
+    except Exception as error:
+        return {'path': path, 'error': f"{type(error).__name__}: {error}"}
+
+
+# Function: Email of the creator account of an artist (stable, so that a new run finds it again)
+def artist_email(name):
+    slug = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')[:40] or 'artist'
+    return f"{slug}-{hashlib.sha1(name.encode()).hexdigest()[:8]}@{ARTIST_EMAIL_DOMAIN}"
+
+
+class CatalogImport:
+    def __init__(self, creator_id=None):
+        self.creator_id = creator_id
+        self.creators = {}      # artist name: user_id
+        self.albums = {}        # (user_id, album title): album_id
+        self.counts = {'imported': 0, 'skipped': 0, 'failed': 0, 'creators': 0, 'albums': 0}
+
+    def _creator_ids(self, names):
+        missing = [name for name in names if name not in self.creators]
+        if not missing:
+            return
+        emails = {artist_email(name): name for name in missing}
+        for user_id, email in db.session.query(Users.user_id, Users.email).filter(Users.email.in_(emails)):
+            self.creators[emails.pop(email)] = user_id
+        new_users = {name: Users(name=name[:100], email=email, password='!', created_at=datetime.now(), role=2)
+                     for email, name in emails.items()}
+        if new_users:
+            db.session.add_all(new_users.values())
+            db.session.flush()
+            self.counts['creators'] += len(new_users)
+            self.creators.update({name: user.user_id for name, user in new_users.items()})
+
+    def _album_ids(self, songs):
+        wanted = {}
+        for song in songs:
+            if song['album'] and (song['user_id'], song['album']) not in self.albums:
+                wanted.setdefault((song['user_id'], song['album']), song)
+        if not wanted:
+            return
+        existing = (db.session.query(Albums.album_id, Albums.user_id, Albums.title)
+                    .filter(Albums.user_id.in_({user_id for user_id, _ in wanted}),
+                            Albums.title.in_({title for _, title in wanted})))
+        for album_id, user_id, title in existing:
+            if wanted.pop((user_id, title), None) is not None:
+                self.albums[(user_id, title)] = album_id
+        new_albums = {key: Albums(title=key[1], genre=song['genre'], cover=song['cover'], user_id=key[0],
+                                  release_date=song['year'])
+                      for key, song in wanted.items()}
+        if new_albums:
+            db.session.add_all(new_albums.values())
+            db.session.flush()
+            self.counts['albums'] += len(new_albums)
+            self.albums.update({key: album.album_id for key, album in new_albums.items()})
+
+    # Function: Rows of one batch of files, in one transaction
+    def write_batch(self, batch):
+        try:
+            if self.creator_id is None:
+                self._creator_ids({song['album_artist'] for song in batch})
+            for song in batch:
+                song['user_id'] = self.creator_id or self.creators[song['album_artist']]
+            self._album_ids(batch)
+
+            new_songs = [Songs(title=song['title'], singer=song['singer'], genre=song['genre'],
+                               release_date=song['year'], duration_ms=song['duration_ms'], file_path=song['file_path'],
+                               lyrics=song['lyrics'], cover=song['cover'], user_id=song['user_id'],
+                               file_hash=song['hash'])
+                         for song in batch]
+            db.session.add_all(new_songs)
+            db.session.flush()
+            db.session.add_all([AlbumSong(album_id=self.albums[(song['user_id'], song['album'])],
+                                          song_id=new_song.song_id)
+                                for song, new_song in zip(batch, new_songs) if song['album']])
+            db.session.commit()
+            self.counts['imported'] += len(batch)
+        except Exception:
+            db.session.rollback()
+            # The ids of the rows created in this transaction are gone with it
+            self.creators.clear()
+            self.albums.clear()
+            raise
+
+
+# Function: Import every audio file under a directory, returns the counts of imported/skipped/failed files
+def import_catalog(directory, creator_id=None, link=False, workers=None, batch_size=BATCH_SIZE, report=None):
+    known = {digest for (digest,) in db.session.query(Songs.file_hash).filter(Songs.file_hash != None)}
+    db.session.close()
+
+    importer = CatalogImport(creator_id)
+    counts = importer.counts
+    batch = []
+    # The known hashes go to the workers, which then don't copy or read the files already imported
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(link, frozenset(known))) as executor:
+        for result in executor.map(read_file, scan(directory), chunksize=CHUNK_SIZE):
+            if 'error' in result:
+                counts['failed'] += 1
+                logger.warning("Could not import %s: %s", result['path'], result['error'])
+                continue
+            if result.get('skipped') or result['hash'] in known:
+                counts['skipped'] += 1
+                continue
+            known.add(result['hash'])
+            batch.append(result)
+            if len(batch) >= batch_size:
+                importer.write_batch(batch)
+                batch = []
+                if report is not None:
+                    report(counts)
+        if batch:
+            importer.write_batch(batch)
+    db.session.close()
+    logger.info("Catalog import of %s: %s", directory, counts)
+    return counts
@@ -0,0 +1,216 @@
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from flask import before_render_template, current_app, g, has_app_context, has_request_context, request, \
+    template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from . import metrics
+
+
+request_logger = logging.getLogger('cassette.requests')
+slow_query_logger = logging.getLogger('cassette.slow_queries')
+
+# ------------------------------ Request instrumentation
+# Every request logs one line to the "cassette.requests" logger:
+#     route=catalog.album method=GET status=200 wall_ms=12.4 db_ms=3.1 sql=4 rows=17 render_ms=6.8
+# wall_ms is the time until the response is ready (for streamed files, not until the last byte is sent),
+# db_ms the time spent executing SQL statements, rows the rows fetched from their results and
+# render_ms the time spent in render_template().
+#
+# Statements slower than SLOW_QUERY_MS are logged to "cassette.slow_queries", with their parameters
+# and the route that issued them.
+#
+# The last SAMPLE_WINDOW requests of every endpoint are kept for percentiles (summary(), shown to the
+# admins by /api/admin/performance). They are per worker process.
+
+DEFAULT_SLOW_QUERY_MS = 100
+SAMPLE_WINDOW = 1000
+MAX_PARAMETERS_LENGTH = 500
+
+
+class RequestStats:
+    __slots__ = ('started', 'db_time', 'statements', 'rows', 'render_time', 'render_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.statements = 0
+        self.rows = 0
+        self.render_time = 0.0
+        self.render_started = None
+
+
+def current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return None
+
+
+# DB-API cursor counting the rows SQLAlchemy fetches from it
+class RowCountingCursor:
+    def __init__(self, cursor, stats):
+        self._cursor = cursor
+        self._stats = stats
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+
+    stats = current_stats()
+    if stats is not None:
+        stats.db_time += elapsed
+        stats.statements += 1
+        if context is not None and cursor.description is not None:
+            context.cursor = RowCountingCursor(cursor, stats)
+
+    threshold = current_app.config.get('SLOW_QUERY_MS') if has_app_context() else None
+    if elapsed * 1000 >= (threshold if threshold is not None else DEFAULT_SLOW_QUERY_MS):
+        slow_query_logger.warning("route=%s ms=%.1f statement=%s parameters=%s",
+                                  request.endpoint if has_request_context() else None,
+                                  elapsed * 1000, ' '.join(statement.split()),
+                                  repr(parameters)[:MAX_PARAMETERS_LENGTH])
+
+
+# Connections of the database pools (cassette_db_connections_* at /metrics)
+@event.listens_for(Pool, 'connect')
+def _pool_connect(dbapi_connection, connection_record):
+    metrics.gauge_add('cassette_db_connections_open', 1)
+
+
+@event.listens_for(Pool, 'close')
+@event.listens_for(Pool, 'close_detached')
+def _pool_close(dbapi_connection, *args):
+    metrics.gauge_add('cassette_db_connections_open', -1)
+
+
+@event.listens_for(Pool, 'checkout')
+def _pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics.gauge_add('cassette_db_connections_checked_out', 1)
+
+
+@event.listens_for(Pool, 'checkin')
+def _pool_checkin(dbapi_connection, connection_record):
+    metrics.gauge_add('cassette_db_connections_checked_out', -1)
+
+
+def _before_render_template(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None:
+        stats.render_started = time.perf_counter()
+
+
+def _template_rendered(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats.render_started is not None:
+        stats.render_time += time.perf_counter() - stats.render_started
+        stats.render_started = None
+
+
+# ------------------------------ Rolling per-endpoint percentiles
+class EndpointStats:
+    def __init__(self, window=SAMPLE_WINDOW):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._totals = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, endpoint, wall_ms, db_ms, statements, rows, render_ms):
+        with self._lock:
+            self._samples[endpoint].append((wall_ms, db_ms, statements, rows, render_ms))
+            self._totals[endpoint] += 1
+
+    def summary(self):
+        with self._lock:
+            samples = {endpoint: list(values) for endpoint, values in self._samples.items()}
+            totals = dict(self._totals)
+
+        summary = {}
+        for endpoint, values in samples.items():
+            wall_ms, db_ms, statements, rows, render_ms = zip(*values)
+            summary[endpoint] = {
+                'requests': totals[endpoint],
+                'window': len(values),
+                'wall_ms': percentiles(wall_ms),
+                'db_ms': percentiles(db_ms),
+                'render_ms': percentiles(render_ms),
+                'sql': percentiles(statements),
+                'rows': percentiles(rows),
+            }
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._totals.clear()
+
+
+# Function: p50/p90/p99/max of a list of samples (nearest rank)
+def percentiles(values):
+    ordered = sorted(values)
+    result = {}
+    for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        result[name] = round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)], 2)
+    result['max'] = round(ordered[-1], 2)
+    return result
+
+
+endpoint_stats = EndpointStats()
+
+
+def summary():
+    return endpoint_stats.summary()
+
+
+def _start_request():
+    g.request_stats = RequestStats()
+
+
+def _finish_request(response):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return response
+
+    wall_ms = (time.perf_counter() - stats.started) * 1000
+    db_ms = stats.db_time * 1000
+    render_ms = stats.render_time * 1000
+    endpoint = request.endpoint or '<unmatched>'
+    endpoint_stats.add(endpoint, wall_ms, db_ms, stats.statements, stats.rows, render_ms)
+    metrics.observe('cassette_request_duration_seconds', wall_ms / 1000, route=endpoint)
+    request_logger.info("route=%s method=%s status=%s wall_ms=%.1f db_ms=%.1f sql=%d rows=%d render_ms=%.1f",
+                        endpoint, request.method, response.status_code, wall_ms, db_ms,
+                        stats.statements, stats.rows, render_ms)
+    return response
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
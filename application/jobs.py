@@ -0,0 +1,71 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Background jobs
+# A small in-process job queue: work that shouldn't hold up a request (like decoding an upload)
+# is put on the queue and run by a single daemon thread, inside an app context.
+# The thread is started lazily in every process, so it also works after a fork.
+
+_jobs = queue.Queue()
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def _run_jobs(app):
+    while True:
+        enqueued_at, func, args = _jobs.get()
+        metrics.observe('cassette_job_lag_seconds', time.time() - enqueued_at)
+        with app.app_context():
+            try:
+                func(*args)
+            except Exception as error:
+                logger.exception("Background job %s failed: %s", func.__name__, error)
+            finally:
+                _jobs.task_done()
+
+
+def _ensure_worker(app):
+    global _worker, _worker_pid
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid() or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_jobs, args=(app,), name="cassette-jobs", daemon=True)
+            _worker.start()
+            _worker_pid = os.getpid()
+
+
+# Function: Put a job on the queue, to be run with the given app's context
+def enqueue(app, func, *args):
+    _ensure_worker(app)
+    _jobs.put((time.time(), func, args))
+
+
+# Function: Number of jobs waiting to be picked up
+def pending_jobs():
+    return _jobs.qsize()
+
+
+# Function: Jobs waiting to be picked up, per job function, as [({"job": name}, count), ...]
+def pending_by_name():
+    with _jobs.mutex:
+        counts = Counter(func.__name__ for _, func, _ in _jobs.queue)
+    return [({'job': name}, count) for name, count in counts.items()]
+
+
+# Function: Seconds the oldest waiting job has been in the queue (0 when the queue is empty)
+def oldest_pending_age():
+    with _jobs.mutex:
+        oldest = _jobs.queue[0][0] if _jobs.queue else None
+    return time.time() - oldest if oldest is not None else 0
+
+
+metrics.gauge_callback('cassette_jobs_pending', pending_by_name)
+metrics.gauge_callback('cassette_job_oldest_pending_seconds', oldest_pending_age)
@@ -0,0 +1,155 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+
+# ------------------------------ Logging pipeline
+# Logging calls in the request threads only put the record on an in-memory queue (QueueHandler).
+# A single listener thread (QueueListener) formats and writes them:
+#     LOG_FILE           rotated when it reaches LOG_MAX_BYTES, keeping LOG_BACKUP_COUNT old files
+#     standard error     errors only (e.g. the exceptions of the routes)
+#
+# Rotation is not safe with several processes renaming the same file, so only the process that
+# configured the logging rotates it. Forked processes (the workers of application/server.py) append
+# to the file with a WatchedFileHandler, which reopens it once the parent has rotated it; the master
+# of "flask serve" calls rotate_if_needed() from its loop, as it logs little itself.
+#
+# LOG_LEVEL is the level of the root logger, LOG_LEVELS overrides it per logger, e.g.
+#     LOG_LEVELS="sqlalchemy.engine=INFO,werkzeug=WARNING"
+# (sqlalchemy.engine=INFO is the SQL echo, off by default).
+#
+# LOG_SAMPLING keeps only a fraction of the records of high-volume loggers, e.g.
+#     LOG_SAMPLING="cassette.streams=0.1,cassette.requests=0.5"
+# The records are dropped before they are queued. Warnings and errors are always kept.
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(threadName)s : %(message)s'
+
+DEFAULT_LEVELS = {'sqlalchemy.engine': 'WARNING', 'werkzeug': 'INFO'}
+
+_listener = None
+_file_handler = None
+
+
+# Function: {"name": "value"} from a setting like "name=value,other.name=value"
+def parse_settings(setting):
+    settings = {}
+    for item in (setting or '').split(','):
+        name, _, value = item.partition('=')
+        if name.strip() and value.strip():
+            settings[name.strip()] = value.strip()
+    return settings
+
+
+# The queue stays in this process, so records don't need to be picklable: only the message is merged
+# here (its arguments can be ORM objects, not to be read from another thread). The line and the
+# traceback are formatted by the listener thread.
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def _rate(self, name):
+        # The rate of the logger, or of its closest configured parent ("cassette" for "cassette.streams")
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        return rate is None or random.random() < rate
+
+
+def configure_logging(config):
+    global _listener, _file_handler
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(config['LOG_FILE'],
+                                                        maxBytes=config['LOG_MAX_BYTES'],
+                                                        backupCount=config['LOG_BACKUP_COUNT'],
+                                                        encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    _file_handler = file_handler
+    error_handler = logging.StreamHandler()
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LocalQueueHandler(log_queue)
+    rates = {name: float(rate) for name, rate in parse_settings(config['LOG_SAMPLING']).items()}
+    if rates:
+        queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config['LOG_LEVEL'].upper())
+
+    levels = dict(DEFAULT_LEVELS, **parse_settings(config['LOG_LEVELS']))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, error_handler, respect_handler_level=True)
+    _listener.start()
+    # Write what is still queued when the process exits
+    atexit.register(stop_logging)
+
+
+# Function: Rotate the log file once it has reached LOG_MAX_BYTES, whoever wrote to it
+# (the records of this process rotate it too, this catches the ones of the forked workers)
+def rotate_if_needed():
+    handler = _file_handler
+    if handler is None or not isinstance(handler, logging.handlers.RotatingFileHandler) or not handler.maxBytes:
+        return
+    handler.acquire()
+    try:
+        if os.path.getsize(handler.baseFilename) >= handler.maxBytes:
+            handler.doRollover()
+    except OSError:
+        pass
+    finally:
+        handler.release()
+
+
+# Function: The listener thread doesn't survive a fork: a forked worker (see application/server.py)
+# starts its own on the same queue, and appends to the log file without ever rotating it
+def _restart_after_fork():
+    global _listener, _file_handler
+    if _listener is not None:
+        handlers = list(_listener.handlers)
+        if _file_handler in handlers:
+            watched = logging.handlers.WatchedFileHandler(_file_handler.baseFilename, encoding='utf-8', delay=True)
+            watched.setFormatter(_file_handler.formatter)
+            watched.setLevel(_file_handler.level)
+            handlers[handlers.index(_file_handler)] = watched
+            # The parent's file stays open in the parent
+            _file_handler.close()
+            _file_handler = watched
+        _listener = logging.handlers.QueueListener(_listener.queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,82 @@
+from array import array
+from bisect import bisect_right
+import re
+import zlib
+
+
+# ------------------------------ Lyrics storage
+# The lyrics of a song live in the song_lyrics table (one row per song, see SongLyrics in
+# application/models.py), so that the listing queries on "songs" never read them. They are stored
+# zlib-compressed (song_lyrics.content), and only loaded when song.lyrics is read (the lyrics page,
+# the edit form, the API).
+#
+# Lyrics can be plain text, or time-synced in the LRC format:
+#     [00:12.50]First line
+#     [00:15.20][01:02.00]A line sung twice
+# For LRC lyrics, the row also stores the start of every line (in milliseconds, sorted) as a packed
+# array of uint32: the line sung at a position of the song is a binary search in it (line_at()).
+
+FORMAT_PLAIN = 'plain'
+FORMAT_LRC = 'lrc'
+COMPRESSION_LEVEL = 9
+
+LRC_TIMESTAMP = re.compile(r'\[(\d{1,3}):(\d{1,2}(?:\.\d{1,3})?)\]')
+# [ar:Artist], [ti:Title], [offset:+250]...
+LRC_TAG = re.compile(r'^\[([a-z]+):(.*)\]$', re.IGNORECASE)
+
+
+def compress(text):
+    return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+# Function: True if the text has at least one "[mm:ss.xx]" line
+def is_lrc(text):
+    return any(LRC_TIMESTAMP.match(line.strip()) for line in text.splitlines())
+
+
+# Function: The timed lines of LRC lyrics, [(start_ms, line), ...] sorted by time
+def parse_lrc(text):
+    offset = 0
+    lines = []
+    for raw_line in text.splitlines():
+        raw_line = raw_line.strip()
+        tag = LRC_TAG.match(raw_line)
+        if tag and not LRC_TIMESTAMP.match(raw_line):
+            if tag.group(1).lower() == 'offset':
+                try:
+                    offset = int(tag.group(2).strip())
+                except ValueError:
+                    pass
+            continue
+        starts = []
+        position = 0
+        while match := LRC_TIMESTAMP.match(raw_line, position):
+            starts.append(round((int(match.group(1)) * 60 + float(match.group(2))) * 1000))
+            position = match.end()
+        lyric = raw_line[position:].strip()
+        lines.extend((start, lyric) for start in starts)
+    # A positive offset shows the lines earlier
+    return sorted(((max(start - offset, 0), lyric) for start, lyric in lines), key=lambda line: line[0])
+
+
+# Function: (format, compressed text, packed timestamps or None) of the lyrics to store
+def encode(text):
+    if is_lrc(text):
+        timestamps = array('I', [start for start, _ in parse_lrc(text)])
+        return FORMAT_LRC, compress(text), timestamps.tobytes()
+    return FORMAT_PLAIN, compress(text), None
+
+
+def unpack_timestamps(data):
+    timestamps = array('I')
+    timestamps.frombytes(data or b'')
+    return timestamps
+
+
+# Function: Index of the line sung at position_ms (-1 before the first line)
+def line_at(timestamps, position_ms):
+    return bisect_right(timestamps, position_ms) - 1
@@ -0,0 +1,354 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+
+try:
+    import fcntl
+except ImportError:  # Windows: retired snapshots are then kept as they are
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Metrics
+# Counters, gauges and histograms, served at /metrics in the Prometheus text format.
+#
+# Updates are lock-free: every thread adds to its own dictionaries, which only that thread writes.
+# Once a thread has exited, the next snapshot folds its dictionaries into the totals of the process
+# (_exited_values), so a server starting a thread per request doesn't pile them up.
+# A daemon thread of every worker process merges them (with the callback gauges below) into a
+# snapshot, written every FLUSH_SECONDS to the spool directory METRICS_DIR (instance/metrics):
+#     <pid>.json        one file per live worker process, replaced atomically
+#     retired.json      the counters and histograms of the processes that are gone
+# /metrics adds up the snapshots of all the workers on the machine, so it doesn't matter which
+# worker answers the scrape. Gauges of processes that stopped writing (no snapshot for
+# STALE_SECONDS) are dropped, their counters and histograms are kept in retired.json.
+#
+# Usage:
+#     metrics.inc('cassette_stream_bytes_total', 4096)
+#     metrics.observe('cassette_request_duration_seconds', 0.012, route='catalog.album')
+#     metrics.gauge_add('cassette_active_streams', 1)
+#     metrics.gauge_callback('cassette_jobs_pending', jobs.pending_by_name)
+
+FLUSH_SECONDS = 5
+STALE_SECONDS = 6 * FLUSH_SECONDS
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+# name: (type, help, histogram buckets or how gauges of several processes add up)
+METRICS = {
+    'cassette_request_duration_seconds': ('histogram', 'Time to produce a response, per route', LATENCY_BUCKETS),
+    'cassette_db_connections_checked_out': ('gauge', 'Database connections in use (checked out of the pool)', 'sum'),
+    'cassette_db_connections_open': ('gauge', 'Database connections opened by the pools', 'sum'),
+    'cassette_active_streams': ('gauge', 'Audio responses being sent', 'sum'),
+    'cassette_stream_bytes_total': ('counter', 'Bytes of audio served (rate() gives bytes per second)', None),
+    'cassette_jobs_pending': ('gauge', 'Background jobs waiting to run, per job (store_song_features: uploads)', 'sum'),
+    'cassette_job_oldest_pending_seconds': ('gauge', 'Age of the oldest background job still waiting', 'max'),
+    'cassette_job_lag_seconds': ('histogram', 'Time background jobs waited before running', LAG_BUCKETS),
+    'cassette_cache_requests_total': ('counter', 'Lookups of the caches, per cache and result', None),
+    'cassette_cache_errors_total': ('counter', 'Failed calls to the shared cache backend (served as misses)', None),
+    'cassette_play_buffer_events': ('gauge', 'Play events buffered, waiting to be written', 'sum'),
+    'cassette_play_buffer_capacity': ('gauge', 'Play events that trigger a flush of the buffer, per process', 'sum'),
+    'cassette_process_memory_bytes': ('gauge', 'Resident memory per worker process: rss, pss, and the part of '
+                                      'the mapped catalog snapshot (snapshot_rss, snapshot_pss)', 'sum'),
+}
+
+_spool_dir = None
+_local = threading.local()
+# [(thread, (counters, gauges, histograms))]
+_thread_values = []
+_thread_values_lock = threading.Lock()
+_exited_values = ({}, {}, {})
+_gauge_callbacks = {}
+_flusher = None
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+# ------------------------------ Updates (per thread, no locks)
+def _values():
+    values = getattr(_local, 'values', None)
+    if values is None:
+        values = _local.values = ({}, {}, {})
+        with _thread_values_lock:
+            _thread_values.append((threading.current_thread(), values))
+        _ensure_flusher()
+    return values
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    counters = _values()[0]
+    key = _key(name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def gauge_add(name, amount, **labels):
+    gauges = _values()[1]
+    key = _key(name, labels)
+    gauges[key] = gauges.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    histograms = _values()[2]
+    key = _key(name, labels)
+    buckets = METRICS[name][2]
+    histogram = histograms.get(key)
+    if histogram is None:
+        # Count per bucket (the last one is +Inf), then the sum
+        histogram = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+    histogram[bisect_left(buckets, value)] += 1
+    histogram[-1] += value
+
+
+# Function: Gauge computed when the snapshot is taken: func() returns [(labels, value), ...] or a number
+def gauge_callback(name, func):
+    _gauge_callbacks[name] = func
+
+
+# Function: The threads of the parent are gone in a forked worker, and so are their values
+def _reset_after_fork():
+    global _flusher, _flusher_lock, _local, _thread_values_lock, _exited_values
+    _thread_values.clear()
+    _thread_values_lock = threading.Lock()
+    _exited_values = ({}, {}, {})
+    _local = threading.local()
+    _flusher = None
+    _flusher_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# ------------------------------ Snapshots
+# Function: Add the (counters, gauges, histograms) of "values" to "totals"
+def _add_values(totals, values):
+    counters, gauges, histograms = totals
+    thread_counters, thread_gauges, thread_histograms = values
+    # dict.copy() is atomic, the owning thread may be updating its dictionaries
+    for key, value in thread_counters.copy().items():
+        counters[key] = counters.get(key, 0) + value
+    for key, value in thread_gauges.copy().items():
+        gauges[key] = gauges.get(key, 0) + value
+    for key, histogram in thread_histograms.copy().items():
+        histogram = list(histogram)
+        if key in histograms:
+            histogram = [total + value for total, value in zip(histograms[key], histogram)]
+        histograms[key] = histogram
+
+
+# Function: Values of this process: {"counters": [[name, labels, value]], "gauges": ..., "histograms": ...}
+def snapshot():
+    with _thread_values_lock:
+        exited = [values for thread, values in _thread_values if not thread.is_alive()]
+        if exited:
+            _thread_values[:] = [(thread, values) for thread, values in _thread_values if thread.is_alive()]
+            # The threads are gone, nothing writes their dictionaries anymore
+            for values in exited:
+                _add_values(_exited_values, values)
+        live = [values for _, values in _thread_values]
+
+    counters, gauges, histograms = {}, {}, {}
+    for values in [_exited_values] + live:
+        _add_values((counters, gauges, histograms), values)
+
+    for name, func in list(_gauge_callbacks.items()):
+        try:
+            result = func()
+        except Exception as error:
+            logger.warning("Could not compute the gauge %s: %s", name, error)
+            continue
+        if isinstance(result, (int, float)):
+            result = [({}, result)]
+        for labels, value in result:
+            gauges[_key(name, labels)] = value
+
+    def as_list(values):
+        return [[name, [list(label) for label in labels], value] for (name, labels), value in values.items()]
+
+    return {'pid': os.getpid(), 'time': time.time(), 'counters': as_list(counters),
+            'gauges': as_list(gauges), 'histograms': as_list(histograms)}
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as spool_file:
+        json.dump(data, spool_file)
+    os.replace(tmp_path, path)
+
+
+def write_snapshot(exiting=False):
+    if _spool_dir is None:
+        return
+    data = snapshot()
+    if exiting:
+        # Nothing is in use anymore, and the next /metrics retires the snapshot right away
+        data['gauges'] = []
+        data['time'] = 0
+    try:
+        os.makedirs(_spool_dir, exist_ok=True)
+        _write_json(os.path.join(_spool_dir, f"{os.getpid()}.json"), data)
+    except OSError as error:
+        logger.warning("Could not write the metrics snapshot: %s", error)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        write_snapshot()
+
+
+def _ensure_flusher():
+    global _flusher, _flusher_pid
+    with _flusher_lock:
+        if _flusher is None or _flusher_pid != os.getpid() or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_flush_loop, name="cassette-metrics", daemon=True)
+            _flusher.start()
+            _flusher_pid = os.getpid()
+
+
+@atexit.register
+def _snapshot_on_exit():
+    if _thread_values or any(_exited_values):
+        write_snapshot(exiting=True)
+
+
+# ------------------------------ Aggregation across the workers
+def _add(totals, metric_type, name, labels, value):
+    key = (name, tuple(tuple(label) for label in labels))
+    if key not in totals:
+        totals[key] = list(value) if metric_type == 'histograms' else value
+    elif metric_type == 'histograms':
+        totals[key] = [total + part for total, part in zip(totals[key], value)]
+    elif metric_type == 'gauges' and METRICS.get(name, (None, None, 'sum'))[2] == 'max':
+        totals[key] = max(totals[key], value)
+    else:
+        totals[key] += value
+
+
+def _merge(totals, data, with_gauges=True):
+    for metric_type in ('counters', 'gauges', 'histograms'):
+        if metric_type == 'gauges' and not with_gauges:
+            continue
+        for name, labels, value in data.get(metric_type, []):
+            _add(totals[metric_type], metric_type, name, labels, value)
+
+
+def _read_json(path):
+    try:
+        with open(path) as spool_file:
+            return json.load(spool_file)
+    except (OSError, ValueError):
+        return None
+
+
+# Function: Fold the snapshots of the processes that are gone into retired.json
+def _retire(stale_paths):
+    lock_path = os.path.join(_spool_dir, '.lock')
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        retired_path = os.path.join(_spool_dir, 'retired.json')
+        totals = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        _merge(totals, _read_json(retired_path) or {}, with_gauges=False)
+        for path in stale_paths:
+            data = _read_json(path)
+            if data is not None:
+                _merge(totals, data, with_gauges=False)
+        _write_json(retired_path, {metric_type: [[name, [list(label) for label in labels], value]
+                                                 for (name, labels), value in values.items()]
+                                   for metric_type, values in totals.items()})
+        for path in stale_paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def collect():
+    totals = {'counters': {}, 'gauges': {}, 'histograms': {}}
+    # This process: its live values, rather than its last snapshot
+    _merge(totals, snapshot())
+
+    if _spool_dir is not None and os.path.isdir(_spool_dir):
+        stale_paths = []
+        for path in glob.glob(os.path.join(_spool_dir, '*.json')):
+            name = os.path.basename(path)
+            if name == f"{os.getpid()}.json" or name == 'retired.json':
+                continue
+            data = _read_json(path)
+            if data is None:
+                continue
+            stale = time.time() - data.get('time', 0) > STALE_SECONDS
+            _merge(totals, data, with_gauges=not stale)
+            if stale:
+                stale_paths.append(path)
+        retired = _read_json(os.path.join(_spool_dir, 'retired.json'))
+        if retired is not None:
+            _merge(totals, retired, with_gauges=False)
+        if stale_paths and fcntl is not None:
+            try:
+                _retire(stale_paths)
+            except OSError as error:
+                logger.warning("Could not retire the metrics snapshots %s: %s", stale_paths, error)
+    return totals
+
+
+# ------------------------------ Text exposition format
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(totals):
+    lines = []
+    for name, (metric_type, help_text, option) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        values = totals[metric_type + 's']
+        for (metric_name, labels), value in sorted(values.items()):
+            if metric_name != name:
+                continue
+            if metric_type != 'histogram':
+                lines.append(f"{name}{_label_text(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(option) + [float('inf')], value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_label_text(labels, [('le', _number(float(bound)))])} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_label_text(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    from flask import abort, current_app, request
+
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        abort(401)
+    return render(collect()), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+                                    'Cache-Control': 'no-store'}
+
+
+def init_app(app):
+    global _spool_dir
+    _spool_dir = app.config.get('METRICS_DIR') or os.path.join(app.instance_path, 'metrics')
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
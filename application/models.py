@@ -1,7 +1,17 @@
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.ext.hybrid import hybrid_property
 from .database import db
+from .lyrics import FORMAT_LRC, decompress, encode, line_at, parse_lrc, unpack_timestamps
 from flask_login import UserMixin
 
 
+# Last change of a row, in UTC: the validators (Last-Modified, ETag) of the public pages are
+# computed from it (see application/http_cache.py)
+def _updated_at_column():
+    return db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+
 class Users(db.Model, UserMixin):
     __tablename__ = 'users'
     user_id = db.Column(db.Integer, autoincrement=True, primary_key=True)
@@ -12,7 +22,7 @@ class Users(db.Model, UserMixin):
     role = db.Column(db.Integer, nullable=False)
     profile_pic = db.Column(db.String, nullable=True)
     playlists = db.relationship("Playlists", backref="user", lazy=True)
-    queue = db.relationship("Queue", backref="user", lazy=True)
+    queue = db.relationship("Queue", backref="user", lazy=True, order_by="Queue.position")
     blacklist = db.Column(db.Boolean, default=False, nullable=False)
     dark_mode = db.Column(db.Boolean, default=False, nullable=False)
     
@@ -20,24 +30,104 @@ class Users(db.Model, UserMixin):
         return self.user_id
 
 
+# Genres of the songs, with the number of songs of each (kept up to date by application/stats.py)
+class Genres(db.Model):
+    __tablename__ = 'genres'
+    genre_id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    song_count = db.Column(db.Integer, default=0, nullable=False)
+
+    # Function: Condition on the rows of a genre name: surrounding spaces and case don't make another genre
+    # (the genres migration merged the names of the existing songs the same way)
+    @classmethod
+    def matching(cls, name):
+        return func.lower(cls.name) == func.lower((name or '').strip())
+
+    # Function: The row of a genre name, inserted the first time the name is used
+    # (with its id right away, so the songs that get it can be counted in the same flush)
+    @classmethod
+    def named(cls, name):
+        name = (name or '').strip()
+        with db.session.no_autoflush:
+            genre = db.session.execute(select(cls).where(cls.matching(name))
+                                       .order_by(cls.genre_id).limit(1)).scalar_one_or_none()
+            if genre is None:
+                connection = db.session.connection()
+                if connection.dialect.name == 'sqlite':
+                    from sqlalchemy.dialects.sqlite import insert
+                elif connection.dialect.name == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    insert = None
+                if insert is not None:
+                    # Another worker may be adding the same genre at the same time
+                    connection.execute(insert(cls.__table__).values(name=name, song_count=0)
+                                       .on_conflict_do_nothing(index_elements=[cls.__table__.c.name]))
+                else:
+                    connection.execute(cls.__table__.insert().values(name=name, song_count=0))
+                genre = db.session.execute(select(cls).where(cls.matching(name))
+                                           .order_by(cls.genre_id).limit(1)).scalar_one()
+        return genre
+
+
 class Songs(db.Model):
     __tablename__ = 'songs'
     song_id = db.Column(db.Integer, autoincrement=True, primary_key=True)
     title = db.Column(db.String, nullable=False)
     singer = db.Column(db.String, nullable=False)
-    genre = db.Column(db.String, nullable=False)
+    genre_id = db.Column(db.Integer, db.ForeignKey('genres.genre_id'), nullable=False, index=True)
     release_date = db.Column(db.Integer, nullable=False)
-    duration = db.Column(db.String, nullable=False)
+    # Length of the audio, in milliseconds
+    duration_ms = db.Column(db.Integer, nullable=False, index=True)
     file_path = db.Column(db.String, nullable=False)
-    lyrics = db.Column(db.String, nullable=True)
     cover = db.Column(db.String, nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
     flagged = db.Column(db.Boolean, default=False, nullable=False)
+    updated_at = _updated_at_column()
+    # SHA-256 of the audio file, set by "flask import-catalog" so that a file is only imported once
+    file_hash = db.Column(db.String(64), nullable=True, unique=True, index=True)
     user = db.relationship("Users", backref="songs")
     playlists = db.relationship('Playlists', secondary='playlist_song', backref=db.backref('songs', lazy='dynamic'))
+    # Only loaded when song.lyrics is read
+    lyrics_row = db.relationship("SongLyrics", uselist=False, lazy='select', cascade='all, delete-orphan')
+    # A handful of rows, joined to every song query so that song.genre never needs its own query
+    genre_row = db.relationship("Genres", lazy='joined')
+
+    # The genre's name: song.genre = 'Rock' picks (or creates) the genre row
+    @hybrid_property
+    def genre(self):
+        return self.genre_row.name if self.genre_row is not None else None
+
+    @genre.setter
+    def genre(self, name):
+        self.genre_row = Genres.named(name)
+        self.genre_id = self.genre_row.genre_id
+
+    @genre.expression
+    def genre(cls):
+        return select(Genres.name).where(Genres.genre_id == cls.genre_id).scalar_subquery()
+
+    # Length in seconds
+    @property
+    def duration(self):
+        return self.duration_ms / 1000
+
+    # The lyrics' text (plain or LRC), stored compressed in song_lyrics
+    @property
+    def lyrics(self):
+        return self.lyrics_row.text if self.lyrics_row is not None else None
+
+    @lyrics.setter
+    def lyrics(self, text):
+        if not text:
+            self.lyrics_row = None
+        elif self.lyrics_row is None:
+            self.lyrics_row = SongLyrics(text=text)
+        else:
+            self.lyrics_row.text = text
 
     def __repr__(self):
-        return f"Songs('{self.title}', '{self.singer}', '{self.genre}', '{self.release_date}', '{self.duration}', '{self.file_path}', '{self.lyrics}', '{self.cover}', '{self.user_id}')"
+        return f"Songs('{self.title}', '{self.singer}', '{self.genre}', '{self.release_date}', '{self.duration}', '{self.file_path}', '{self.cover}', '{self.user_id}')"
 
 
 class Playlists(db.Model):
@@ -48,6 +138,7 @@ class Playlists(db.Model):
     description = db.Column(db.String, nullable=True)
     created_at = db.Column(db.DateTime, nullable=False)
     access = db.Column(db.String, nullable=False)
+    updated_at = _updated_at_column()
 
 
 class PlaylistSong(db.Model):
@@ -58,11 +149,25 @@ class PlaylistSong(db.Model):
     song_id = db.Column(db.Integer, db.ForeignKey('songs.song_id'), nullable=False)
 
 
+# Songs in a user's play queue, ordered by "position".
+# Positions are spaced QUEUE_GAP apart, so that moving a song only rewrites that one row.
 class Queue(db.Model):
     __tablename__ = 'queue'
+    __table_args__ = (db.Index('ix_queue_user_id_position', 'user_id', 'position'),)
     queue_id = db.Column(db.Integer, autoincrement=True, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
     song_id = db.Column(db.Integer, db.ForeignKey('songs.song_id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    song = db.relationship("Songs")
+
+
+# Playback state of a user's queue: the song being played, shuffle and repeat ('off', 'all' or 'one')
+class QueueState(db.Model):
+    __tablename__ = 'queue_state'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True)
+    current_queue_id = db.Column(db.Integer, nullable=True)
+    shuffle_seed = db.Column(db.Integer, nullable=True)
+    repeat = db.Column(db.String(3), default='off', nullable=False)
 
 
 class Albums(db.Model):
@@ -77,6 +182,7 @@ class Albums(db.Model):
     user = db.relationship("Users", backref="albums")
     songs = db.relationship('Songs', secondary='album_song', backref=db.backref('albums', lazy='dynamic'))
     flagged = db.Column(db.Boolean, default=False, nullable=False)
+    updated_at = _updated_at_column()
 
     def __repr__(self):
         return f"Albums('{self.title}', '{self.cover}', '{self.description}', '{self.user_id}')"
@@ -108,8 +214,74 @@ class Plays(db.Model):
 
     play_id = db.Column(db.Integer, autoincrement=True, primary_key=True)
     play_count = db.Column(db.Integer, nullable=False)
-    date_created = db.Column(db.Integer, nullable=False)
+    date_created = db.Column(db.Integer, nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), nullable=False)
-    song_id = db.Column(db.Integer, db.ForeignKey('songs.user_id'), nullable=False)
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.song_id'), nullable=False)
     user = db.relationship("Users", backref="plays")
     song = db.relationship("Songs", backref="plays")
+
+
+# Fixed-length audio feature vector for every song, filled in at upload time.
+# Kept in its own table, so that the listing queries on "songs" never load it.
+class SongFeatures(db.Model):
+    __tablename__ = 'song_features'
+
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.song_id'), primary_key=True)
+    vector = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+
+# Lyrics of a song, zlib-compressed (see application/lyrics.py). Kept in their own table, like the
+# features, so that the listing queries on "songs" never load them.
+class SongLyrics(db.Model):
+    __tablename__ = 'song_lyrics'
+
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.song_id'), primary_key=True)
+    format = db.Column(db.String(10), nullable=False)
+    content = db.Column(db.LargeBinary, nullable=False)
+    # LRC lyrics: start of every line in milliseconds, a packed uint32 array sorted by time
+    timestamps = db.Column(db.LargeBinary, nullable=True)
+
+    @property
+    def text(self):
+        return decompress(self.content)
+
+    @text.setter
+    def text(self, text):
+        self.format, self.content, self.timestamps = encode(text)
+
+    # Function: [(start_ms, line), ...] of LRC lyrics, [(None, line), ...] of plain ones
+    def lines(self):
+        if self.format == FORMAT_LRC:
+            return parse_lrc(self.text)
+        return [(None, line) for line in self.text.split('\n')]
+
+    # Function: Index in lines() of the line sung at position_ms (-1 before the first one, or for plain lyrics)
+    def line_at(self, position_ms):
+        if self.format != FORMAT_LRC:
+            return -1
+        return line_at(unpack_timestamps(self.timestamps), position_ms)
+
+
+# Trending score of a song (see application/trending.py): the decayed play count relative to the landmark
+# of "epoch", with the song's genre copied over so that the top songs of a genre are one index range.
+class Trending(db.Model):
+    __tablename__ = 'trending'
+    __table_args__ = (db.Index('ix_trending_genre_epoch_weight', 'genre_id', 'epoch', 'weight'),
+                      db.Index('ix_trending_epoch_weight', 'epoch', 'weight'))
+
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.song_id'), primary_key=True)
+    genre_id = db.Column(db.Integer, nullable=False)
+    epoch = db.Column(db.Integer, nullable=False)
+    weight = db.Column(db.Float, nullable=False)
+
+
+# Maintained counts for the dashboards (see application/stats.py), one row per counter:
+# e.g. ("songs", 0), ("user_albums", <user_id>), ("song_plays", <song_id>) with the song's creator as owner_id.
+class StatCounters(db.Model):
+    __tablename__ = 'stat_counters'
+
+    name = db.Column(db.String(100), primary_key=True)
+    subject_id = db.Column(db.Integer, primary_key=True, default=0)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    owner_id = db.Column(db.Integer, nullable=True, index=True)
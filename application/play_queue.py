@@ -0,0 +1,260 @@
+import random
+from collections import namedtuple
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.orm import contains_eager
+from . import catalog_snapshot
+from .database import db
+from .fragments import changed as fragment_changed
+from .models import Queue, QueueState, Songs, PlaylistSong, AlbumSong
+from .playback import song_payload
+
+
+# ------------------------------ Play queue
+# Every user has one server-side queue: rows of the Queue table ordered by "position".
+# Positions are spaced QUEUE_GAP apart, so inserting or moving a song takes the midpoint of its
+# neighbours and only that one row is written. When two neighbours run out of room in between,
+# the user's queue is renumbered once.
+#
+# Shuffle doesn't touch the positions: the shuffled order is derived from a seed kept in QueueState,
+# so switching shuffle off gives back the original order.
+#
+# None of the functions below commit, the routes own the transaction.
+# The bulk statements mark the user's queue fragment as changed themselves (see application/fragments.py).
+
+QUEUE_GAP = 1024
+REPEAT_MODES = ('off', 'all', 'one')
+
+ListedItem = namedtuple('ListedItem', ('queue_id', 'song'))
+
+
+def get_state(user_id):
+    state = db.session.get(QueueState, user_id)
+    if state is None:
+        state = QueueState(user_id=user_id, repeat='off')
+        db.session.add(state)
+    return state
+
+
+# Function: The user's queue rows, in queue order, with their songs loaded
+# (inner join: rows left behind by a deleted song are skipped)
+def items(user_id):
+    return (Queue.query.join(Queue.song).options(contains_eager(Queue.song))
+            .filter(Queue.user_id == user_id)
+            .order_by(Queue.position, Queue.queue_id)
+            .all())
+
+
+# Function: The user's queue for the queue component, (queue_id, song) rows in queue order, with the
+# songs read from the catalog snapshot when it is up to date (see application/catalog_snapshot.py)
+def listed_items(user_id):
+    snapshot = catalog_snapshot.get_snapshot()
+    if snapshot is None:
+        return items(user_id)
+    rows = db.session.execute(select(Queue.queue_id, Queue.song_id)
+                              .where(Queue.user_id == user_id)
+                              .order_by(Queue.position, Queue.queue_id)).all()
+    songs = snapshot.songs_by_id([song_id for _, song_id in rows])
+    return [ListedItem(queue_id, songs[song_id]) for queue_id, song_id in rows if song_id in songs]
+
+
+# The rows of listed_items(), loaded on first use: a page whose queue fragment is cached never queries them
+class LazyItems:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._rows = None
+
+    def _load(self):
+        if self._rows is None:
+            self._rows = listed_items(self.user_id)
+        return self._rows
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def __bool__(self):
+        return bool(self._load())
+
+
+# Function: Queue order for playback, i.e. shuffled when shuffle is on
+def playback_order(user_id, state=None):
+    state = state or db.session.get(QueueState, user_id)
+    rows = items(user_id)
+    if state is not None and state.shuffle_seed is not None:
+        rows.sort(key=lambda row: random.Random(state.shuffle_seed * 1000003 + row.queue_id).random())
+    return rows
+
+
+def _last_position(user_id):
+    return db.session.query(func.max(Queue.position)).filter(Queue.user_id == user_id).scalar() or 0
+
+
+def _renumber(user_id):
+    rows = Queue.query.filter_by(user_id=user_id).order_by(Queue.position, Queue.queue_id).all()
+    for index, row in enumerate(rows, start=1):
+        row.position = index * QUEUE_GAP
+    db.session.flush()
+
+
+# Function: Position for a row going right before "before_row" (or at the end, when it is None)
+def _position_before(user_id, before_row, exclude_queue_id=None):
+    if before_row is None:
+        return _last_position(user_id) + QUEUE_GAP
+
+    previous_position = (db.session.query(func.max(Queue.position))
+                         .filter(Queue.user_id == user_id,
+                                 Queue.position < before_row.position,
+                                 Queue.queue_id != exclude_queue_id)
+                         .scalar()) or 0
+    if before_row.position - previous_position < 2:
+        _renumber(user_id)
+        return _position_before(user_id, before_row, exclude_queue_id)
+    return (previous_position + before_row.position) // 2
+
+
+# Function: Add a song at the end of the queue, or right after the current song with play_next
+def append(user_id, song_id, play_next=False):
+    before_row = None
+    if play_next:
+        state = get_state(user_id)
+        current = db.session.get(Queue, state.current_queue_id) if state.current_queue_id else None
+        if current is not None:
+            before_row = (Queue.query.filter(Queue.user_id == user_id, Queue.position > current.position)
+                          .order_by(Queue.position).first())
+
+    row = Queue(user_id=user_id, song_id=song_id, position=_position_before(user_id, before_row))
+    db.session.add(row)
+    db.session.flush()
+    return row
+
+
+# Function: Move a queue row right before another one (or to the end, when before_queue_id is None)
+def move(user_id, queue_id, before_queue_id=None):
+    row = Queue.query.filter_by(user_id=user_id, queue_id=queue_id).first()
+    if row is None:
+        return None
+    before_row = None
+    if before_queue_id is not None:
+        before_row = Queue.query.filter_by(user_id=user_id, queue_id=before_queue_id).first()
+        if before_row is None or before_row.queue_id == row.queue_id:
+            return row
+    row.position = _position_before(user_id, before_row, exclude_queue_id=row.queue_id)
+    db.session.flush()
+    return row
+
+
+def remove(user_id, queue_id):
+    fragment_changed(db.session, f'queue-{user_id}')
+    return Queue.query.filter_by(user_id=user_id, queue_id=queue_id).delete()
+
+
+def clear(user_id):
+    fragment_changed(db.session, f'queue-{user_id}')
+    Queue.query.filter_by(user_id=user_id).delete()
+    QueueState.query.filter_by(user_id=user_id).delete()
+
+
+# Function: Enqueue many songs from one SELECT
+# The rows are copied with a single INSERT ... SELECT, numbering the positions with row_number().
+def _enqueue_select(user_id, source, song_column, order_column, filters, replace):
+    fragment_changed(db.session, f'queue-{user_id}')
+    if replace:
+        clear(user_id)
+    base_position = 0 if replace else _last_position(user_id)
+
+    songs_to_enqueue = (
+        select(literal(user_id),
+               song_column,
+               literal(base_position) + QUEUE_GAP * func.row_number().over(order_by=order_column))
+        .select_from(source)
+        .join(Songs, Songs.song_id == song_column)
+        .where(Songs.flagged == False, *filters)
+    )
+    result = db.session.execute(
+        insert(Queue).from_select(['user_id', 'song_id', 'position'], songs_to_enqueue)
+    )
+    return result.rowcount
+
+
+def enqueue_playlist(user_id, playlist_id, replace=False):
+    return _enqueue_select(user_id, PlaylistSong, PlaylistSong.song_id, PlaylistSong.id,
+                           [PlaylistSong.playlist_id == playlist_id], replace)
+
+
+def enqueue_album(user_id, album_id, replace=False):
+    return _enqueue_select(user_id, AlbumSong, AlbumSong.song_id, AlbumSong.id,
+                           [AlbumSong.album_id == album_id], replace)
+
+
+# Function: Replace the queue with the given songs, in that order
+def replace(user_id, song_ids):
+    clear(user_id)
+    db.session.add_all([Queue(user_id=user_id, song_id=song_id, position=index * QUEUE_GAP)
+                        for index, song_id in enumerate(song_ids, start=1)])
+    db.session.flush()
+
+
+def set_shuffle(user_id, enabled):
+    state = get_state(user_id)
+    state.shuffle_seed = random.randrange(1, 2 ** 31) if enabled else None
+    return state
+
+
+def set_repeat(user_id, mode):
+    if mode not in REPEAT_MODES:
+        raise ValueError(f"repeat must be one of {', '.join(REPEAT_MODES)}")
+    state = get_state(user_id)
+    state.repeat = mode
+    return state
+
+
+# Function: Make a queue row the current song
+def play(user_id, queue_id):
+    row = Queue.query.join(Queue.song).filter(Queue.user_id == user_id, Queue.queue_id == queue_id).first()
+    if row is not None:
+        get_state(user_id).current_queue_id = row.queue_id
+    return row
+
+
+# Function: Index of the row "offset" songs away from the current one, following shuffle and repeat
+# With auto=True (the song ended by itself) repeat 'one' plays the same song again.
+def _target_index(rows, state, offset, auto):
+    index = next((index for index, row in enumerate(rows) if row.queue_id == state.current_queue_id), None)
+    if index is None:
+        return 0 if offset > 0 else len(rows) - 1
+    if auto and state.repeat == 'one':
+        return index
+    index += offset
+    if 0 <= index < len(rows):
+        return index
+    if state.repeat == 'all':
+        return index % len(rows)
+    return 0 if index < 0 else None
+
+
+# Function: Step through the queue, and return the new current row (None at the end of the queue)
+def step(user_id, offset, auto=False):
+    state = get_state(user_id)
+    rows = playback_order(user_id, state)
+    index = _target_index(rows, state, offset, auto) if rows else None
+    state.current_queue_id = rows[index].queue_id if index is not None else None
+    return rows[index] if index is not None else None
+
+
+# Function: The row step() would move to, without moving (used to prefetch the next song)
+def peek(user_id, offset=1, auto=True):
+    state = db.session.get(QueueState, user_id) or QueueState(user_id=user_id, repeat='off')
+    rows = playback_order(user_id, state)
+    index = _target_index(rows, state, offset, auto) if rows else None
+    return rows[index] if index is not None else None
+
+
+# Function: JSON friendly version of a queue row
+def serialize(row):
+    if row is None or row.song is None:
+        return None
+    payload = song_payload(row.song)
+    payload.update({'queue_id': row.queue_id, 'position': row.position})
+    return payload
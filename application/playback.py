@@ -0,0 +1,74 @@
+import logging
+import math
+import os
+from flask import url_for
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Playback helpers
+# Everything the audio controls need to swap a song client-side: metadata, duration,
+# the stream URL and the cover art in a few sizes.
+
+# Cover variants, generated next to the original at upload time: name -> max width/height in px
+COVER_SIZES = {'small': 64, 'medium': 200, 'large': 600}
+DEFAULT_COVER = 'static/img/album_art.png'
+
+
+# Function: Convert seconds into "minutes:seconds"
+def to_minute_seconds(seconds):
+    return f"{math.floor(seconds // 60)}:{math.floor(seconds % 60)}"
+
+
+def _variant_path(cover_path, size_name):
+    root, extension = os.path.splitext(cover_path)
+    return f"{root}_{size_name}{extension or '.jpg'}"
+
+
+# Function: Write the resized copies of an uploaded cover
+# Pillow is optional: without it (or for a file it can't read) only the original is served.
+def make_cover_variants(cover_path):
+    try:
+        from PIL import Image
+    except ImportError:
+        return {}
+
+    variants = {}
+    try:
+        with Image.open(cover_path) as image:
+            image = image.convert('RGB')
+            for size_name, size in COVER_SIZES.items():
+                variant = image.copy()
+                variant.thumbnail((size, size))
+                variant_path = _variant_path(cover_path, size_name)
+                variant.save(variant_path, 'JPEG', quality=85)
+                variants[size_name] = variant_path
+    except OSError as error:
+        logger.warning("Could not resize the cover %s: %s", cover_path, error)
+    return variants
+
+
+# Function: URLs of the cover in every size, falling back to the original/default picture
+def cover_variants(cover_path):
+    cover_path = (cover_path or DEFAULT_COVER).lstrip('/')
+    variants = {'original': '/' + cover_path}
+    for size_name in COVER_SIZES:
+        variant_path = _variant_path(cover_path, size_name)
+        variants[size_name] = '/' + variant_path if os.path.exists(variant_path) else variants['original']
+    return variants
+
+
+# Function: JSON friendly version of a song, for the audio controls
+def song_payload(song):
+    if song is None:
+        return None
+    duration = song.duration
+    return {'song_id': song.song_id,
+            'title': song.title,
+            'singer': song.singer,
+            'genre': song.genre,
+            'release_date': song.release_date,
+            'duration': duration,
+            'duration_text': to_minute_seconds(duration),
+            'stream_url': url_for('playback.stream_song', song_id=song.song_id),
+            'cover': cover_variants(song.cover)}
@@ -0,0 +1,131 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Play ingestion
+# Every track change is a play event. Instead of one INSERT per event, events are buffered
+# in memory and written in batches: repeated plays of the same song by the same user inside
+# one batch become a single Plays row with a higher play_count.
+# A daemon thread flushes the buffer every FLUSH_SECONDS, or earlier once it holds MAX_BUFFERED events.
+# When a write fails (e.g. "database is locked" with several SQLite writers), its events go back into
+# the buffer and are written with the next batch, FLUSH_SECONDS later; only past MAX_RETAINED events
+# (the database being down for a while) is a failed batch dropped.
+
+FLUSH_SECONDS = 5
+MAX_BUFFERED = 500
+MAX_RETAINED = 20 * MAX_BUFFERED
+
+_buffer = {}
+_buffered_events = 0
+_lock = threading.Lock()
+_flush_wanted = threading.Event()
+_flusher = None
+_flusher_pid = None
+_app = None
+
+
+def _ensure_flusher(app):
+    global _flusher, _flusher_pid, _app
+    if _flusher is not None and _flusher_pid == os.getpid() and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is None or _flusher_pid != os.getpid() or not _flusher.is_alive():
+            _app = app
+            _flusher = threading.Thread(target=_flush_loop, name="cassette-plays", daemon=True)
+            _flusher.start()
+            _flusher_pid = os.getpid()
+
+
+def _flush_loop():
+    while True:
+        _flush_wanted.wait(FLUSH_SECONDS)
+        _flush_wanted.clear()
+        if flush() is None:
+            # Failed: the buffer is full of the returned events, wait for the next tick to retry
+            time.sleep(FLUSH_SECONDS)
+
+
+# Function: Record one play event (cheap, doesn't touch the database)
+def record(app, user_id, song_id, played_at=None):
+    global _buffered_events
+    _ensure_flusher(app)
+    played_at = int(played_at or time.time())
+    with _lock:
+        key = (user_id, song_id)
+        count, first_played_at = _buffer.get(key, (0, played_at))
+        _buffer[key] = (count + 1, first_played_at)
+        _buffered_events += 1
+        if _buffered_events >= MAX_BUFFERED:
+            _flush_wanted.set()
+
+
+# Function: Number of play events waiting to be written
+def buffered():
+    return _buffered_events
+
+
+# Function: Put the events of a failed batch back into the buffer, unless it holds too many already
+def _requeue(pending):
+    global _buffered_events
+    events = sum(count for count, _ in pending.values())
+    with _lock:
+        if _buffered_events + events > MAX_RETAINED:
+            return False
+        for key, (count, played_at) in pending.items():
+            buffered_count, buffered_played_at = _buffer.get(key, (0, played_at))
+            _buffer[key] = (buffered_count + count, min(played_at, buffered_played_at))
+        _buffered_events += events
+    return True
+
+
+# Function: Write everything in the buffer with one executemany INSERT
+# (the number of rows written, None when the write failed)
+def flush():
+    global _buffer, _buffered_events
+    with _lock:
+        if not _buffer:
+            return 0
+        pending, _buffer, _buffered_events = _buffer, {}, 0
+
+    from sqlalchemy import insert
+    from .database import db
+    from .models import Plays
+    from . import analytics, trending
+
+    rows = [{'user_id': user_id, 'song_id': song_id, 'play_count': count, 'date_created': played_at}
+            for (user_id, song_id), (count, played_at) in pending.items()]
+    with _app.app_context():
+        try:
+            db.session.execute(insert(Plays), rows)
+            # The trending scores are updated with the plays, in the same transaction
+            trending.record([(row['song_id'], row['play_count'], row['date_created']) for row in rows])
+            db.session.commit()
+            # The dashboard series are aggregated from the Plays table
+            analytics.invalidate()
+        except Exception as error:
+            db.session.rollback()
+            events = sum(row['play_count'] for row in rows)
+            if _requeue(pending):
+                logger.warning("Could not write %s play events, retrying with the next batch: %s", events, error)
+            else:
+                logger.error("Could not write %s play events, dropped (buffer full): %s", events, error)
+            return None
+        finally:
+            db.session.close()
+    return len(rows)
+
+
+metrics.gauge_callback('cassette_play_buffer_events', buffered)
+metrics.gauge_callback('cassette_play_buffer_capacity', lambda: MAX_BUFFERED)
+
+
+@atexit.register
+def _flush_on_exit():
+    if _app is not None and _flusher_pid == os.getpid():
+        flush()
@@ -0,0 +1,198 @@
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import current_app, g, request
+from flask_login import current_user
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Sampling profiler
+# Opt-in (PROFILING_ENABLED=1), for the admins. Instead of tracing every call (cProfile), a thread
+# looks at the stacks of the other threads every few milliseconds and counts them. The result is in
+# the "collapsed stack" format of flamegraph.pl and speedscope, one stack per line:
+#     flask.app:wsgi_app;...;application.blueprints.catalog:user_dashboard;... 42
+#
+# Two ways to use it:
+#   - /api/admin/profile?seconds=10 samples the threads serving requests in every worker process on
+#     the machine for 10 seconds, and returns the stacks of all of them. The request is announced
+#     with a file in PROFILES_DIR (instance/profiles), which a watcher thread of every worker looks for.
+#   - Any page requested by an admin with the header "X-Profile: 1" is sampled on its own (every
+#     millisecond), and the stacks are returned instead of the page (the page's status is in the
+#     X-Profile-Status header).
+
+SAMPLE_INTERVAL = 0.01
+REQUEST_SAMPLE_INTERVAL = 0.001
+MAX_SECONDS = 60
+WATCH_INTERVAL = 1
+COLLECT_GRACE_SECONDS = 2 * WATCH_INTERVAL
+
+# Threads serving a request (set.add/discard are atomic)
+_request_threads = set()
+_watcher = None
+_watcher_pid = None
+_watcher_lock = threading.Lock()
+_profiles_dir = None
+
+
+# Function: "module:function" names of a frame and its callers, outermost first
+def collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    # targets() returns the idents of the threads to sample
+    def __init__(self, targets, interval=SAMPLE_INTERVAL):
+        super().__init__(name="cassette-profiler", daemon=True)
+        self.targets = targets
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in self.targets():
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[collapse(frame)] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return self.stacks
+
+
+def format_stacks(stacks):
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def parse_stacks(text):
+    stacks = Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(' ')
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
+
+
+# ------------------------------ Profiling every worker
+def _request_path():
+    return os.path.join(_profiles_dir, 'request.json')
+
+
+def _watch():
+    seen = set()
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        try:
+            with open(_request_path()) as request_file:
+                profile = json.load(request_file)
+        except (OSError, ValueError):
+            continue
+        remaining = profile['started'] + profile['seconds'] - time.time()
+        if profile['id'] in seen or remaining <= 0:
+            continue
+        seen.add(profile['id'])
+
+        excluded = set(profile.get('exclude', {}).get(str(os.getpid()), []))
+        sampler = Sampler(lambda: [ident for ident in list(_request_threads) if ident not in excluded])
+        sampler.start()
+        time.sleep(remaining)
+        stacks = sampler.stop()
+        path = os.path.join(_profiles_dir, f"{profile['id']}-{os.getpid()}.folded")
+        try:
+            with open(f"{path}.tmp", 'w') as profile_file:
+                profile_file.write(format_stacks(stacks))
+            os.replace(f"{path}.tmp", path)
+        except OSError as error:
+            logger.warning("Could not write the profile %s: %s", path, error)
+
+
+def _ensure_watcher():
+    global _watcher, _watcher_pid
+    if _watcher is not None and _watcher_pid == os.getpid() and _watcher.is_alive():
+        return
+    with _watcher_lock:
+        if _watcher is None or _watcher_pid != os.getpid() or not _watcher.is_alive():
+            _watcher = threading.Thread(target=_watch, name="cassette-profile-watcher", daemon=True)
+            _watcher.start()
+            _watcher_pid = os.getpid()
+
+
+# Function: Sample the request threads of every worker for "seconds", and return the merged stacks
+def profile_workers(seconds):
+    os.makedirs(_profiles_dir, exist_ok=True)
+    profile_id = uuid.uuid4().hex[:12]
+    profile = {'id': profile_id, 'seconds': seconds, 'started': time.time(),
+               # The thread waiting for the result is not worth sampling
+               'exclude': {str(os.getpid()): [threading.get_ident()]}}
+    tmp_path = f"{_request_path()}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as request_file:
+        json.dump(profile, request_file)
+    os.replace(tmp_path, _request_path())
+
+    time.sleep(seconds + COLLECT_GRACE_SECONDS)
+    stacks = Counter()
+    paths = glob.glob(os.path.join(_profiles_dir, f"{profile_id}-*.folded"))
+    for path in paths:
+        with open(path) as profile_file:
+            stacks.update(parse_stacks(profile_file.read()))
+        os.remove(path)
+    return stacks, len(paths)
+
+
+# ------------------------------ Profiling one request
+def _is_admin():
+    return current_user.is_authenticated and current_user.role == 0
+
+
+def _start_request():
+    _request_threads.add(threading.get_ident())
+    _ensure_watcher()
+    if request.headers.get('X-Profile') and _is_admin():
+        ident = threading.get_ident()
+        g.request_sampler = Sampler(lambda: [ident], interval=REQUEST_SAMPLE_INTERVAL)
+        g.request_sampler.start()
+
+
+def _finish_request(response):
+    sampler = g.pop('request_sampler', None)
+    if sampler is None:
+        return response
+    stacks = sampler.stop()
+    profile = current_app.response_class(format_stacks(stacks), mimetype='text/plain')
+    profile.headers['X-Profile-Status'] = str(response.status_code)
+    profile.headers['X-Profile-Samples'] = str(sampler.samples)
+    profile.headers['Cache-Control'] = 'no-store'
+    return profile
+
+
+def _teardown_request(error):
+    _request_threads.discard(threading.get_ident())
+
+
+def enabled():
+    return _profiles_dir is not None
+
+
+def init_app(app):
+    global _profiles_dir
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    _profiles_dir = app.config.get('PROFILES_DIR') or os.path.join(app.instance_path, 'profiles')
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
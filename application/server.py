@@ -0,0 +1,261 @@
+import logging
+import os
+import random
+import signal
+import socket
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from .database import db
+from . import logs
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Production server
+# "flask serve": a pre-forking WSGI server, stdlib and Werkzeug only.
+#     master      binds the socket, forks SERVER_WORKERS worker processes and replaces the ones that
+#                 exit; it never serves requests and holds no database connections
+#     workers     accept from the shared socket, and serve the requests with a pool of
+#                 SERVER_THREADS threads (database and file I/O release the GIL)
+#
+# The app is created before forking (preload), so the workers start serving right away. What can't
+# be shared with a forked process is reset in the workers: the database engines are disposed of, and
+# the background threads (log listener, metrics, play buffer, jobs) are started again in the worker
+# that needs them (see application/logs.py, metrics.py, plays.py and jobs.py).
+#
+# Signals (to the master):
+#     SIGTERM, SIGINT   graceful stop: the workers finish the requests they have (up to
+#                       SERVER_GRACEFUL_TIMEOUT seconds) and exit
+#     SIGHUP            graceful reload: the master re-executes itself on the same socket (the new
+#                       code and .env are loaded), starts new workers, then stops the old ones
+#     SIGTTIN, SIGTTOU  one more, one less worker
+# A worker exits after SERVER_MAX_REQUESTS requests (plus a random jitter, so they don't all restart
+# at the same time) and is replaced: memory that leaks or fragments is given back.
+
+# Set on a reload, for the re-executed master
+LISTENER_FD_ENV = 'CASSETTE_SERVER_FD'
+OLD_WORKERS_ENV = 'CASSETTE_SERVER_OLD_WORKERS'
+
+LISTEN_BACKLOG = 2048
+# Master loop: how often exited workers are reaped and replaced
+TICK_SECONDS = 0.5
+
+
+# Function: (host, port) from "host:port", ":port" or "port"
+def parse_bind(bind):
+    host, _, port = str(bind).rpartition(':')
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+
+class RequestHandler(WSGIRequestHandler):
+    # No access log: the app already logs every request (cassette.requests, see application/instrumentation.py)
+    def log_request(self, code='-', size='-'):
+        pass
+
+    def handle_one_request(self):
+        super().handle_one_request()
+        self.server.requests += 1
+
+
+# Werkzeug's server, with a fixed pool of threads instead of one thread per connection
+class PooledWSGIServer(ThreadingMixIn, BaseWSGIServer):
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, listener, app, threads, timeout):
+        host, port = listener.getsockname()[:2]
+        # Werkzeug closes the connection after every response (no keep-alive): a thread is only
+        # held by a connection for its request, or until a stalled client times out
+        handler = type('RequestHandler', (RequestHandler,), {'timeout': timeout})
+        super().__init__(host, port, app, handler=handler, fd=listener.fileno())
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='cassette-request')
+        self.timeout = TICK_SECONDS
+        self.requests = 0
+        self.stopping = False
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def serve(self, max_requests, master_pid):
+        while not self.stopping:
+            self.handle_request()
+            if max_requests and self.requests >= max_requests:
+                logger.info("Worker %s served %s requests, exiting", os.getpid(), self.requests)
+                self.stopping = True
+            elif os.getppid() != master_pid:
+                logger.warning("Worker %s lost its master, exiting", os.getpid())
+                self.stopping = True
+        # The requests in progress finish, the master kills the worker after the graceful timeout
+        self.pool.shutdown(wait=True)
+        self.socket.close()
+
+
+class Arbiter:
+    def __init__(self, app, bind, workers, threads, max_requests, max_requests_jitter, graceful_timeout, timeout):
+        self.app = app
+        self.bind = bind
+        self.worker_count = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.timeout = timeout
+        self.listener = None
+        self.workers = {}           # pid: start time
+        self.retiring = {}          # pid: time by which it must have exited
+        self.signal = None
+        self.pid = os.getpid()
+
+    # ------------------------------ Master
+    def run(self):
+        self.listener = self._listen()
+        host, port = self.listener.getsockname()[:2]
+        # No connection of the master's pool may end up in a worker
+        with self.app.app_context():
+            db.engine.dispose()
+
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, self._on_signal)
+
+        # After a reload: the workers of the previous code stop once the new ones are started
+        old_workers = [int(pid) for pid in os.environ.pop(OLD_WORKERS_ENV, '').split(',') if pid]
+        logger.info("Serving on %s:%s with %s workers of %s threads (master %s)",
+                    host, port, self.worker_count, self.threads, self.pid)
+        print(f"Serving on http://{host}:{port}/ with {self.worker_count} workers of {self.threads} threads "
+              f"(master {self.pid})", flush=True)
+
+        while True:
+            self._reap()
+            received, self.signal = self.signal, None
+            if received in (signal.SIGTERM, signal.SIGINT):
+                self.stop()
+                return
+            if received == signal.SIGHUP:
+                self.reload()
+            elif received == signal.SIGTTIN:
+                self.worker_count += 1
+            elif received == signal.SIGTTOU and self.worker_count > 1:
+                self.worker_count -= 1
+                self._retire([max(self.workers, key=self.workers.get)])
+
+            while len(self.workers) < self.worker_count:
+                self.spawn()
+            if old_workers:
+                self._retire(old_workers)
+                old_workers = []
+            self._kill_late()
+            # The workers write to the same log file, the master alone rotates it
+            logs.rotate_if_needed()
+            time.sleep(TICK_SECONDS)
+
+    def _on_signal(self, signum, frame):
+        self.signal = signum
+
+    def _listen(self):
+        fd = os.environ.pop(LISTENER_FD_ENV, None)
+        if fd is not None:
+            return socket.socket(fileno=int(fd))
+        return socket.create_server(parse_bind(self.bind), backlog=LISTEN_BACKLOG)
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            code = os.waitstatus_to_exitcode(status)
+            if pid in self.workers:
+                del self.workers[pid]
+                if code != 0:
+                    logger.warning("Worker %s exited with status %s", pid, code)
+            self.retiring.pop(pid, None)
+
+    # Function: Graceful stop of some workers (SIGTERM, then SIGKILL after the graceful timeout)
+    def _retire(self, pids):
+        for pid in pids:
+            self.workers.pop(pid, None)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                continue
+            self.retiring[pid] = time.monotonic() + self.graceful_timeout
+
+    def _kill_late(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if deadline < now:
+                logger.warning("Worker %s didn't stop in %s seconds, killed", pid, self.graceful_timeout)
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                del self.retiring[pid]
+
+    def stop(self):
+        logger.info("Stopping the workers")
+        self._retire(list(self.workers))
+        while self.retiring:
+            self._reap()
+            self._kill_late()
+            time.sleep(0.1)
+        self.listener.close()
+
+    # Function: Re-execute the master with the same command line, keeping the socket and the old workers
+    def reload(self):
+        logger.info("Reloading")
+        os.set_inheritable(self.listener.fileno(), True)
+        os.environ[LISTENER_FD_ENV] = str(self.listener.fileno())
+        os.environ[OLD_WORKERS_ENV] = ','.join(str(pid) for pid in [*self.workers, *self.retiring])
+        # Write the queued log records, the log thread doesn't survive exec
+        logs.stop_logging()
+        sys.stdout.flush()
+        os.execv(sys.executable, sys.orig_argv)
+
+    def spawn(self):
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            max_requests += random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return
+        # Worker process: never returns to the master's code
+        sys.exit(self.run_worker(max_requests))
+
+    # ------------------------------ Worker
+    def run_worker(self, max_requests):
+        server = None
+        stopped = []
+
+        def stop(signum, frame):
+            stopped.append(signum)
+            if server is not None:
+                server.stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        # Ctrl+C reaches the whole process group: the master decides
+        for signum in (signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, signal.SIG_IGN)
+
+        try:
+            # The engines were disposed of before forking: this only drops what the pools still
+            # reference, without closing connections that belong to the master
+            with self.app.app_context():
+                for engine in db.engines.values():
+                    engine.dispose(close=False)
+            server = PooledWSGIServer(self.listener, self.app, self.threads, self.timeout)
+            server.stopping = bool(stopped)
+            server.serve(max_requests, self.pid)
+        except Exception as error:
+            logger.exception(error)
+            return 1
+        return 0
+
+
+def serve(app, bind, workers, threads, max_requests=0, max_requests_jitter=0, graceful_timeout=30, timeout=30):
+    Arbiter(app, bind, workers, threads, max_requests, max_requests_jitter, graceful_timeout, timeout).run()
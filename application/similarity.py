@@ -0,0 +1,345 @@
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import numpy as np
+from flask import current_app
+from . import jobs
+from .audio_features import FEATURE_DIM, bytes_to_vector
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process that asks for a rebuild does it
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ "Sounds like" index
+# An IVF (inverted file) approximate nearest-neighbour index over the SongFeatures vectors.
+# Vectors are standardised, clustered with k-means into NLIST lists, and only the NPROBE
+# closest lists are scanned for a query.
+#
+# The index is persisted into a single file, which every worker opens with mmap,
+# so all the workers on a machine share one copy of it through the page cache.
+#
+# File layout (little-endian):
+#     header    MAGIC, version, dim, nlist, count, max_song_id
+#     mean      dim float32
+#     std       dim float32
+#     centroids nlist * dim float32
+#     offsets   (nlist + 1) int64     start of every list inside ids/vectors
+#     ids       count int64           song_ids, grouped by list
+#     vectors   count * dim float32   standardised vectors, grouped by list
+
+MAGIC = b'CSTSIM01'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIQQ')
+NPROBE = 8
+KMEANS_ITERATIONS = 12
+KMEANS_SAMPLE = 20000
+RELOAD_CHECK_SECONDS = 5
+# A process asks for at most one background rebuild every REBUILD_SECONDS
+REBUILD_SECONDS = 60
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+# Function: Plain k-means with NumPy, returns the centroids
+def _kmeans(vectors, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = vectors
+    if len(vectors) > KMEANS_SAMPLE:
+        sample = vectors[rng.choice(len(vectors), KMEANS_SAMPLE, replace=False)]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = _nearest_centroid(sample, centroids)
+        for list_id in range(nlist):
+            members = sample[assignment == list_id]
+            if len(members):
+                centroids[list_id] = members.mean(axis=0)
+    return centroids
+
+
+def _nearest_centroid(vectors, centroids):
+    # |v - c|^2 = |v|^2 - 2 v.c + |c|^2, and |v|^2 doesn't change the argmin
+    distances = -2 * vectors @ centroids.T + (centroids ** 2).sum(axis=1)
+    return np.argmin(distances, axis=1)
+
+
+# Function: Build the index file out of (song_id, vector) pairs
+# The file is written next to the target and swapped in with os.replace, so readers never see half a file.
+def build_index(path, song_ids, vectors):
+    song_ids = np.asarray(song_ids, dtype='<i8')
+    vectors = np.asarray(vectors, dtype='<f4').reshape(-1, FEATURE_DIM)
+    count = len(song_ids)
+
+    if count:
+        mean = vectors.mean(axis=0)
+        std = vectors.std(axis=0)
+        std[std < 1e-6] = 1.0
+        normalised = ((vectors - mean) / std).astype('<f4')
+        nlist = max(1, min(count, int(np.sqrt(count))))
+        centroids = _kmeans(normalised, nlist).astype('<f4')
+        assignment = _nearest_centroid(normalised, centroids)
+        order = np.argsort(assignment, kind='stable')
+        song_ids, normalised, assignment = song_ids[order], normalised[order], assignment[order]
+        offsets = np.searchsorted(assignment, np.arange(nlist + 1)).astype('<i8')
+        max_song_id = int(song_ids.max())
+    else:
+        mean = np.zeros(FEATURE_DIM, dtype='<f4')
+        std = np.ones(FEATURE_DIM, dtype='<f4')
+        normalised = np.zeros((0, FEATURE_DIM), dtype='<f4')
+        nlist = 0
+        centroids = np.zeros((0, FEATURE_DIM), dtype='<f4')
+        offsets = np.zeros(1, dtype='<i8')
+        max_song_id = 0
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    with open(temp_path, 'wb') as index_file:
+        index_file.write(HEADER.pack(MAGIC, VERSION, FEATURE_DIM, nlist, count, max_song_id))
+        for array in (mean.astype('<f4'), std.astype('<f4'), centroids, offsets, song_ids, normalised):
+            index_file.write(b'\0' * (_align(index_file.tell()) - index_file.tell()))
+            index_file.write(np.ascontiguousarray(array).tobytes())
+        index_file.flush()
+        os.fsync(index_file.fileno())
+    os.replace(temp_path, path)
+    return count
+
+
+# Class: A read-only view of an index file, mapped into memory
+class SimilarityIndex:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as index_file:
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.stat = os.fstat(index_file.fileno())
+
+        magic, version, dim, nlist, count, max_song_id = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION or dim != FEATURE_DIM:
+            raise ValueError(f"{path} is not a compatible similarity index")
+        self.nlist, self.count, self.max_song_id = nlist, count, max_song_id
+
+        offset = HEADER.size
+        arrays = []
+        for dtype, length in (('<f4', dim), ('<f4', dim), ('<f4', nlist * dim),
+                              ('<i8', nlist + 1), ('<i8', count), ('<f4', count * dim)):
+            offset = _align(offset)
+            arrays.append(np.frombuffer(self._mmap, dtype=dtype, count=length, offset=offset))
+            offset += length * np.dtype(dtype).itemsize
+        self.mean, self.std, centroids, self.offsets, self.song_ids, vectors = arrays
+        self.centroids = centroids.reshape(nlist, dim)
+        self.vectors = vectors.reshape(count, dim)
+        self._order = None
+
+    def normalise(self, vector):
+        return (np.asarray(vector, dtype=np.float32) - self.mean) / self.std
+
+    # Function: Look up the stored (normalised) vector of an indexed song
+    def vector_of(self, song_id):
+        if self._order is None:
+            self._order = np.argsort(self.song_ids, kind='stable')
+        position = int(np.searchsorted(self.song_ids, song_id, sorter=self._order))
+        if position >= self.count or self.song_ids[self._order[position]] != song_id:
+            return None
+        return self.vectors[self._order[position]]
+
+    # Function: k nearest songs to a normalised query vector, as a list of (song_id, distance)
+    def search(self, query, k=10, nprobe=NPROBE, exclude=()):
+        if not self.count:
+            return []
+        nprobe = min(nprobe, self.nlist)
+        probe = np.argsort(((self.centroids - query) ** 2).sum(axis=1))[:nprobe]
+
+        ids, distances = [], []
+        for list_id in probe:
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            ids.append(self.song_ids[start:end])
+            distances.append(((self.vectors[start:end] - query) ** 2).sum(axis=1))
+        if not ids:
+            return []
+        ids = np.concatenate(ids)
+        distances = np.concatenate(distances)
+
+        wanted = min(len(ids), k + len(exclude))
+        nearest = np.argpartition(distances, wanted - 1)[:wanted]
+        nearest = nearest[np.argsort(distances[nearest])]
+        results = [(int(ids[row]), float(np.sqrt(distances[row])))
+                   for row in nearest if int(ids[row]) not in exclude]
+        return results[:k]
+
+    def close(self):
+        self._mmap.close()
+
+
+# ------------------------------ Per-process access to the shared index
+_index = None
+_index_checked_at = 0
+_index_lock = threading.Lock()
+
+
+# Function: Return the mapped index for this process, re-mapping it when the file got rebuilt
+def get_index(path):
+    global _index, _index_checked_at
+
+    now = time.monotonic()
+    if _index is not None and now - _index_checked_at < RELOAD_CHECK_SECONDS:
+        return _index
+
+    with _index_lock:
+        _index_checked_at = now
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            _index = None
+            return None
+        if _index is None or (stat.st_ino, stat.st_mtime_ns) != (_index.stat.st_ino, _index.stat.st_mtime_ns):
+            try:
+                _index = SimilarityIndex(path)
+            except (OSError, ValueError) as error:
+                logger.error("Could not load the similarity index: %s", error)
+                _index = None
+    return _index
+
+
+# Function: Rebuild the index file from every row in SongFeatures
+def rebuild_index(path):
+    from .database import db
+    from .models import SongFeatures
+
+    rows = db.session.query(SongFeatures.song_id, SongFeatures.vector).all()
+    song_ids = [song_id for song_id, _ in rows]
+    vectors = np.array([bytes_to_vector(vector) for _, vector in rows], dtype='<f4').reshape(-1, FEATURE_DIM)
+    count = build_index(path, song_ids, vectors)
+    logger.info("Similarity index rebuilt with %s songs", count)
+    return count
+
+
+# ------------------------------ Songs uploaded after the last rebuild
+# They are not in the file yet, so they are scanned exactly from the database (the "pending" songs).
+# Once there are SIMILARITY_REBUILD_PENDING of them, a background job rebuilds the index, so that
+# the exact scan stays small; one process rebuilds at a time (a lock file next to the index).
+_rebuild_requested_at = 0
+
+
+# Function: Background job: rebuild the index, unless another process is doing it or just did
+def _rebuild(path):
+    from .database import db
+    from .models import SongFeatures
+
+    lock_file = open(f"{path}.lock", 'w')
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+        # The header of the file itself: another process may have rebuilt it since this one mapped it
+        try:
+            with open(path, 'rb') as index_file:
+                max_song_id = HEADER.unpack(index_file.read(HEADER.size))[5]
+        except (FileNotFoundError, struct.error):
+            max_song_id = 0
+        pending = db.session.query(SongFeatures.song_id).filter(SongFeatures.song_id > max_song_id).count()
+        if pending < current_app.config['SIMILARITY_REBUILD_PENDING']:
+            return
+        rebuild_index(path)
+    finally:
+        lock_file.close()
+
+
+def _request_rebuild(path):
+    global _rebuild_requested_at
+    now = time.monotonic()
+    with _index_lock:
+        if now - _rebuild_requested_at < REBUILD_SECONDS:
+            return
+        _rebuild_requested_at = now
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    jobs.enqueue(current_app._get_current_object(), _rebuild, path)
+
+
+# Function: The vectors of the songs missing from the index, {song_id: vector}
+def pending_vectors(path, index):
+    from .database import db
+    from .models import SongFeatures
+
+    max_song_id = index.max_song_id if index is not None else 0
+    pending = {pending_id: bytes_to_vector(vector) for pending_id, vector in
+               db.session.query(SongFeatures.song_id, SongFeatures.vector)
+               .filter(SongFeatures.song_id > max_song_id)
+               .all()}
+    if len(pending) >= current_app.config['SIMILARITY_REBUILD_PENDING']:
+        _request_rebuild(path)
+    return pending
+
+
+# Function: k nearest songs to the given song, in the index and among the pending songs
+def _nearest(index, pending, song_id, k):
+    from .database import db
+    from .models import SongFeatures
+
+    if index is not None:
+        mean, std = index.mean, index.std
+    elif pending:
+        # No index file yet: standardise with the statistics of whatever has been extracted so far
+        stacked = np.array(list(pending.values()))
+        mean, std = stacked.mean(axis=0), stacked.std(axis=0)
+        std[std < 1e-6] = 1.0
+    else:
+        return []
+
+    query = index.vector_of(song_id) if index is not None else None
+    if query is None:
+        vector = pending.get(song_id)
+        if vector is None:
+            features = db.session.get(SongFeatures, song_id)
+            if features is None:
+                return []
+            vector = bytes_to_vector(features.vector)
+        query = (vector - mean) / std
+
+    results = index.search(query, k, exclude={song_id}) if index is not None else []
+    for pending_id, vector in pending.items():
+        if pending_id != song_id:
+            results.append((pending_id, float(np.sqrt(((((vector - mean) / std) - query) ** 2).sum()))))
+
+    results.sort(key=lambda result: result[1])
+    return results[:k]
+
+
+# Function: k nearest songs to the given song
+def similar_songs(path, song_id, k=10):
+    index = get_index(path)
+    return _nearest(index, pending_vectors(path, index), song_id, k)
+
+
+# Function: "Sounds like" radio
+# A walk through the index: every next song is picked among the closest unplayed neighbours of the current one,
+# so the station drifts away from the seed song instead of looping around it.
+# The index and the pending songs are loaded once for the whole walk.
+def radio(path, seed_song_id, length=25, fanout=3, rng=None):
+    rng = rng or random.Random()
+    index = get_index(path)
+    pending = pending_vectors(path, index)
+    played = {seed_song_id}
+    current = seed_song_id
+    yield seed_song_id
+
+    while len(played) < length:
+        neighbours = [song_id for song_id, _ in _nearest(index, pending, current, k=fanout + len(played))
+                      if song_id not in played][:fanout]
+        if not neighbours:
+            return
+        current = rng.choice(neighbours)
+        played.add(current)
+        yield current
@@ -0,0 +1,433 @@
+import logging
+import time
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import bindparam, event, func, inspect, literal, or_, select
+from sqlalchemy.orm import Session
+from . import jobs
+from .cache import SharedCache, claim, invalidate_tags
+from .database import db
+from .models import Users, Genres, Songs, Albums, Playlists, Ratings, Plays, StatCounters
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Dashboard statistics
+# The dashboards read maintained counters (the stat_counters table) instead of counting and
+# grouping the big tables on every view:
+#     users <role>                    accounts per role
+#     songs, albums                   totals
+#     user_songs, user_albums, user_playlists <user_id>
+#     creator_rating_sum, creator_ratings <creator_id>   ratings of the songs of a creator
+#     song_plays <song_id>            plays of a song (owner_id: the song's creator)
+#     user_plays <user_id>            plays by a listener
+#     genres                          genres with songs
+# and the song_count of every row of the genres table (the songs of that genre).
+#
+# The counters change in the same transaction as the rows they count: inserts, deletes and
+# changes of a counted column (a user's role, a song's genre) flushed by the ORM, ORM bulk inserts
+# (the play events, see application/plays.py) and Query(...).delete(), whose rows are counted
+# with a SELECT of the same WHERE clause before they go.
+# Writes that bypass the ORM (raw SQL, benchmarks/dataset.py) make them drift: reconcile() recomputes
+# all of them from the tables, in a background job every STATS_RECONCILE_SECONDS (see below), and on
+# demand with "flask reconcile-stats".
+#
+# Reads are one query per dashboard, cached for CACHE_SECONDS in the "stats" shared cache (see
+# application/cache.py), tagged "stats": committing a change to the counters drops them in every
+# worker (and every node with a shared CACHE_BACKEND).
+
+CACHE_SECONDS = 30
+IN_CHUNK = 500
+
+stats_cache = SharedCache('stats', maxsize=1024, ttl=CACHE_SECONDS)
+
+# Counted models: (key columns, summed column)
+COUNTED = {
+    Users: (('role',), None),
+    Songs: (('genre_id', 'user_id', 'song_id'), None),
+    Albums: (('user_id',), None),
+    Playlists: (('user_id',), None),
+    Ratings: (('song_id',), 'rating'),
+    Plays: (('song_id', 'user_id'), 'play_count'),
+}
+
+ADMIN_COUNTERS = ('users', 'songs', 'albums', 'genres', 'song_plays', 'user_plays')
+CREATOR_COUNTERS = ('user_songs', 'user_albums', 'user_playlists', 'creator_rating_sum', 'creator_ratings')
+
+
+# Function: Counter changes for "count" rows of a model with the given key values (total: their summed column)
+# [(name, subject_id, owner_id, amount), ...]
+def _contributions(model, keys, count, total, owners):
+    if model is Users:
+        return [('users', keys['role'], None, count)]
+    if model is Songs:
+        return [('songs', 0, None, count), ('genre_songs', keys['genre_id'], None, count),
+                ('user_songs', keys['user_id'], None, count)]
+    if model is Albums:
+        return [('albums', 0, None, count), ('user_albums', keys['user_id'], None, count)]
+    if model is Playlists:
+        return [('user_playlists', keys['user_id'], None, count)]
+    if model is Ratings:
+        owner = owners.get(keys['song_id'])
+        if owner is None:
+            return []
+        return [('creator_rating_sum', owner, None, total), ('creator_ratings', owner, None, count)]
+    if model is Plays:
+        return [('song_plays', keys['song_id'], owners.get(keys['song_id']), total),
+                ('user_plays', keys['user_id'], None, total)]
+    return []
+
+
+# Function: {song_id: creator} of the songs (needed for the ratings and plays)
+def _owners(connection, song_ids):
+    song_ids = sorted({song_id for song_id in song_ids if song_id is not None})
+    owners = {}
+    for start in range(0, len(song_ids), IN_CHUNK):
+        chunk = song_ids[start:start + IN_CHUNK]
+        owners.update(connection.execute(select(Songs.song_id, Songs.user_id)
+                                         .where(Songs.song_id.in_(chunk))).all())
+    return owners
+
+
+# Function: Apply [(model, keys, count, total)] (counts and totals negative for removed rows)
+def _apply(session, connection, entries):
+    owners = {}
+    song_ids = [keys['song_id'] for model, keys, _, _ in entries if model in (Ratings, Plays)]
+    if song_ids:
+        owners = _owners(connection, song_ids)
+
+    deltas = defaultdict(lambda: [None, 0])
+    for model, keys, count, total in entries:
+        for name, subject_id, owner_id, amount in _contributions(model, keys, count, total, owners):
+            if subject_id is None or not amount:
+                continue
+            delta = deltas[(name, subject_id)]
+            delta[0] = owner_id if owner_id is not None else delta[0]
+            delta[1] += amount
+    rows = [{'name': name, 'subject_id': subject_id, 'owner_id': owner_id, 'value': amount}
+            for (name, subject_id), (owner_id, amount) in deltas.items() if amount]
+    if not rows:
+        return
+    genre_rows = [row for row in rows if row['name'] == 'genre_songs']
+    if genre_rows:
+        table = Genres.__table__
+        # A genre getting its first song, or losing its last one, changes the "genres" counter
+        song_counts = dict(connection.execute(select(table.c.genre_id, table.c.song_count)
+                                              .where(table.c.genre_id.in_([row['subject_id'] for row in genre_rows])))
+                           .all())
+        crossed = sum((song_counts.get(row['subject_id'], 0) + row['value'] > 0)
+                      - (song_counts.get(row['subject_id'], 0) > 0) for row in genre_rows)
+        connection.execute(table.update()
+                           .where(table.c.genre_id == bindparam('subject_id'))
+                           .values(song_count=table.c.song_count + bindparam('value')),
+                           [{'subject_id': row['subject_id'], 'value': row['value']} for row in genre_rows])
+        rows = [row for row in rows if row['name'] != 'genre_songs']
+        if crossed:
+            rows.append({'name': 'genres', 'subject_id': 0, 'owner_id': None, 'value': crossed})
+    if rows:
+        _increment(connection, rows)
+    session.info['stats_changed'] = True
+
+
+def _increment(connection, rows):
+    table = StatCounters.__table__
+    if connection.dialect.name in ('sqlite', 'postgresql'):
+        if connection.dialect.name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.name, table.c.subject_id],
+            set_={'value': table.c.value + statement.excluded.value,
+                  'owner_id': func.coalesce(statement.excluded.owner_id, table.c.owner_id)})
+        connection.execute(statement, rows)
+        return
+    for row in rows:
+        updated = connection.execute(table.update()
+                                     .where(table.c.name == row['name'], table.c.subject_id == row['subject_id'])
+                                     .values(value=table.c.value + row['value'],
+                                             owner_id=func.coalesce(row['owner_id'], table.c.owner_id)))
+        if updated.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+
+# ------------------------------ Counting the ORM's writes
+# Function: The ratings of songs being deleted stop counting for their creators (if they are left behind)
+def _ratings_of(connection, song_ids):
+    entries = []
+    for start in range(0, len(song_ids), IN_CHUNK):
+        chunk = song_ids[start:start + IN_CHUNK]
+        rows = connection.execute(select(Ratings.song_id, func.count(), func.sum(Ratings.rating))
+                                  .where(Ratings.song_id.in_(chunk))
+                                  .group_by(Ratings.song_id))
+        entries.extend((Ratings, {'song_id': song_id}, -count, -total) for song_id, count, total in rows)
+    return entries
+
+
+def _current(instance, columns):
+    return {column: getattr(instance, column) for column in columns}
+
+
+# Function: Values of the columns as they are in the database (before the changes of this flush)
+def _committed(connection, instance, columns):
+    state = inspect(instance)
+    values, unknown = {}, []
+    for column in columns:
+        history = state.attrs[column].history
+        if history.deleted:
+            values[column] = history.deleted[0]
+        elif history.added:
+            # Set after the instance expired (e.g. after a commit): the old value was never loaded
+            unknown.append(column)
+        else:
+            values[column] = getattr(instance, column)
+    if unknown:
+        table = type(instance).__table__
+        identity = [key == value for key, value in zip(state.mapper.primary_key, state.identity)]
+        values.update(zip(unknown, connection.execute(select(*[table.c[column] for column in unknown])
+                                                      .where(*identity)).one()))
+    return values
+
+
+def _entry(model, values, sign):
+    columns, summed = COUNTED[model]
+    total = (values.get(summed) or 0) if summed else 0
+    return model, {column: values[column] for column in columns}, sign, sign * total
+
+
+def _columns(model):
+    columns, summed = COUNTED[model]
+    return columns + (summed,) if summed else columns
+
+
+@event.listens_for(Session, 'before_flush')
+def _count_flushed(session, flush_context, instances):
+    connection = session.connection()
+    entries = []
+    for instance in session.new:
+        model = type(instance)
+        if model in COUNTED:
+            entries.append(_entry(model, _current(instance, _columns(model)), 1))
+    for instance in session.deleted:
+        model = type(instance)
+        if model in COUNTED:
+            entries.append(_entry(model, _committed(connection, instance, _columns(model)), -1))
+    for instance in session.dirty:
+        model = type(instance)
+        if model not in COUNTED or instance in session.deleted:
+            continue
+        attributes = inspect(instance).attrs
+        if any(attributes[column].history.has_changes() for column in _columns(model)):
+            entries.append(_entry(model, _committed(connection, instance, _columns(model)), -1))
+            entries.append(_entry(model, _current(instance, _columns(model)), 1))
+    deleted_songs = [instance.song_id for instance in session.deleted if isinstance(instance, Songs)]
+    if deleted_songs:
+        entries.extend(_ratings_of(connection, deleted_songs))
+    if entries:
+        _apply(session, connection, entries)
+
+
+# ORM bulk inserts (session.execute(insert(Model), rows)) and Query(...).delete() skip the flush.
+# There are no bulk updates of the counted columns; "flask reconcile-stats" would fix their drift.
+@event.listens_for(Session, 'do_orm_execute')
+def _count_bulk(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    model = mapper.class_ if mapper is not None else None
+    if model not in COUNTED:
+        return
+    columns, summed = COUNTED[model]
+    session = orm_execute_state.session
+
+    if orm_execute_state.is_insert:
+        rows = orm_execute_state.parameters
+        if isinstance(rows, dict):
+            rows = [rows]
+        if rows:
+            _apply(session, session.connection(), [_entry(model, row, 1) for row in rows])
+        return
+
+    if orm_execute_state.is_delete:
+        # Pending changes first, so they are counted (and deleted) like the rest
+        if session.autoflush:
+            session.flush()
+        table = model.__table__
+        key_columns = [table.c[column] for column in columns]
+        query = select(*key_columns, func.count(),
+                       func.coalesce(func.sum(table.c[summed]), 0) if summed else literal(0)).group_by(*key_columns)
+        whereclause = orm_execute_state.statement.whereclause
+        if whereclause is not None:
+            query = query.where(whereclause)
+        connection = session.connection()
+        entries = [(model, dict(zip(columns, row[:len(columns)])), -row[-2], -row[-1])
+                   for row in connection.execute(query).all()]
+        if model is Songs:
+            entries.extend(_ratings_of(connection, [keys['song_id'] for _, keys, _, _ in entries]))
+        if entries:
+            _apply(session, connection, entries)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_cached(session):
+    if session.info.pop('stats_changed', None):
+        invalidate_tags('stats')
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('stats_changed', None)
+
+
+# ------------------------------ Dashboard reads
+def admin_stats():
+    def compute():
+        counters = StatCounters.__table__.c
+        rows = db.session.execute(select(counters.name, counters.subject_id, counters.value)
+                                  .where(counters.name.in_(ADMIN_COUNTERS))
+                                  .order_by(counters.name, counters.subject_id)).all()
+        stats = {'standard_users_count': 0, 'creators_count': 0, 'songs_count': 0, 'albums_count': 0,
+                 'genres_count': 0, 'song_counts': {}, 'user_counts': {}}
+        for name, subject_id, value in rows:
+            if name == 'users' and subject_id in (1, 2):
+                stats['standard_users_count' if subject_id == 1 else 'creators_count'] = value
+            elif name in ('songs', 'albums', 'genres'):
+                stats[f'{name}_count'] = value
+            elif name == 'song_plays' and value > 0:
+                stats['song_counts'][subject_id] = value
+            elif name == 'user_plays' and value > 0:
+                stats['user_counts'][subject_id] = value
+        return stats
+    return stats_cache.get_or_set('admin', compute, tags=('stats',))
+
+
+# Function: Counts of a creator, and the plays of each of the creator's songs
+def creator_stats(user_id):
+    def compute():
+        counters = StatCounters.__table__.c
+        rows = db.session.execute(select(counters.name, counters.subject_id, counters.value)
+                                  .where(or_((counters.name.in_(CREATOR_COUNTERS)) & (counters.subject_id == user_id),
+                                             (counters.name == 'song_plays') & (counters.owner_id == user_id)))
+                                  .order_by(counters.name, counters.subject_id)).all()
+        values = {name: value for name, subject_id, value in rows if name != 'song_plays'}
+        ratings = values.get('creator_ratings', 0)
+        return {'my_songs_count': values.get('user_songs', 0),
+                'my_albums_count': values.get('user_albums', 0),
+                'my_playlists_count': values.get('user_playlists', 0),
+                'my_songs_average_rating': round(values.get('creator_rating_sum', 0) / ratings, 1) if ratings else 0,
+                'song_play_counts': {subject_id: value for name, subject_id, value in rows
+                                     if name == 'song_plays' and value > 0}}
+    return stats_cache.get_or_set(('creator', user_id), compute, tags=('stats',))
+
+
+# ------------------------------ Reconciliation
+# Function: Every counter, computed from the tables: {(name, subject_id): (owner_id, value)}
+def compute_counters():
+    session = db.session
+    counters = {}
+
+    def add(name, rows):
+        for subject_id, value, *owner in rows:
+            if subject_id is not None and value:
+                counters[(name, subject_id)] = (owner[0] if owner else None, int(value))
+
+    add('users', session.query(Users.role, func.count()).group_by(Users.role))
+    add('songs', [(0, session.query(func.count(Songs.song_id)).scalar())])
+    add('albums', [(0, session.query(func.count(Albums.album_id)).scalar())])
+    add('genres', [(0, session.query(func.count(func.distinct(Songs.genre_id))).scalar())])
+    add('user_songs', session.query(Songs.user_id, func.count()).group_by(Songs.user_id))
+    add('user_albums', session.query(Albums.user_id, func.count()).group_by(Albums.user_id))
+    add('user_playlists', session.query(Playlists.user_id, func.count()).group_by(Playlists.user_id))
+    rated = (session.query(Songs.user_id, func.sum(Ratings.rating), func.count())
+             .join(Songs, Ratings.song_id == Songs.song_id)
+             .group_by(Songs.user_id)
+             .all())
+    add('creator_rating_sum', [(user_id, total) for user_id, total, _ in rated])
+    add('creator_ratings', [(user_id, count) for user_id, _, count in rated])
+    song_plays = (session.query(Plays.song_id, func.sum(Plays.play_count))
+                  .group_by(Plays.song_id)
+                  .all())
+    owners = dict(session.query(Songs.song_id, Songs.user_id))
+    add('song_plays', [(song_id, total, owners.get(song_id)) for song_id, total in song_plays])
+    add('user_plays', session.query(Plays.user_id, func.sum(Plays.play_count)).group_by(Plays.user_id))
+    return counters
+
+
+# Function: Make the song_count of the genres match the songs, returns the number that were wrong
+def _reconcile_genres():
+    counts = dict(db.session.query(Songs.genre_id, func.count()).group_by(Songs.genre_id))
+    wrong = 0
+    for genre_id, song_count in db.session.query(Genres.genre_id, Genres.song_count).all():
+        if song_count != counts.get(genre_id, 0):
+            wrong += 1
+            db.session.execute(Genres.__table__.update().where(Genres.__table__.c.genre_id == genre_id)
+                               .values(song_count=counts.get(genre_id, 0)))
+    return wrong
+
+
+# Function: Make the counters match the tables, returns the number of counters that were wrong
+def reconcile():
+    table = StatCounters.__table__
+    try:
+        expected = compute_counters()
+        stored = {(name, subject_id): (owner_id, value)
+                  for name, subject_id, owner_id, value in db.session.execute(
+                      select(table.c.name, table.c.subject_id, table.c.owner_id, table.c.value))}
+        wrong = defaultdict(int)
+        stale = [key for key in stored if key not in expected]
+        changed = [key for key, counter in expected.items() if key in stored and stored[key] != counter]
+        missing = [key for key in expected if key not in stored]
+        for name, subject_id in stale:
+            if stored[(name, subject_id)][1]:
+                wrong[name] += 1
+            db.session.execute(table.delete().where(table.c.name == name, table.c.subject_id == subject_id))
+        for name, subject_id in changed:
+            # The owner of the plays of a deleted song is only cleared here, that's not a drift
+            if stored[(name, subject_id)][1] != expected[(name, subject_id)][1]:
+                wrong[name] += 1
+            owner_id, value = expected[(name, subject_id)]
+            db.session.execute(table.update()
+                               .where(table.c.name == name, table.c.subject_id == subject_id)
+                               .values(owner_id=owner_id, value=value))
+        for name, subject_id in missing:
+            wrong[name] += 1
+        rows = [{'name': name, 'subject_id': subject_id, 'owner_id': expected[(name, subject_id)][0],
+                 'value': expected[(name, subject_id)][1]} for name, subject_id in missing]
+        if rows:
+            db.session.execute(table.insert(), rows)
+        genres_wrong = _reconcile_genres()
+        if genres_wrong:
+            wrong['genre_songs'] = genres_wrong
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+    invalidate_tags('stats')
+    for name, count in sorted(wrong.items()):
+        logger.warning("Reconciled %s %s counters that had drifted", count, name)
+    return sum(wrong.values())
+
+
+# ------------------------------ Scheduled reconciliation
+# Every STATS_RECONCILE_SECONDS (a day by default, 0: never), one process reconciles the counters in a
+# background job (see application/jobs.py): the requests check, at most every RECONCILE_CHECK_SECONDS per
+# process, whether a period has started, and the first one to claim it (see cache.claim) enqueues the job.
+RECONCILE_CHECK_SECONDS = 60
+
+_reconcile_checked_at = 0
+
+
+def _schedule_reconcile():
+    global _reconcile_checked_at
+    seconds = current_app.config['STATS_RECONCILE_SECONDS']
+    now = time.monotonic()
+    if not seconds or now - _reconcile_checked_at < RECONCILE_CHECK_SECONDS:
+        return
+    _reconcile_checked_at = now
+    if claim('reconcile-stats', seconds):
+        jobs.enqueue(current_app._get_current_object(), reconcile)
+
+
+def init_app(app):
+    app.before_request(_schedule_reconcile)
@@ -0,0 +1,357 @@
+import asyncio
+import logging
+import os
+import re
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import unquote_to_bytes
+from zlib import adler32
+from werkzeug.http import HTTP_STATUS_CODES, http_date, is_resource_modified, parse_cookie, parse_range_header
+from . import identity, metrics
+from .cache import TTLCache
+from .database import db
+from .models import Songs
+
+
+logger = logging.getLogger(__name__)
+# Same logger as the WSGI stream route, so LOG_SAMPLING applies to both
+stream_logger = logging.getLogger('cassette.streams')
+
+# ------------------------------ Async stream server
+# A listener can hold a few hundred requests at once: every thread of a WSGI worker is busy for as
+# long as its stream lasts. This asyncio server (stdlib only) keeps thousands of connections per
+# process, for the routes of the audio player:
+#     GET/HEAD /stream/<id>        served here: Range, conditional requests, the file sent with
+#                                  loop.sendfile() (zero-copy, never blocks the event loop)
+#     /api/now_playing, /api/queue/...
+#                                  play events: short requests, passed to the Flask app in the
+#                                  thread pool, so they share its code, models and config
+# Everything else answers 404: the HTML routes stay on the WSGI servers, the proxy sends only the
+# paths above here (see README).
+# The database is only used from the thread pool (login check, song lookup), the event loop never
+# waits on it: songs are cached for SONG_CACHE_SECONDS, users by application/identity.py.
+#
+# Usage: flask stream-server --host 0.0.0.0 --port 8001 --threads 16
+
+STREAM_PATH = re.compile(r'/stream/(\d+)')
+PLAY_EVENT_PREFIXES = ('/api/now_playing', '/api/queue/')
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_SECONDS = 75
+SONG_CACHE_SECONDS = 30
+# On SIGTERM/SIGINT, streams in progress get this long to finish
+SHUTDOWN_SECONDS = 30
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+# Function: Headers of a response (ISO-8859-1, as HTTP wants them)
+def _head(status, headers):
+    lines = [f"HTTP/1.1 {status} {HTTP_STATUS_CODES.get(status, 'Unknown')}"]
+    lines += [f"{name}: {value}" for name, value in headers]
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+# Function: WSGI environ of a request (also what the werkzeug.http helpers read the headers from)
+def _environ(method, target, version, headers, peer, sockname):
+    path, _, query = target.partition('?')
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+        'QUERY_STRING': query,
+        'SERVER_NAME': str(sockname[0]) if sockname else 'localhost',
+        'SERVER_PORT': str(sockname[1]) if sockname else '80',
+        'SERVER_PROTOCOL': version,
+        'REMOTE_ADDR': str(peer[0]) if peer else '',
+        'REMOTE_PORT': str(peer[1]) if peer else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in headers:
+        key = name.upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        if key in environ:
+            environ[key] += ',' + value
+        else:
+            environ[key] = value
+    return environ
+
+
+class StreamServer:
+    def __init__(self, app, threads=16):
+        self.app = app
+        # Blocking work: the database, and the Flask app for the play events
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='cassette-stream')
+        self.songs = TTLCache(maxsize=10000, ttl=SONG_CACHE_SECONDS, name='stream_songs')
+        self.session_serializer = app.session_interface.get_signing_serializer(app)
+        self.session_max_age = int(app.permanent_session_lifetime.total_seconds())
+        self.connections = set()
+
+    def _blocking(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # ------------------------------ Running
+    async def serve(self, host, port):
+        loop = asyncio.get_running_loop()
+        # reuse_port: more processes can listen on the same port, the kernel spreads the connections
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=2048,
+                                            limit=MAX_HEADER_BYTES, reuse_port=hasattr(os, 'fork'))
+        stopping = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, stopping.set)
+            except (NotImplementedError, RuntimeError):  # Windows, or not the main thread
+                pass
+
+        logger.info("Stream server listening on %s:%s (pid %s)", host, port, os.getpid())
+        print(f"Stream server listening on http://{host}:{port}/ (pid {os.getpid()})")
+        async with server:
+            await stopping.wait()
+            # Stop accepting, then let the streams in progress finish
+            server.close()
+            tasks = list(self.connections)
+            if tasks:
+                logger.info("Waiting for %s connections to finish", len(tasks))
+                _, pending = await asyncio.wait(tasks, timeout=SHUTDOWN_SECONDS)
+                for task in pending:
+                    task.cancel()
+        self.executor.shutdown(wait=True)
+
+    # ------------------------------ HTTP/1.1 connections (keep-alive)
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections.add(task)
+        peer = writer.get_extra_info('peername')
+        sockname = writer.get_extra_info('sockname')
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), KEEP_ALIVE_SECONDS)
+                except HTTPError as error:
+                    writer.write(_head(error.status, [('Content-Length', 0), ('Connection', 'close')]))
+                    break
+                if request is None:
+                    break
+                method, target, version, headers = request
+                environ = _environ(method, target, version, headers, peer, sockname)
+                keep_alive = self._keep_alive(environ)
+
+                if environ.get('HTTP_EXPECT', '').lower() == '100-continue':
+                    writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+                try:
+                    body = await self.read_body(reader, environ)
+                except HTTPError as error:
+                    writer.write(_head(error.status, [('Content-Length', 0), ('Connection', 'close')]))
+                    break
+
+                keep_alive = await self.dispatch(environ, body, writer, keep_alive) and keep_alive
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            logger.exception(error)
+        finally:
+            self.connections.discard(task)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, asyncio.CancelledError):
+                pass
+
+    async def read_request(self, reader):
+        try:
+            data = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as error:
+            if error.partial.strip():
+                raise HTTPError(400)
+            return None  # Connection closed between two requests
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431)
+
+        lines = data.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ')
+        except ValueError:
+            raise HTTPError(400)
+        if not version.startswith('HTTP/1.'):
+            raise HTTPError(505)
+        headers = []
+        for line in lines[1:]:
+            if line:
+                name, separator, value = line.partition(':')
+                if not separator:
+                    raise HTTPError(400)
+                headers.append((name.strip(), value.strip()))
+        return method, target, version, headers
+
+    async def read_body(self, reader, environ):
+        if 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+            raise HTTPError(411)  # The player's requests always have a Content-Length
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise HTTPError(400)
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413)
+        return await reader.readexactly(length) if length > 0 else b''
+
+    def _keep_alive(self, environ):
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        if environ['SERVER_PROTOCOL'] == 'HTTP/1.0':
+            return 'keep-alive' in connection
+        return 'close' not in connection
+
+    # Function: Route a request, returns False when the connection can't be reused
+    async def dispatch(self, environ, body, writer, keep_alive):
+        path = environ['PATH_INFO']
+        match = STREAM_PATH.fullmatch(path)
+        if match:
+            if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+                return self.simple_response(writer, 405, [('Allow', 'GET, HEAD')])
+            return await self.stream(environ, writer, int(match.group(1)))
+        if path.startswith(PLAY_EVENT_PREFIXES):
+            return await self.call_app(environ, body, writer, keep_alive)
+        return self.simple_response(writer, 404)
+
+    def simple_response(self, writer, status, headers=(), body=b''):
+        writer.write(_head(status, [*headers, ('Content-Length', len(body))]) + body)
+        return True
+
+    # ------------------------------ Audio streams
+    # Function: The logged-in user's id, from the Flask session cookie (what @login_required checks)
+    def _session_user_id(self, environ):
+        cookie = parse_cookie(environ).get(self.app.config['SESSION_COOKIE_NAME'])
+        if not cookie:
+            return None
+        try:
+            session = self.session_serializer.loads(cookie, max_age=self.session_max_age)
+        except Exception:  # Bad signature or expired: anonymous, as in Flask
+            return None
+        return session.get('_user_id')
+
+    # Function: Whether the user exists (run in the thread pool)
+    def _user_exists(self, user_id):
+        with self.app.app_context():
+            return identity.get_user(user_id) is not None
+
+    # Function: (path, mtime, size) of a song's file, or None when it can't be streamed (thread pool)
+    def _song_file(self, song_id):
+        with self.app.app_context():
+            row = db.session.query(Songs.file_path, Songs.flagged).filter(Songs.song_id == song_id).first()
+        if row is None or row.flagged:
+            return None
+        path = os.path.abspath(row.file_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_mtime, stat.st_size
+
+    async def stream(self, environ, writer, song_id):
+        user_id = self._session_user_id(environ)
+        if user_id is None or not await self._blocking(self._user_exists, user_id):
+            # Same as @login_required on a route the browser fetches by itself
+            return self.simple_response(writer, 401)
+
+        song = self.songs.get(song_id)
+        if song is None:
+            song = await self._blocking(self._song_file, song_id)
+            self.songs.set(song_id, song or False)
+        if not song:
+            return self.simple_response(writer, 404)
+        path, mtime, size = song
+
+        # Same validators as send_file() on the WSGI route, so the browser's cache works with both
+        etag = f'"{mtime}-{size}-{adler32(path.encode()) & 0xFFFFFFFF}"'
+        last_modified = http_date(mtime)
+        headers = [('Content-Type', 'audio/mpeg'), ('Accept-Ranges', 'bytes'), ('ETag', etag),
+                   ('Last-Modified', last_modified), ('Cache-Control', 'no-cache'), ('Date', http_date())]
+
+        status, start, length = 200, 0, size
+        if size and 'HTTP_RANGE' in environ and not ('HTTP_IF_RANGE' in environ and is_resource_modified(
+                environ, etag, last_modified=last_modified, ignore_if_range=False)):
+            requested = parse_range_header(environ['HTTP_RANGE'])
+            bounds = requested.range_for_length(size) if requested else None
+            if bounds is None:
+                return self.simple_response(writer, 416, [('Content-Range', f'bytes */{size}')])
+            status, start, length = 206, bounds[0], bounds[1] - bounds[0]
+            headers.append(('Content-Range', requested.to_content_range_header(size)))
+        elif not is_resource_modified(environ, etag, last_modified=last_modified):
+            return self.simple_response(writer, 304, headers[2:])
+
+        if start == 0:
+            stream_logger.info("song_id=%s user_id=%s", song_id, user_id)
+        writer.write(_head(status, headers + [('Content-Length', length)]))
+        if environ['REQUEST_METHOD'] == 'HEAD' or not length:
+            return True
+
+        try:
+            file = await self._blocking(open, path, 'rb')
+        except OSError:
+            self.songs.delete(song_id)
+            return False  # The headers are gone already: close the connection
+        metrics.gauge_add('cassette_active_streams', 1)
+        sent = 0
+        try:
+            await writer.drain()
+            # os.sendfile() when the transport allows it, otherwise reads in the default executor
+            sent = await asyncio.get_running_loop().sendfile(writer.transport, file, start, length)
+        finally:
+            metrics.gauge_add('cassette_active_streams', -1)
+            metrics.inc('cassette_stream_bytes_total', sent)
+            await self._blocking(file.close)
+        return sent == length
+
+    # ------------------------------ Play events (Flask app, in the thread pool)
+    def _run_app(self, environ, body):
+        environ['wsgi.input'] = BytesIO(body)
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        result = self.app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return started[0], started[1], content
+
+    async def call_app(self, environ, body, writer, keep_alive):
+        try:
+            status, headers, content = await self._blocking(self._run_app, environ, body)
+        except Exception as error:
+            logger.exception(error)
+            return self.simple_response(writer, 500)
+        code = int(status.split(' ', 1)[0])
+        headers = [(name, value) for name, value in headers
+                   if name.lower() not in ('content-length', 'connection', 'transfer-encoding')]
+        headers.append(('Content-Length', len(content)))
+        if not keep_alive:
+            headers.append(('Connection', 'close'))
+        writer.write(_head(code, headers) + (b'' if environ['REQUEST_METHOD'] == 'HEAD' else content))
+        return True
+
+
+# Function: Run the server until SIGTERM/SIGINT
+def run(app, host='127.0.0.1', port=8001, threads=16):
+    asyncio.run(StreamServer(app, threads).serve(host, port))
@@ -0,0 +1,200 @@
+import logging
+import time
+from flask import current_app
+from sqlalchemy import case, event, inspect, select
+from sqlalchemy.orm import Session
+from .cache import TTLCache
+from .database import db
+from .models import Songs, Plays, Trending
+
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------ Trending songs
+# "Popular now" is a play count that decays exponentially: a play counts 1 when it happens, 1/2
+# after TRENDING_HALF_LIFE_HOURS, 1/4 after twice that... Decaying every score on every play
+# would touch every row, so the scores are stored relative to a landmark time L instead
+# (forward decay):
+#     weight = sum of 2 ** ((played_at - L) / half_life) over the plays
+#     score at time t = weight * 2 ** (-(t - L) / half_life)
+# A play only adds to the weight of its song (one UPDATE, O(1)), and the order of the weights is
+# the order of the scores at any time, so the top songs are a read of the index on weight.
+#
+# The weights would overflow after ~1000 half-lives, so time is cut into epochs of EPOCH_HALF_LIVES
+# half-lives, each with its own landmark (its start). A song's row holds the weight of the epoch of
+# its last play: a play in the next epoch carries the old weight over (times 2 ** -EPOCH_HALF_LIVES),
+# and anything older is below 2 ** -EPOCH_HALF_LIVES of a play, so it's dropped.
+# The top songs are the merge of the top of the current epoch and the top of the previous one.
+#
+# The weights are written with the play events, when the play buffer is flushed (see
+# application/plays.py), in the same transaction as the Plays rows. "flask rebuild-trending"
+# recomputes them from the Plays table (after an import, or when TRENDING_HALF_LIFE_HOURS changed).
+# The rows also copy the genre of their song, for the per-genre index: a song edited into another genre
+# has its row moved along, in the same flush (bulk updates of Songs are only caught by a rebuild).
+
+EPOCH_HALF_LIVES = 64
+CACHE_SECONDS = 30
+# Plays older than this many half-lives count for less than 1/65536 of a play: not read on a rebuild
+REBUILD_HALF_LIVES = 16
+
+top_cache = TTLCache(maxsize=256, ttl=CACHE_SECONDS, name='trending')
+
+
+def _half_life():
+    return current_app.config['TRENDING_HALF_LIFE_HOURS'] * 3600
+
+
+def _epoch(timestamp, half_life):
+    return int(timestamp // (half_life * EPOCH_HALF_LIVES))
+
+
+# Function: Weight of one play at "timestamp", relative to the landmark of an epoch
+def _weight(timestamp, epoch, half_life):
+    return 2.0 ** ((timestamp - epoch * half_life * EPOCH_HALF_LIVES) / half_life)
+
+
+# Function: Add play events to the weights, [(song_id, count, played_at), ...] (in the session's transaction)
+def record(plays):
+    if not plays:
+        return
+    half_life = _half_life()
+    # A batch spans a few seconds: all its plays go to the epoch of the latest one
+    epoch = _epoch(max(played_at for _, _, played_at in plays), half_life)
+    deltas = {}
+    for song_id, count, played_at in plays:
+        deltas[song_id] = deltas.get(song_id, 0.0) + count * _weight(played_at, epoch, half_life)
+
+    song_ids = sorted(deltas)
+    genres = {}
+    for start in range(0, len(song_ids), 500):
+        genres.update(db.session.execute(select(Songs.song_id, Songs.genre_id)
+                                         .where(Songs.song_id.in_(song_ids[start:start + 500]))).all())
+    rows = [{'song_id': song_id, 'genre_id': genres[song_id], 'epoch': epoch, 'weight': weight}
+            for song_id, weight in deltas.items() if song_id in genres]
+    if rows:
+        _add(rows)
+
+
+# Function: Upsert of the weights: added to the row's weight of the same epoch, or to the carried over weight
+# of the previous epoch (same pattern as stats._increment)
+def _add(rows):
+    table = Trending.__table__
+    carried = 2.0 ** -EPOCH_HALF_LIVES
+
+    def new_weight(epoch, weight):
+        return case((table.c.epoch == epoch, table.c.weight + weight),
+                    (table.c.epoch == epoch - 1, table.c.weight * carried + weight),
+                    else_=weight)
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.song_id],
+            set_={'weight': new_weight(excluded.epoch, excluded.weight),
+                  'epoch': excluded.epoch,
+                  'genre_id': excluded.genre_id})
+        db.session.execute(statement, rows)
+        return
+    for row in rows:
+        updated = db.session.execute(table.update()
+                                     .where(table.c.song_id == row['song_id'])
+                                     .values(weight=new_weight(row['epoch'], row['weight']),
+                                             epoch=row['epoch'], genre_id=row['genre_id']))
+        if updated.rowcount == 0:
+            db.session.execute(table.insert().values(**row))
+
+
+# Function: The k trending song_ids with their current score (plays, decayed), of one genre or of all
+# [(song_id, score), ...] highest first
+def top(k=10, genre_id=None):
+    def compute():
+        half_life = _half_life()
+        now = time.time()
+        epoch = _epoch(now, half_life)
+        found = []
+        # Two index range scans (genre_id, epoch, weight): the current epoch and the previous one
+        for row_epoch in (epoch, epoch - 1):
+            query = (select(Trending.song_id, Trending.weight)
+                     .where(Trending.epoch == row_epoch)
+                     .order_by(Trending.weight.desc())
+                     .limit(k))
+            if genre_id is not None:
+                query = query.where(Trending.genre_id == genre_id)
+            found.extend((song_id, weight / _weight(now, row_epoch, half_life))
+                         for song_id, weight in db.session.execute(query))
+        found.sort(key=lambda item: item[1], reverse=True)
+        return found[:k]
+    return top_cache.get_or_set(('top', k, genre_id), compute)
+
+
+# Function: [(song, score), ...] of the k trending songs that aren't flagged
+def top_songs(k=10, genre_id=None):
+    # A few more, in case some got flagged
+    scored = top(k + 10, genre_id)
+    songs = {song.song_id: song for song in
+             Songs.query.filter(Songs.song_id.in_([song_id for song_id, _ in scored]), Songs.flagged == False)}
+    return [(songs[song_id], score) for song_id, score in scored if song_id in songs][:k]
+
+
+# Function: Recompute every weight from the Plays table, returns the number of songs that have one
+def rebuild():
+    half_life = _half_life()
+    now = time.time()
+    epoch = _epoch(now, half_life)
+    since = int(now - REBUILD_HALF_LIVES * half_life)
+    table = Trending.__table__
+    try:
+        weights = {}
+        rows = db.session.execute(select(Plays.song_id, Plays.play_count, Plays.date_created)
+                                  .where(Plays.date_created >= since))
+        for song_id, count, played_at in rows:
+            weights[song_id] = weights.get(song_id, 0.0) + count * _weight(played_at, epoch, half_life)
+        genres = dict(db.session.execute(select(Songs.song_id, Songs.genre_id)
+                                         .where(Songs.song_id.in_(select(Plays.song_id)
+                                                                  .where(Plays.date_created >= since)))).all())
+        db.session.execute(table.delete())
+        values = [{'song_id': song_id, 'genre_id': genres[song_id], 'epoch': epoch, 'weight': weight}
+                  for song_id, weight in weights.items() if song_id in genres and weight > 0]
+        for start in range(0, len(values), 5000):
+            db.session.execute(table.insert(), values[start:start + 5000])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+    top_cache.clear()
+    logger.info("Trending scores rebuilt for %s songs", len(values))
+    return len(values)
+
+
+
+# ------------------------------ Genre changes of the songs
+@event.listens_for(Session, 'after_flush')
+def _move_genres(session, flush_context):
+    moved = [(song.song_id, song.genre_id) for song in session.dirty
+             if isinstance(song, Songs) and inspect(song).attrs.genre_id.history.has_changes()]
+    if not moved:
+        return
+    table = Trending.__table__
+    connection = session.connection()
+    for song_id, genre_id in moved:
+        connection.execute(table.update().where(table.c.song_id == song_id).values(genre_id=genre_id))
+    session.info['trending_moved'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _clear_moved(session):
+    if session.info.pop('trending_moved', None):
+        top_cache.clear()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_moved(session):
+    session.info.pop('trending_moved', None)
@@ -0,0 +1,97 @@
+import hashlib
+import os
+from mutagen.mp3 import MP3
+from .database import db
+from .models import Songs, PlaylistSong, AlbumSong, Ratings, Plays, Queue, SongFeatures, Trending
+from .playback import make_cover_variants
+from . import jobs
+
+
+# ------------------------------ Song uploads
+# Shared by the upload form and the REST API.
+# The files are named by the hash of their content, like the imported ones (see application/importer.py):
+# a title never ends up in a path, and a song can't overwrite the file of another one.
+AUDIO_DIR = 'static/audio/uploads'
+COVERS_DIR = 'static/covers/uploads'
+HASH_CHUNK = 1024 * 1024
+
+
+# Function: Store an uploaded file in a directory, as <sha256 of the content><extension>
+def store_upload(upload, directory, extension):
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = os.path.join(directory, f".upload.{os.getpid()}.{id(upload)}.tmp")
+    digest = hashlib.sha256()
+    with open(temporary_path, 'wb') as stored_file:
+        while chunk := upload.stream.read(HASH_CHUNK):
+            digest.update(chunk)
+            stored_file.write(chunk)
+    hexdigest = digest.hexdigest()
+    stored_path = f"{directory}/{hexdigest[:2]}/{hexdigest}{extension}"
+    os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+    os.replace(temporary_path, stored_path)
+    return stored_path
+
+
+# Function: The sha256 of a file stored by store_upload (its name), for Songs.file_hash
+def stored_hash(stored_path):
+    return os.path.splitext(os.path.basename(stored_path))[0]
+
+# Function: Save an uploaded song (form fields + "music_file"/"cover_file") for a creator, and commit it
+def save_song(app, user_id, form, files):
+    title = form['title']
+
+    # Save the song file into the uploads folder
+    music_file_path = store_upload(files['music_file'], AUDIO_DIR, '.mp3')
+
+    # Save the album cover picture into the uploads folder
+    cover_file_path = None
+    cover_file = files.get('cover_file')
+    if cover_file:
+        cover_file_path = store_upload(cover_file, COVERS_DIR, '.jpg')
+        make_cover_variants(cover_file_path)
+
+    # Get the duration details of mp3 file, in milliseconds
+    duration_ms = round(MP3(music_file_path).info.length * 1000)
+
+    # Save the new song object into the database
+    new_song = Songs(
+        title=title,
+        singer=form['singer'],
+        genre=form['genre'],
+        release_date=form['release_date'],
+        duration_ms=duration_ms,
+        file_path=music_file_path,
+        file_hash=stored_hash(music_file_path),
+        lyrics=form.get('lyrics'),
+        cover=cover_file_path,
+        user_id=user_id
+    )
+    db.session.add(new_song)
+    db.session.commit()
+
+    # Extract the audio features for the "sounds like" radio, in the background
+    from . import audio_features  # numpy, only loaded once a song is uploaded
+    jobs.enqueue(app, audio_features.store_song_features, new_song.song_id)
+    return new_song
+
+
+# ------------------------------ Song deletes
+# Shared by the REST API, the creator's delete route and the admin's user delete.
+# The rows referencing the songs go first, in bulk; the songs themselves are deleted through the ORM,
+# so their lyrics go with them (lyrics_row cascade) and the ORM hooks see them (dashboard counters,
+# fragment versions, facets).
+SONG_DEPENDENTS = (PlaylistSong, AlbumSong, Ratings, Plays, Queue, SongFeatures, Trending)
+
+
+# Function: Delete songs and everything referencing them (doesn't commit)
+def delete_songs(song_ids):
+    song_ids = list(song_ids)
+    if not song_ids:
+        return 0
+    for model in SONG_DEPENDENTS:
+        model.query.filter(model.song_id.in_(song_ids)).delete(synchronize_session=False)
+    songs = Songs.query.filter(Songs.song_id.in_(song_ids)).all()
+    for song in songs:
+        db.session.delete(song)
+    db.session.flush()
+    return len(songs)
@@ -0,0 +1,289 @@
+"""Synthetic dataset: fills a database with users, songs, albums, playlists, ratings and plays.
+
+The data looks like a real catalog, not like a uniform random one: a few creators publish most of
+the songs, song popularity (plays, ratings, playlist entries) follows a Zipf law, ratings lean
+towards 4 and 5, playlist sizes are log-normal and the plays are spread over the last year.
+The songs point to a few placeholder MP3 files (silent, but valid) in static/audio/bench/.
+
+Every user has the password "bench": user<N>@bench.local (standard users), creator<N>@bench.local
+(creators) and the Admin account.
+
+    python benchmarks/dataset.py --scale small           # into instance/bench.sqlite3
+    python benchmarks/dataset.py --scale large --plays 10000000
+    python benchmarks/dataset.py --database sqlite:///cassette.sqlite3 --scale small
+
+Rows are added to what is already in the database, so run it on an empty one for comparable runs.
+The same --seed gives the same dataset.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_DATABASE = 'sqlite:///bench.sqlite3'
+PASSWORD = 'bench'
+PLACEHOLDER_DIR = 'static/audio/bench'
+PLACEHOLDER_FILES = 8
+BATCH_SIZE = 50000
+
+SCALES = {
+    'tiny': dict(users=200, creators=20, songs=2000, playlists=300, ratings=5000, plays=20000),
+    'small': dict(users=2000, creators=100, songs=20000, playlists=3000, ratings=50000, plays=500000),
+    'medium': dict(users=20000, creators=1000, songs=200000, playlists=30000, ratings=500000, plays=5000000),
+    'large': dict(users=100000, creators=5000, songs=1000000, playlists=150000, ratings=5000000,
+                  plays=50000000),
+}
+
+GENRES = ['Pop', 'Rock', 'Hip-Hop', 'Electronic', 'Jazz', 'Classical', 'Indie', 'Folk', 'Metal', 'R&B',
+          'Country', 'Reggae', 'Blues', 'Soul', 'Lo-fi']
+GENRE_WEIGHTS = [18, 15, 14, 11, 5, 4, 8, 4, 5, 6, 3, 2, 2, 2, 1]
+RATING_WEIGHTS = [0.02, 0.05, 0.08, 0.15, 0.30, 0.40]   # ratings 0 to 5
+SYLLABLES = ['la', 'mo', 'ri', 'ka', 'ne', 'so', 'ta', 'vi', 'lu', 'be', 'do', 'ma', 'zen', 'tor', 'shi',
+             'na', 'ro', 'fa', 'el', 'um']
+
+
+# Function: The words song titles are made of (also what the load test searches for)
+def vocabulary(size=2000):
+    words = []
+    for first in SYLLABLES:
+        for second in SYLLABLES:
+            for third in ('', 'n', 'r', 's', 'x'):
+                words.append(first + second + third)
+    return words[:size]
+
+
+# Function: A Flask app bound to the given database URI (the app's own settings otherwise)
+def bench_app(database):
+    from application import create_app
+    from application.config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database
+
+    return create_app(BenchConfig)
+
+
+# Function: A silent MP3 (MPEG-1 layer III frames, 128 kbps, 44.1 kHz) of about "seconds" seconds
+def placeholder_mp3(seconds):
+    frame = b'\xff\xfb\x90\x00' + bytes(413)
+    return frame * int(seconds * 44100 / 1152)
+
+
+def write_placeholders():
+    directory = os.path.join(ROOT, PLACEHOLDER_DIR)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for index in range(PLACEHOLDER_FILES):
+        path = f"{PLACEHOLDER_DIR}/placeholder_{index}.mp3"
+        with open(os.path.join(ROOT, path), 'wb') as mp3_file:
+            mp3_file.write(placeholder_mp3(10 + 5 * index))
+        paths.append(path)
+    return paths
+
+
+# Function: "size" indexes in [0, n), index k drawn with a probability proportional to 1 / (k + 1) ** exponent
+def zipf_indexes(rng, n, size, exponent=1.0):
+    import numpy as np
+
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    cumulative = np.cumsum(weights)
+    return np.minimum(np.searchsorted(cumulative, rng.random(size) * cumulative[-1]), n - 1)
+
+
+def insert_rows(connection, table, columns, count, make_batch, label):
+    started = time.perf_counter()
+    for start in range(0, count, BATCH_SIZE):
+        size = min(BATCH_SIZE, count - start)
+        values = make_batch(start, size)
+        connection.execute(table.insert(), [dict(zip(columns, row)) for row in zip(*values)])
+        connection.commit()
+    print(f"  {label:<12} {count:>12,} rows  {time.perf_counter() - started:8.1f} s")
+
+
+def generate(database, users, creators, songs, playlists, ratings, plays, seed=42):
+    import numpy as np
+    from sqlalchemy import func, select, text
+    from werkzeug.security import generate_password_hash
+    from application import fragments, stats, trending
+    from application.cli import init_db, seed_admin
+    from application.database import db
+    from application.models import Users, Genres, Songs, Albums, AlbumSong, Playlists, PlaylistSong, Ratings, Plays
+
+    rng = np.random.default_rng(seed)
+    app = bench_app(database)
+    with app.app_context():
+        init_db(app)
+        seed_admin(PASSWORD)
+        password_hash = generate_password_hash(PASSWORD)   # hashing is slow: one hash for every user
+        placeholders = write_placeholders()
+        words = np.array(vocabulary())
+        now = datetime.now()
+        year_ago = int((now - timedelta(days=365)).timestamp())
+
+        with db.engine.connect() as connection:
+            if connection.dialect.name == 'sqlite':
+                connection.execute(text('PRAGMA journal_mode=WAL'))
+                connection.execute(text('PRAGMA synchronous=OFF'))
+
+            def next_id(column):
+                return (connection.execute(select(func.max(column))).scalar() or 0) + 1
+
+            # Users: the standard users first, then the creators
+            first_user = next_id(Users.user_id)
+            user_ids = np.arange(first_user, first_user + users)
+            creator_ids = np.arange(first_user + users, first_user + users + creators)
+            created_at = [now - timedelta(days=int(days)) for days in rng.integers(0, 730, users + creators)]
+
+            def user_batch(start, size):
+                indexes = range(start, start + size)
+                return ([first_user + index for index in indexes],
+                        [f"User {index}" if index < users else f"Creator {index - users}" for index in indexes],
+                        [f"user{index}@bench.local" if index < users else f"creator{index - users}@bench.local"
+                         for index in indexes],
+                        [password_hash] * size,
+                        created_at[start:start + size],
+                        [1 if index < users else 2 for index in indexes],
+                        [False] * size, [False] * size)
+
+            insert_rows(connection, Users.__table__,
+                        ('user_id', 'name', 'email', 'password', 'created_at', 'role', 'blacklist', 'dark_mode'),
+                        users + creators, user_batch, 'users')
+
+            # Songs: a few prolific creators publish most of them
+            first_song = next_id(Songs.song_id)
+            song_creators = creator_ids[zipf_indexes(rng, creators, songs, exponent=0.8)]
+            genre_weights = np.array(GENRE_WEIGHTS) / sum(GENRE_WEIGHTS)
+            # The genres rows (their song_count is set by stats.reconcile() at the end)
+            genre_ids = dict(connection.execute(select(Genres.name, Genres.genre_id)).all())
+            new_genres = [{'name': genre, 'song_count': 0} for genre in GENRES if genre not in genre_ids]
+            if new_genres:
+                connection.execute(Genres.__table__.insert(), new_genres)
+                connection.commit()
+                genre_ids = dict(connection.execute(select(Genres.name, Genres.genre_id)).all())
+            song_genre_ids = np.array([genre_ids[genre] for genre in GENRES])
+
+            def song_batch(start, size):
+                title_words = words[rng.integers(0, len(words), (size, 3))]
+                return ([first_song + start + index for index in range(size)],
+                        [' '.join(row[:1 + index % 3]).title() for index, row in enumerate(title_words)],
+                        [f"Creator {creator - creator_ids[0]}" for creator in song_creators[start:start + size]],
+                        rng.choice(song_genre_ids, size, p=genre_weights).tolist(),
+                        (2024 - rng.exponential(8, size).astype(int)).clip(1960, 2024).tolist(),
+                        rng.normal(215000, 45000, size).clip(60000, 600000).astype(int).tolist(),
+                        [placeholders[index % len(placeholders)] for index in range(start, start + size)],
+                        song_creators[start:start + size].tolist(),
+                        [False] * size)
+
+            insert_rows(connection, Songs.__table__,
+                        ('song_id', 'title', 'singer', 'genre_id', 'release_date', 'duration_ms', 'file_path',
+                         'user_id', 'flagged'),
+                        songs, song_batch, 'songs')
+
+            # Albums: the songs of every creator, in albums of about 10 songs
+            order = np.argsort(song_creators, kind='stable')
+            album_of_song = np.empty(songs, dtype=np.int64)
+            album_creators, album_count, previous_creator, in_album = [], 0, None, 0
+            for position in order:
+                creator = song_creators[position]
+                if creator != previous_creator or in_album >= 10:
+                    album_creators.append(creator)
+                    album_count += 1
+                    previous_creator, in_album = creator, 0
+                album_of_song[position] = album_count - 1
+                in_album += 1
+            first_album = next_id(Albums.album_id)
+
+            def album_batch(start, size):
+                title_words = words[rng.integers(0, len(words), size)]
+                return ([first_album + start + index for index in range(size)],
+                        [str(word).title() for word in title_words],
+                        rng.choice(GENRES, size, p=genre_weights).tolist(),
+                        [int(creator) for creator in album_creators[start:start + size]],
+                        (2024 - rng.exponential(8, size).astype(int)).clip(1960, 2024).tolist(),
+                        [False] * size)
+
+            insert_rows(connection, Albums.__table__,
+                        ('album_id', 'title', 'genre', 'user_id', 'release_date', 'flagged'),
+                        album_count, album_batch, 'albums')
+            insert_rows(connection, AlbumSong.__table__, ('album_id', 'song_id'), songs,
+                        lambda start, size: ((album_of_song[start:start + size] + first_album).tolist(),
+                                             list(range(first_song + start, first_song + start + size))),
+                        'album_song')
+
+            # Popularity: a fixed random order of the songs, the first ones being played the most
+            popularity = rng.permutation(songs) + first_song
+
+            # Playlists: owned by the standard users, log-normal sizes, popular songs more often
+            first_playlist = next_id(Playlists.playlist_id)
+            playlist_sizes = rng.lognormal(2.7, 0.8, playlists).astype(int).clip(1, 500)
+            insert_rows(connection, Playlists.__table__,
+                        ('playlist_id', 'user_id', 'title', 'created_at', 'access'), playlists,
+                        lambda start, size: (list(range(first_playlist + start, first_playlist + start + size)),
+                                             rng.choice(user_ids, size).tolist(),
+                                             [f"Playlist {start + index}" for index in range(size)],
+                                             [now] * size, ['public'] * size),
+                        'playlists')
+            playlist_of_entry = np.repeat(np.arange(first_playlist, first_playlist + playlists), playlist_sizes)
+            insert_rows(connection, PlaylistSong.__table__, ('playlist_id', 'song_id'), len(playlist_of_entry),
+                        lambda start, size: (playlist_of_entry[start:start + size].tolist(),
+                                             popularity[zipf_indexes(rng, songs, size)].tolist()),
+                        'playlist_song')
+
+            insert_rows(connection, Ratings.__table__, ('rating', 'user_id', 'song_id'), ratings,
+                        lambda start, size: (rng.choice(6, size, p=RATING_WEIGHTS).tolist(),
+                                             rng.choice(user_ids, size).tolist(),
+                                             popularity[zipf_indexes(rng, songs, size)].tolist()),
+                        'ratings')
+
+            # Plays: heavy listeners (log-normal), popular songs, more plays in the recent months
+            listener_weights = rng.lognormal(0, 1, users)
+            listener_weights /= listener_weights.sum()
+            insert_rows(connection, Plays.__table__, ('play_count', 'date_created', 'user_id', 'song_id'), plays,
+                        lambda start, size: ((1 + rng.poisson(0.3, size)).tolist(),
+                                             (year_ago + 365 * 86400 * rng.power(1.5, size)).astype(int).tolist(),
+                                             rng.choice(user_ids, size, p=listener_weights).tolist(),
+                                             popularity[zipf_indexes(rng, songs, size, exponent=1.1)].tolist()),
+                        'plays')
+
+            if connection.dialect.name == 'sqlite':
+                connection.execute(text('ANALYZE'))
+                connection.commit()
+
+        # The rows didn't go through the ORM: drop the cached fragments and search results of every
+        # worker, and recompute the dashboard counters and the trending scores
+        fragments.bump('catalog', 'ratings', 'playlists', 'queue')
+        stats.reconcile()
+        trending.rebuild()
+
+        counts = {model.__tablename__: db.session.query(model).count()
+                  for model in (Users, Songs, Albums, Playlists, PlaylistSong, Ratings, Plays)}
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default=DEFAULT_DATABASE,
+                        help=f'SQLAlchemy URI (default {DEFAULT_DATABASE}, relative to instance/)')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    for name in SCALES['small']:
+        parser.add_argument(f'--{name}', type=int, help=f'override the number of {name} of the scale')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    sizes.update({name: getattr(args, name) for name in sizes if getattr(args, name) is not None})
+    print(f"Generating the {args.scale} dataset into {args.database}: {sizes}")
+    started = time.perf_counter()
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    counts = generate(args.database, seed=args.seed, **sizes)
+    print(f"Done in {time.perf_counter() - started:.1f} s, the database now has {json.dumps(counts)}")
+
+
+if __name__ == '__main__':
+    main()
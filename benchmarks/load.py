@@ -0,0 +1,442 @@
+"""Load test: concurrent clients on the hot routes, throughput and p50/p95/p99 latency per route.
+
+Starts the app on a local port (or targets a running one with --url), logs the clients in (standard
+users, creators and the Admin of the benchmark dataset, see benchmarks/dataset.py), then every client
+thread sends requests back to back, picking the route at random with these weights:
+    search 30, stream 25, all_songs 15, rate 10, creator_dashboard 10, admin_dashboard 5, upload 5
+A stream is the first 64 KiB of a song (Range request), an upload a 5-second placeholder MP3.
+
+    python benchmarks/load.py                                   # instance/bench.sqlite3, 8 clients, 30 s
+    python benchmarks/load.py --concurrency 32 --duration 60 --json results/today.json
+    python benchmarks/load.py --compare results/baseline.json   # exits with 1 on a regression
+    python benchmarks/load.py --url http://127.0.0.1:8000 --database sqlite:///cassette.sqlite3
+    python benchmarks/load.py --server serve --workers 4 --threads 8   # production server (flask serve)
+
+Comparable runs: the server works on a copy of the (SQLite) database, so the ratings and uploads of
+a run don't change the data of the next one, and the clients follow a seeded sequence of requests.
+Only the requests sent after --warmup seconds are counted. Responses with a status of 400 or more
+(or no response) are errors; redirects are successes, they are what the forms return.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    # name: (weight, client role)
+    'search': (30, 'user'),
+    'stream': (25, 'user'),
+    'all_songs': (15, 'user'),
+    'rate': (10, 'user'),
+    'creator_dashboard': (10, 'creator'),
+    'admin_dashboard': (5, 'admin'),
+    'upload': (5, 'creator'),
+}
+STREAM_BYTES = 64 * 1024
+UPLOAD_PREFIX = 'bench-upload'
+ADMIN_EMAIL = 'admin@cassette.com'
+
+
+# ------------------------------ HTTP client
+# One keep-alive connection per client. The session cookies are the ones of the login: the responses'
+# cookies are ignored afterwards, so the flashed messages of the forms don't pile up in the session.
+class Client:
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.connection = None
+        self.cookies = {}
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f"{name}={value}" for name, value in self.cookies.items())
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                if response.will_close:
+                    self.close()
+                return response, data
+            except (http.client.HTTPException, OSError):
+                # The server closed the keep-alive connection: retry once on a new one
+                self.close()
+                if attempt:
+                    raise
+
+    def login(self, path, email, password):
+        response, _ = self.request('POST', path, urlencode({'email': email, 'password': password}),
+                                   {'Content-Type': 'application/x-www-form-urlencoded'})
+        for header, value in response.getheaders():
+            if header.lower() == 'set-cookie':
+                name, _, rest = value.partition('=')
+                self.cookies[name.strip()] = rest.split(';')[0]
+        if response.status != 302 or 'session' not in self.cookies:
+            raise RuntimeError(f"Could not log in as {email} (status {response.status})")
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, content_type) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {content_type}\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# ------------------------------ Scenarios
+class Worker(threading.Thread):
+    def __init__(self, index, url, dataset, args, results):
+        super().__init__(name=f"load-{index}", daemon=True)
+        from benchmarks.dataset import PASSWORD, placeholder_mp3
+
+        self.index = index
+        self.dataset = dataset
+        self.args = args
+        self.results = results
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.clients = {role: Client(url) for role in ('user', 'creator', 'admin')}
+        self.password = PASSWORD
+        self.upload_content = placeholder_mp3(5)
+        self.uploads = 0
+        names = list(SCENARIOS)
+        self.choose = lambda: self.rng.choices(names, weights=[SCENARIOS[name][0] for name in names])[0]
+
+    def log_in(self):
+        user = self.index % self.dataset['users']
+        creator = self.index % self.dataset['creators']
+        self.clients['user'].login('/login', f"user{user}@bench.local", self.password)
+        self.clients['creator'].login('/login', f"creator{creator}@bench.local", self.password)
+        self.clients['admin'].login('/admin_login', ADMIN_EMAIL, self.args.admin_password)
+
+    def song_id(self):
+        return self.rng.randint(self.dataset['first_song'], self.dataset['last_song'])
+
+    def send(self, scenario):
+        if scenario == 'search':
+            words = self.dataset['words']
+            query = urlencode({'search_query': words[self.rng.randrange(len(words))]})
+            return self.clients['user'].request('GET', f"/user_dashboard?{query}")
+        if scenario == 'stream':
+            return self.clients['user'].request('GET', f"/stream/{self.song_id()}",
+                                                headers={'Range': f"bytes=0-{STREAM_BYTES - 1}"})
+        if scenario == 'all_songs':
+            return self.clients['user'].request('GET', '/all_songs')
+        if scenario == 'rate':
+            return self.clients['user'].request('POST', f"/rate/{self.song_id()}/{self.rng.randint(1, 5)}")
+        if scenario == 'creator_dashboard':
+            return self.clients['creator'].request('GET', '/creator_dashboard')
+        if scenario == 'admin_dashboard':
+            return self.clients['admin'].request('GET', '/admin_dashboard')
+        if scenario == 'upload':
+            self.uploads += 1
+            body, content_type = multipart(
+                {'title': f"{UPLOAD_PREFIX}-{os.getpid()}-{self.index}-{self.uploads}", 'singer': 'Bench',
+                 'genre': 'Pop', 'release_date': '2024', 'lyrics': ''},
+                {'music_file': ('upload.mp3', self.upload_content, 'audio/mpeg')})
+            return self.clients['creator'].request('POST', '/upload_song_form', body,
+                                                   {'Content-Type': content_type})
+        raise ValueError(scenario)
+
+    def run(self):
+        self.results.ready.wait()
+        measure_from = self.results.started + self.args.warmup
+        stop_at = measure_from + self.args.duration
+        latencies, errors = defaultdict(list), defaultdict(int)
+        finished = None
+        while True:
+            scenario = self.choose()
+            started = time.perf_counter()
+            if started >= stop_at:
+                break
+            try:
+                response, _ = self.send(scenario)
+                failed = response.status >= 400
+            except (http.client.HTTPException, OSError):
+                failed = True
+            finished = time.perf_counter()
+            # The requests sent in the measured window count, even when they end after it (slow ones)
+            if started >= measure_from:
+                latencies[scenario].append(finished - started)
+                if failed:
+                    errors[scenario] += 1
+        for client in self.clients.values():
+            client.close()
+        self.results.add(latencies, errors, finished)
+
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.started = None
+        self.finished = None
+
+    def add(self, latencies, errors, finished):
+        with self.lock:
+            if finished is not None:
+                self.finished = max(self.finished or finished, finished)
+            for scenario, values in latencies.items():
+                self.latencies[scenario].extend(values)
+            for scenario, count in errors.items():
+                self.errors[scenario] += count
+
+
+# Function: Value at a fraction of the sorted samples (nearest rank), in milliseconds
+def percentile(ordered, fraction):
+    return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000, 2)
+
+
+def summarize(results, duration):
+    routes = {}
+    for scenario in SCENARIOS:
+        ordered = sorted(results.latencies.get(scenario, []))
+        if not ordered:
+            continue
+        routes[scenario] = {'requests': len(ordered), 'errors': results.errors.get(scenario, 0),
+                            'throughput': round(len(ordered) / duration, 2),
+                            'p50_ms': percentile(ordered, 0.5), 'p95_ms': percentile(ordered, 0.95),
+                            'p99_ms': percentile(ordered, 0.99)}
+    everything = sorted(value for values in results.latencies.values() for value in values)
+    if everything:
+        routes['all'] = {'requests': len(everything), 'errors': sum(results.errors.values()),
+                         'throughput': round(len(everything) / duration, 2),
+                         'p50_ms': percentile(everything, 0.5), 'p95_ms': percentile(everything, 0.95),
+                         'p99_ms': percentile(everything, 0.99)}
+    return routes
+
+
+def print_table(routes):
+    print(f"{'route':<18} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for scenario, stats in routes.items():
+        print(f"{scenario:<18} {stats['requests']:>9} {stats['errors']:>7} {stats['throughput']:>9.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+# Function: Routes slower (p95) or with less throughput than the baseline by more than threshold percent
+# (only the routes with min_requests in both runs: the p95 of a handful of requests is noise)
+def compare(baseline, current, threshold, min_requests):
+    for key in ('dataset', 'settings'):
+        if baseline.get(key) != current.get(key):
+            print(f"Warning: the {key} differ from the baseline's, the runs may not be comparable")
+    regressions = []
+    print(f"\n{'route':<18} {'req/s':>17} {'p95 ms':>19}")
+    for scenario, stats in current['routes'].items():
+        before = baseline['routes'].get(scenario)
+        if before is None:
+            continue
+        throughput_change = 100 * (stats['throughput'] - before['throughput']) / max(before['throughput'], 1e-9)
+        p95_change = 100 * (stats['p95_ms'] - before['p95_ms']) / max(before['p95_ms'], 1e-9)
+        enough = min(stats['requests'], before['requests']) >= min_requests
+        regressed = enough and (throughput_change < -threshold or p95_change > threshold)
+        note = '  REGRESSION' if regressed else '' if enough else '  (too few requests)'
+        print(f"{scenario:<18} {stats['throughput']:>9.1f} {throughput_change:>+6.1f}% "
+              f"{stats['p95_ms']:>9.1f} {p95_change:>+7.1f}%{note}")
+        if regressed:
+            regressions.append(scenario)
+    return regressions
+
+
+# ------------------------------ Server and dataset
+def sqlite_path(database):
+    if not database.startswith('sqlite:///'):
+        return None
+    path = database[len('sqlite:///'):]
+    # Relative paths are relative to the instance folder, like in Flask-SQLAlchemy
+    return path if os.path.isabs(path) else os.path.join(ROOT, 'instance', path)
+
+
+# Function: Copy of the SQLite database for one run (the backup API copies it consistently, WAL included)
+def copy_database(database):
+    path = sqlite_path(database)
+    if path is None:
+        return database, None
+    if not os.path.exists(path):
+        sys.exit(f"{path} doesn't exist, create it with: python benchmarks/dataset.py")
+    run_path = f"{path}.run-{os.getpid()}"
+    source, target = sqlite3.connect(path), sqlite3.connect(run_path)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+    return f"sqlite:///{run_path}", run_path
+
+
+# Function: What the clients need from the dataset: user counts, song ids and search words
+def describe_dataset(database):
+    from sqlalchemy import func
+    from benchmarks.dataset import bench_app, vocabulary
+    from application.database import db
+    from application.models import Users, Songs, Plays, Ratings
+
+    with bench_app(database).app_context():
+        first_song, last_song = db.session.query(func.min(Songs.song_id), func.max(Songs.song_id)).one()
+        dataset = {
+            'users': Users.query.filter(Users.email.like('user%@bench.local')).count(),
+            'creators': Users.query.filter(Users.email.like('creator%@bench.local')).count(),
+            'songs': Songs.query.count(),
+            'plays': Plays.query.count(),
+            'ratings': Ratings.query.count(),
+            'first_song': first_song,
+            'last_song': last_song,
+        }
+        db.session.close()
+    if not dataset['users'] or not dataset['creators'] or not dataset['songs']:
+        sys.exit("The database has no benchmark data, create it with: python benchmarks/dataset.py")
+    dataset['words'] = vocabulary()[:200]
+    return dataset
+
+
+# Function: "flask run" (development server, a thread per request), or "flask serve" with its workers
+def start_server(database, port, args):
+    env = dict(os.environ, SQLALCHEMY_DATABASE_URI=database)
+    if args.server == 'serve':
+        command = ['serve', '--bind', f"127.0.0.1:{port}", '--workers', str(args.workers),
+                   '--threads', str(args.threads), '--max-requests', '0']
+    else:
+        command = ['run', '--port', str(port), '--with-threads', '--no-reload', '--no-debugger']
+    server = subprocess.Popen([sys.executable, '-m', 'flask', '--app', 'main', *command],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        if server.poll() is not None:
+            sys.exit(f"The server exited with status {server.returncode}")
+        try:
+            Client(url).request('GET', '/login')
+            return server, url
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    sys.exit("The server didn't start in 30 seconds")
+
+
+def remove_uploads():
+    directory = os.path.join(ROOT, 'static', 'audio')
+    for name in os.listdir(directory):
+        if name.startswith(f"{UPLOAD_PREFIX}-{os.getpid()}-"):
+            os.remove(os.path.join(directory, name))
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='sqlite:///bench.sqlite3',
+                        help='the benchmark dataset (default sqlite:///bench.sqlite3, relative to instance/)')
+    parser.add_argument('--url', help='a running server (on that database) instead of starting one')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--server', choices=('flask', 'serve'), default='flask',
+                        help='development server (flask run) or production server (flask serve)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='worker processes of flask serve')
+    parser.add_argument('--threads', type=int, default=1, help='threads per worker of flask serve')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads')
+    parser.add_argument('--duration', type=float, default=30, help='seconds measured')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds before measuring')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--admin-password', default='bench')
+    parser.add_argument('--json', help='write the results (with the commit, dataset and settings) to this file')
+    parser.add_argument('--compare', help='results of a previous run (--json) to compare with')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='percent of p95 latency or throughput counted as a regression (default 10)')
+    parser.add_argument('--min-requests', type=int, default=100,
+                        help='requests a route needs in both runs to be compared (default 100)')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    dataset = describe_dataset(args.database)
+    server, run_path = None, None
+    if args.url:
+        url = args.url
+    else:
+        database, run_path = copy_database(args.database)
+        server, url = start_server(database, args.port, args)
+
+    results = Results()
+    workers = [Worker(index, url, dataset, args, results) for index in range(args.concurrency)]
+    try:
+        # Logging in checks password hashes, which is slow: done before the clock starts
+        for worker in workers:
+            worker.log_in()
+            worker.start()
+        results.started = time.perf_counter()
+        results.ready.set()
+        print(f"{args.concurrency} clients on {url}: {args.warmup:g} s of warmup, then {args.duration:g} s measured")
+        for worker in workers:
+            worker.join()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if run_path is not None:
+            for path in (run_path, f"{run_path}-wal", f"{run_path}-shm"):
+                if os.path.exists(path):
+                    os.remove(path)
+        remove_uploads()
+
+    # Throughput over the measured window, up to the end of the last request sent in it
+    measured = max(args.duration, (results.finished or 0) - results.started - args.warmup)
+    routes = summarize(results, measured)
+    print_table(routes)
+    current = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'dataset': {key: value for key, value in dataset.items() if key != 'words'},
+        'settings': {'concurrency': args.concurrency, 'duration': args.duration, 'warmup': args.warmup,
+                     'seed': args.seed, 'server': 'external' if args.url else args.server},
+        'measured_seconds': round(measured, 2),
+        'routes': routes,
+    }
+    if args.server == 'serve' and not args.url:
+        current['settings'].update(workers=args.workers, threads=args.threads)
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as json_file:
+            json.dump(current, json_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(baseline, current, args.threshold, args.min_requests)
+        if regressions:
+            print(f"\nRegressions (over {args.threshold:g}%): {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Catalog snapshot benchmark: listings and search from the mapped snapshot vs the database, and memory per worker.
+
+Builds the catalog snapshot of the dataset (see benchmarks/dataset.py and application/catalog_snapshot.py)
+into a temporary file, then times the song listing and a few searches both ways. For the memory, it forks
+--workers processes that each read every song, either from the snapshot or as ORM objects kept in memory
+(what a per-process copy of the catalog costs), and prints the resident memory of every worker (Linux):
+PSS counts the pages shared by the workers once, split between them.
+
+    python benchmarks/snapshot.py                       # instance/bench.sqlite3, 4 workers
+    python benchmarks/snapshot.py --workers 8 --search rock --search love
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations) * 1000
+
+
+# Function: Fork the workers, each reads every song with "read" and reports its memory, then they exit together
+def measure_workers(count, read):
+    from application.catalog_snapshot import memory_usage
+    from application.database import db
+
+    db.engine.dispose()
+    pipes, pids = [], []
+    for _ in range(count):
+        result_read, result_write = os.pipe()
+        release_read, release_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(result_read)
+            kept = read()
+            usage = {labels['kind']: value for labels, value in memory_usage()}
+            os.write(result_write, json.dumps(usage).encode())
+            os.close(result_write)
+            # Stay alive until every worker has measured, so that they all share the pages
+            os.read(release_read, 1)
+            del kept
+            os._exit(0)
+        os.close(result_write)
+        pipes.append((result_read, release_write))
+        pids.append(pid)
+
+    results = []
+    for result_read, _ in pipes:
+        data = b''
+        while chunk := os.read(result_read, 4096):
+            data += chunk
+        os.close(result_read)
+        results.append(json.loads(data))
+    for _, release_write in pipes:
+        os.write(release_write, b'x')
+        os.close(release_write)
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='sqlite:///bench.sqlite3',
+                        help='the benchmark dataset (default sqlite:///bench.sqlite3, relative to instance/)')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--search', action='append', help='search queries (default: a, rock, the)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    from benchmarks.dataset import bench_app
+    from application import catalog_snapshot
+    from application.database import db
+    from application.models import Genres, Songs
+    from sqlalchemy import select
+
+    app = bench_app(args.database)
+    with tempfile.TemporaryDirectory() as directory, app.test_request_context():
+        app.config['CATALOG_SNAPSHOT_PATH'] = os.path.join(directory, 'catalog.snapshot')
+        started = time.perf_counter()
+        catalog_snapshot.build(catalog_snapshot.snapshot_path())
+        snapshot = catalog_snapshot.get_snapshot()
+        print(f"Snapshot of {snapshot.song_count} songs and {snapshot.album_count} albums built in "
+              f"{time.perf_counter() - started:.2f} s, {snapshot.size / 1024 / 1024:.1f} MB")
+
+        print(f"\n{'median ms':<24} {'database':>10} {'snapshot':>10}")
+        database_ms = timed(lambda: db.session.query(Songs).all(), args.repeat)
+        snapshot_ms = timed(lambda: list(snapshot.all_songs()), args.repeat)
+        print(f"{'all songs':<24} {database_ms:>10.1f} {snapshot_ms:>10.1f}")
+        for query in args.search or ['a', 'rock', 'the']:
+            # The query of the listings when there is no snapshot
+            database_ms = timed(lambda: Songs.query.filter(
+                Songs.title.ilike(f'%{query}%') | Songs.singer.ilike(f'%{query}%') |
+                Songs.genre_id.in_(select(Genres.genre_id).where(Genres.name.ilike(f'%{query}%')))).all(),
+                args.repeat)
+            snapshot_ms = timed(lambda: snapshot.search_songs(query), args.repeat)
+            print(f"{'search ' + repr(query):<24} {database_ms:>10.1f} {snapshot_ms:>10.1f}")
+        db.session.remove()
+
+        print(f"\nMemory of {args.workers} workers reading every song (MB, per worker)")
+        print(f"{'':<24} {'rss':>8} {'pss':>8} {'snapshot rss':>13} {'snapshot pss':>13}")
+        # The ORM objects are kept (a per-process copy of the catalog), the snapshot rows are dropped after reading
+        for name, read in (('ORM objects', lambda: db.session.query(Songs).all()),
+                           ('snapshot', lambda: sum(1 for _ in snapshot.all_songs()))):
+            for index, usage in enumerate(measure_workers(args.workers, read)):
+                print(f"{name + ' #' + str(index + 1):<24} {usage['rss'] / 2**20:>8.1f} {usage['pss'] / 2**20:>8.1f} "
+                      f"{usage['snapshot_rss'] / 2**20:>13.2f} {usage['snapshot_pss'] / 2**20:>13.2f}")
+
+
+if __name__ == '__main__':
+    main()
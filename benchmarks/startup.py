@@ -0,0 +1,82 @@
+"""Cold-start benchmark: how long a fresh worker takes to import the app and serve its first request.
+
+Every run is a new Python process (like a new gunicorn worker, or a serverless cold invocation), which
+imports the app, then sends one request through the test client. Reported per phase: import, first
+request, total, plus the peak memory of the process.
+
+    python benchmarks/startup.py                 # main:app, 10 runs
+    python benchmarks/startup.py --runs 20 --path /api
+    python benchmarks/startup.py --importtime    # slowest modules, from python -X importtime
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+module_name, _, attribute = sys.argv[1].partition(':')
+app = getattr(__import__(module_name), attribute or 'app')
+imported = time.perf_counter()
+response = app.test_client().get(sys.argv[2])
+served = time.perf_counter()
+print(json.dumps({'import': imported - started,
+                  'first_request': served - imported,
+                  'total': served - started,
+                  'status': response.status_code,
+                  'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def run_once(target, path):
+    output = subprocess.run([sys.executable, '-c', CHILD, target, path], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_times(target, top):
+    module_name = target.partition(':')[0]
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module_name}'], cwd=ROOT,
+                            capture_output=True, text=True, check=True).stderr
+    rows = []
+    # Lines look like "import time:   self [us] | cumulative | imported package"
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        rows.append((int(cumulative_us), int(self_us), name))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', default='main:app', help='module:attribute of the Flask app')
+    parser.add_argument('--path', default='/', help='URL of the first request')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', action='store_true', help='also list the slowest imports')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    results = [run_once(args.target, args.path) for _ in range(args.runs)]
+    print(f"{args.target} - {args.runs} cold starts, first request GET {args.path} -> {results[0]['status']}")
+    for phase in ('import', 'first_request', 'total'):
+        values = [result[phase] * 1000 for result in results]
+        print(f"  {phase:<14} median {statistics.median(values):8.1f} ms   min {min(values):8.1f} ms   "
+              f"max {max(values):8.1f} ms")
+    print(f"  {'peak memory':<14} median {statistics.median(r['max_rss_mb'] for r in results):8.1f} MB")
+
+    if args.importtime:
+        print("\nSlowest imports (cumulative):")
+        for cumulative_us, self_us, name in import_times(args.target, args.top):
+            print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Throughput of the production server (flask serve) for several worker and thread counts.
+
+Runs benchmarks/load.py once per combination of --workers and --threads (each run on a fresh copy
+of the dataset, see benchmarks/dataset.py), plus once on the development server for reference, and
+prints the requests per second and latency of every run:
+
+    python benchmarks/workers.py                                # 1,2,4 workers x 1,4,8 threads
+    python benchmarks/workers.py --workers 2,4,8 --threads 8,16 --concurrency 32 --json results/workers.json
+
+The best setting depends on the machine: more processes use more cores (and memory, see
+benchmarks/startup.py), more threads overlap the waits on the database and the disk.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOAD = os.path.join(ROOT, 'benchmarks', 'load.py')
+
+
+def counts(value):
+    return [int(count) for count in value.split(',') if count.strip()]
+
+
+# Function: The "all" row of a load.py run (throughput and latency over every route)
+def run_load(options, args):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'run.json')
+        subprocess.run([sys.executable, LOAD, '--database', args.database, '--port', str(args.port),
+                        '--concurrency', str(args.concurrency), '--duration', str(args.duration),
+                        '--warmup', str(args.warmup), '--seed', str(args.seed), '--json', path, *options],
+                       cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        with open(path) as run_file:
+            result = json.load(run_file)
+    return result['routes'].get('all', {'requests': 0, 'errors': 0, 'throughput': 0,
+                                         'p50_ms': 0, 'p95_ms': 0, 'p99_ms': 0})
+
+
+def print_row(name, stats):
+    print(f"{name:<18} {stats['requests']:>9} {stats['errors']:>7} {stats['throughput']:>9.1f} "
+          f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default='sqlite:///bench.sqlite3',
+                        help='the benchmark dataset (default sqlite:///bench.sqlite3, relative to instance/)')
+    parser.add_argument('--workers', type=counts, default=[1, 2, 4], help='worker counts, e.g. 1,2,4')
+    parser.add_argument('--threads', type=counts, default=[1, 4, 8], help='thread counts, e.g. 1,4,8')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads')
+    parser.add_argument('--duration', type=float, default=30, help='seconds measured per run')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds before measuring')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-reference', action='store_true', help="skip the development server's run")
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+
+    print(f"{args.concurrency} clients, {args.duration:g} s per run, {os.cpu_count()} CPUs")
+    print(f"{'server':<18} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    runs = []
+    if not args.no_reference:
+        stats = run_load(['--server', 'flask'], args)
+        print_row('flask run', stats)
+        runs.append({'server': 'flask', **stats})
+    for workers in args.workers:
+        for threads in args.threads:
+            stats = run_load(['--server', 'serve', '--workers', str(workers), '--threads', str(threads)], args)
+            print_row(f"{workers} x {threads} threads", stats)
+            runs.append({'server': 'serve', 'workers': workers, 'threads': threads, **stats})
+
+    best = max((run for run in runs if run['server'] == 'serve'), key=lambda run: run['throughput'], default=None)
+    if best is not None:
+        print(f"\nBest: --workers {best['workers']} --threads {best['threads']} ({best['throughput']:.1f} req/s)")
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, 'w') as json_file:
+            json.dump({'cpus': os.cpu_count(), 'concurrency': args.concurrency, 'duration': args.duration,
+                       'runs': runs}, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
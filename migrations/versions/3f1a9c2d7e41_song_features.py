@@ -0,0 +1,30 @@
+"""song features
+
+Revision ID: 3f1a9c2d7e41
+Revises: 0c4586766247
+Create Date: 2026-10-19 10:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a9c2d7e41'
+down_revision = '0c4586766247'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('song_features',
+    sa.Column('song_id', sa.Integer(), nullable=False),
+    sa.Column('vector', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['song_id'], ['songs.song_id'], ),
+    sa.PrimaryKeyConstraint('song_id')
+    )
+
+
+def downgrade():
+    op.drop_table('song_features')
@@ -0,0 +1,38 @@
+"""updated_at on songs, albums and playlists
+
+Revision ID: 5d7c2e9b4a18
+Revises: 8b2e4d6a1c93
+Create Date: 2026-10-19 15:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d7c2e9b4a18'
+down_revision = '8b2e4d6a1c93'
+branch_labels = None
+depends_on = None
+
+TABLES = ('songs', 'albums', 'playlists')
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+        # Existing rows count as changed now (CURRENT_TIMESTAMP is in UTC, like the new values)
+        op.execute(f'UPDATE {table} SET updated_at = CURRENT_TIMESTAMP')
+
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+            batch_op.create_index(f'ix_{table}_updated_at', ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table}_updated_at')
+            batch_op.drop_column('updated_at')
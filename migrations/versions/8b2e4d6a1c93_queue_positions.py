@@ -0,0 +1,41 @@
+"""queue positions and playback state
+
+Revision ID: 8b2e4d6a1c93
+Revises: 3f1a9c2d7e41
+Create Date: 2026-10-19 11:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4d6a1c93'
+down_revision = '3f1a9c2d7e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('queue', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('position', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_queue_user_id_position', ['user_id', 'position'], unique=False)
+
+    # Existing rows keep their insertion order, spaced like new ones
+    op.execute('UPDATE queue SET position = queue_id * 1024')
+
+    op.create_table('queue_state',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('current_queue_id', sa.Integer(), nullable=True),
+    sa.Column('shuffle_seed', sa.Integer(), nullable=True),
+    sa.Column('repeat', sa.String(length=3), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('queue_state')
+    with op.batch_alter_table('queue', schema=None) as batch_op:
+        batch_op.drop_index('ix_queue_user_id_position')
+        batch_op.drop_column('position')
@@ -0,0 +1,56 @@
+"""stat counters
+
+Revision ID: a4c81f3e6b27
+Revises: 5d7c2e9b4a18
+Create Date: 2026-10-19 18:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c81f3e6b27'
+down_revision = '5d7c2e9b4a18'
+branch_labels = None
+depends_on = None
+
+# The counters of the existing rows (the same ones as "flask reconcile-stats")
+INITIAL_COUNTERS = [
+    "SELECT 'users', role, COUNT(*), NULL FROM users GROUP BY role",
+    "SELECT 'songs', 0, COUNT(*), NULL FROM songs",
+    "SELECT 'albums', 0, COUNT(*), NULL FROM albums",
+    "SELECT 'genre:' || genre, 0, COUNT(*), NULL FROM songs GROUP BY genre",
+    "SELECT 'user_songs', user_id, COUNT(*), NULL FROM songs GROUP BY user_id",
+    "SELECT 'user_albums', user_id, COUNT(*), NULL FROM albums GROUP BY user_id",
+    "SELECT 'user_playlists', user_id, COUNT(*), NULL FROM playlists GROUP BY user_id",
+    "SELECT 'creator_rating_sum', songs.user_id, SUM(ratings.rating), NULL "
+    "FROM ratings JOIN songs ON songs.song_id = ratings.song_id GROUP BY songs.user_id",
+    "SELECT 'creator_ratings', songs.user_id, COUNT(*), NULL "
+    "FROM ratings JOIN songs ON songs.song_id = ratings.song_id GROUP BY songs.user_id",
+    "SELECT 'song_plays', plays.song_id, SUM(plays.play_count), MAX(songs.user_id) "
+    "FROM plays LEFT JOIN songs ON songs.song_id = plays.song_id GROUP BY plays.song_id",
+    "SELECT 'user_plays', user_id, SUM(play_count), NULL FROM plays GROUP BY user_id",
+]
+
+
+def upgrade():
+    op.create_table('stat_counters',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('subject_id', sa.Integer(), nullable=False),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('name', 'subject_id')
+    )
+    with op.batch_alter_table('stat_counters', schema=None) as batch_op:
+        batch_op.create_index('ix_stat_counters_owner_id', ['owner_id'], unique=False)
+
+    for query in INITIAL_COUNTERS:
+        op.execute(f'INSERT INTO stat_counters (name, subject_id, value, owner_id) {query}')
+
+
+def downgrade():
+    with op.batch_alter_table('stat_counters', schema=None) as batch_op:
+        batch_op.drop_index('ix_stat_counters_owner_id')
+
+    op.drop_table('stat_counters')
@@ -0,0 +1,39 @@
+"""trending scores of the songs
+
+Revision ID: b9e3d5a7c264
+Revises: f2a8c6d4b351
+Create Date: 2026-10-20 00:15:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e3d5a7c264'
+down_revision = 'f2a8c6d4b351'
+branch_labels = None
+depends_on = None
+
+
+# The scores are filled in by "flask rebuild-trending" (they depend on TRENDING_HALF_LIFE_HOURS)
+def upgrade():
+    op.create_table('trending',
+    sa.Column('song_id', sa.Integer(), nullable=False),
+    sa.Column('genre_id', sa.Integer(), nullable=False),
+    sa.Column('epoch', sa.Integer(), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['song_id'], ['songs.song_id'], ),
+    sa.PrimaryKeyConstraint('song_id')
+    )
+    with op.batch_alter_table('trending', schema=None) as batch_op:
+        batch_op.create_index('ix_trending_genre_epoch_weight', ['genre_id', 'epoch', 'weight'], unique=False)
+        batch_op.create_index('ix_trending_epoch_weight', ['epoch', 'weight'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('trending', schema=None) as batch_op:
+        batch_op.drop_index('ix_trending_epoch_weight')
+        batch_op.drop_index('ix_trending_genre_epoch_weight')
+
+    op.drop_table('trending')
@@ -0,0 +1,28 @@
+"""file hash of the songs
+
+Revision ID: c7d2a9e4f158
+Revises: a4c81f3e6b27
+Create Date: 2026-10-19 21:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2a9e4f158'
+down_revision = 'a4c81f3e6b27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('file_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index('ix_songs_file_hash', ['file_hash'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.drop_index('ix_songs_file_hash')
+        batch_op.drop_column('file_hash')
@@ -0,0 +1,25 @@
+"""genres counter
+
+Revision ID: d3f6a1b8e294
+Revises: b9e3d5a7c264
+Create Date: 2026-10-20 09:30:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f6a1b8e294'
+down_revision = 'b9e3d5a7c264'
+branch_labels = None
+depends_on = None
+
+
+# The genres with songs, counted like the other dashboard counters (the same as "flask reconcile-stats")
+def upgrade():
+    op.execute("INSERT INTO stat_counters (name, subject_id, value, owner_id) "
+               "SELECT 'genres', 0, COUNT(*), NULL FROM genres WHERE song_count > 0")
+
+
+def downgrade():
+    op.execute("DELETE FROM stat_counters WHERE name = 'genres'")
@@ -0,0 +1,93 @@
+"""genres table, integer song durations, plays timestamps index
+
+Revision ID: e5b1f7c3a962
+Revises: c7d2a9e4f158
+Create Date: 2026-10-19 22:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1f7c3a962'
+down_revision = 'c7d2a9e4f158'
+branch_labels = None
+depends_on = None
+
+# Names for the constraints that were created without one (SQLite has to be told what to call them)
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+# Function: Name of the foreign key of plays.song_id, as the database knows it
+def _plays_song_fk():
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys('plays'):
+        if foreign_key['constrained_columns'] == ['song_id']:
+            return foreign_key['name'] or 'fk_plays_song_id_songs'
+    return None
+
+
+def upgrade():
+    op.create_table('genres',
+    sa.Column('genre_id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('song_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('genre_id'),
+    sa.UniqueConstraint('name')
+    )
+    # Names that only differ by surrounding spaces or case are one genre, as for Genres.named()
+    # (named after their first spelling in alphabetical order)
+    op.execute("INSERT INTO genres (name, song_count) SELECT MIN(TRIM(genre)), COUNT(*) FROM songs "
+               "GROUP BY LOWER(TRIM(genre))")
+
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('genre_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('duration_ms', sa.Integer(), nullable=True))
+    op.execute("UPDATE songs SET genre_id = (SELECT genre_id FROM genres "
+               "WHERE LOWER(genres.name) = LOWER(TRIM(songs.genre))), "
+               "duration_ms = CAST(ROUND(CAST(duration AS REAL) * 1000) AS INTEGER)")
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.alter_column('genre_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.alter_column('duration_ms', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key('fk_songs_genre_id_genres', 'genres', ['genre_id'], ['genre_id'])
+        batch_op.create_index('ix_songs_genre_id', ['genre_id'], unique=False)
+        batch_op.create_index('ix_songs_duration_ms', ['duration_ms'], unique=False)
+        batch_op.drop_column('genre')
+        batch_op.drop_column('duration')
+
+    # plays.song_id referenced songs.user_id
+    song_fk = _plays_song_fk()
+    with op.batch_alter_table('plays', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        if song_fk is not None:
+            batch_op.drop_constraint(song_fk, type_='foreignkey')
+        batch_op.create_foreign_key('fk_plays_song_id_songs', 'songs', ['song_id'], ['song_id'])
+        batch_op.create_index('ix_plays_date_created', ['date_created'], unique=False)
+
+    # The songs per genre are counted in genres.song_count now
+    op.execute("DELETE FROM stat_counters WHERE name LIKE 'genre:%'")
+
+
+def downgrade():
+    op.execute("INSERT INTO stat_counters (name, subject_id, value, owner_id) "
+               "SELECT 'genre:' || name, 0, song_count, NULL FROM genres WHERE song_count > 0")
+
+    with op.batch_alter_table('plays', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        batch_op.drop_index('ix_plays_date_created')
+        batch_op.drop_constraint('fk_plays_song_id_songs', type_='foreignkey')
+        batch_op.create_foreign_key('fk_plays_song_id_songs', 'songs', ['song_id'], ['user_id'])
+
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('genre', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('duration', sa.String(), nullable=True))
+    op.execute("UPDATE songs SET genre = (SELECT name FROM genres WHERE genres.genre_id = songs.genre_id), "
+               "duration = CAST(duration_ms / 1000.0 AS VARCHAR)")
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.alter_column('genre', existing_type=sa.String(), nullable=False)
+        batch_op.alter_column('duration', existing_type=sa.String(), nullable=False)
+        batch_op.drop_index('ix_songs_duration_ms')
+        batch_op.drop_index('ix_songs_genre_id')
+        batch_op.drop_constraint('fk_songs_genre_id_genres', type_='foreignkey')
+        batch_op.drop_column('duration_ms')
+        batch_op.drop_column('genre_id')
+
+    op.drop_table('genres')
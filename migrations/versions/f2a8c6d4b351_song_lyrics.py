@@ -0,0 +1,71 @@
+"""compressed song lyrics in their own table
+
+Revision ID: f2a8c6d4b351
+Revises: e5b1f7c3a962
+Create Date: 2026-10-19 23:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from application.lyrics import encode, decompress
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8c6d4b351'
+down_revision = 'e5b1f7c3a962'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+song_lyrics = sa.table('song_lyrics', sa.column('song_id', sa.Integer), sa.column('format', sa.String),
+                       sa.column('content', sa.LargeBinary), sa.column('timestamps', sa.LargeBinary))
+
+
+# Function: Rows of a table in batches of BATCH_SIZE, by song_id
+def _batches(connection, query):
+    last_id = 0
+    while True:
+        rows = connection.execute(query, {'last_id': last_id, 'limit': BATCH_SIZE}).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    op.create_table('song_lyrics',
+    sa.Column('song_id', sa.Integer(), nullable=False),
+    sa.Column('format', sa.String(length=10), nullable=False),
+    sa.Column('content', sa.LargeBinary(), nullable=False),
+    sa.Column('timestamps', sa.LargeBinary(), nullable=True),
+    sa.ForeignKeyConstraint(['song_id'], ['songs.song_id'], ),
+    sa.PrimaryKeyConstraint('song_id')
+    )
+
+    connection = op.get_bind()
+    query = sa.text("SELECT song_id, lyrics FROM songs WHERE song_id > :last_id AND lyrics IS NOT NULL "
+                    "AND lyrics != '' ORDER BY song_id LIMIT :limit")
+    for rows in _batches(connection, query):
+        values = []
+        for song_id, text in rows:
+            lyrics_format, content, timestamps = encode(text)
+            values.append({'song_id': song_id, 'format': lyrics_format, 'content': content,
+                           'timestamps': timestamps})
+        connection.execute(song_lyrics.insert(), values)
+
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.drop_column('lyrics')
+
+
+def downgrade():
+    with op.batch_alter_table('songs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('lyrics', sa.String(), nullable=True))
+
+    connection = op.get_bind()
+    query = sa.text("SELECT song_id, content FROM song_lyrics WHERE song_id > :last_id ORDER BY song_id LIMIT :limit")
+    for rows in _batches(connection, query):
+        connection.execute(sa.text("UPDATE songs SET lyrics = :lyrics WHERE song_id = :song_id"),
+                           [{'song_id': song_id, 'lyrics': decompress(content)} for song_id, content in rows])
+
+    op.drop_table('song_lyrics')
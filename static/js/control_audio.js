@@ -1,24 +1,192 @@
+// Audio player
+// Two audio elements take turns: while one plays, the other one preloads the next song of the queue,
+// so that the next song starts right away when the current one ends (gapless transitions).
+// Songs are swapped client-side through the JSON APIs (/api/now_playing, /api/queue),
+// instead of re-rendering the whole page.
+
+var player = {
+    active: null,
+    standby: null,
+    next: null
+};
+
+function currentAudio() {
+    if (!player.active) {
+        player.active = document.getElementById('audioElement');
+    }
+    return player.active;
+}
+
 function playAudio() {
-    var audio = document.getElementById('audioElement');
+    var audio = currentAudio();
     audio.play();
 }
 
 function pauseAudio() {
-    var audio = document.getElementById('audioElement');
+    var audio = currentAudio();
     audio.pause();
 }
 
-// I need to implement the logic behind changing the song to the next one on the Queue list
-// And for that, I also need to write code to handle Queue lists
+function jsonRequest(url, method, body) {
+    return fetch(url, {
+        method: method || 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: body ? JSON.stringify(body) : undefined
+    }).then(function (response) {
+        return response.json();
+    });
+}
 
-function nextSong() {
+function setText(elementId, text) {
+    var element = document.getElementById(elementId);
+    if (element) {
+        element.textContent = text;
+    }
+}
+
+// Updates the cassette labels and the Now Playing card
+function showSong(song) {
+    setText('nowPlayingSinger', song.singer);
+    setText('nowPlayingTitle', song.title);
+    setText('nowPlayingDuration', song.duration_text);
+    setText('nowPlayingCardTitle', song.title);
+    setText('nowPlayingCardSinger', song.singer);
+    var cover = document.getElementById('nowPlayingCover');
+    if (cover) {
+        cover.src = song.cover.medium;
+    }
+}
 
+// Preloads the next song into the standby audio element
+function prefetch(song) {
+    player.next = song;
+    if (!song) {
+        return;
+    }
+    if (!player.standby) {
+        player.standby = new Audio();
+        player.standby.addEventListener('ended', onSongEnded);
+    }
+    player.standby.preload = 'auto';
+    player.standby.src = song.stream_url;
+    player.standby.load();
+}
+
+// Plays a song (as returned by the APIs), and prefetches the one after it
+function playSong(song, nextSong) {
+    var audio = currentAudio();
+    if (!audio) {
+        return;
+    }
+    if (!song) {
+        stopSong();
+        return;
+    }
+    if (player.standby && player.next && player.next.song_id === song.song_id) {
+        // The song is already buffered in the standby element: switch elements instead of loading it again
+        audio.pause();
+        player.standby.volume = audio.volume;
+        player.active = player.standby;
+        player.standby = audio;
+    } else {
+        audio.src = song.stream_url;
+    }
+    player.active.play();
+    showSong(song);
+    prefetch(nextSong);
+}
+
+// Response of the queue API: {current: song, next: song, ...}
+function playQueueResponse(queue) {
+    playSong(queue.current, queue.next);
+}
+
+// Play button of a song
+function streamSong(songId) {
+    jsonRequest('/api/now_playing', 'POST', {song_id: songId}).then(function (nowPlaying) {
+        playSong(nowPlaying.song, nowPlaying.next);
+    });
+}
+
+function nextSong() {
+    jsonRequest('/api/queue/next').then(playQueueResponse);
 }
 
 function prevSong() {
+    jsonRequest('/api/queue/previous').then(playQueueResponse);
+}
+
+function onSongEnded() {
+    jsonRequest('/api/queue/next', 'POST', {auto: true}).then(playQueueResponse);
+}
+
+function playQueueItem(queueId) {
+    jsonRequest('/api/queue/' + queueId + '/play').then(playQueueResponse);
+}
+
+function removeFromQueue(queueId) {
+    jsonRequest('/api/queue/' + queueId, 'DELETE').then(function (queue) {
+        var item = document.getElementById('queueItem' + queueId);
+        if (item) {
+            item.remove();
+        }
+        prefetch(queue.next);
+    });
+}
 
+// "Play all" button of playlists and albums: replaces the queue, and starts the first song
+function playAll(source, sourceId) {
+    if (!currentAudio()) {
+        window.location = '/play_all/' + source + '/' + sourceId;
+        return;
+    }
+    jsonRequest('/api/queue/' + source + '/' + sourceId, 'POST', {replace: true}).then(playQueueResponse);
 }
 
+function toggleShuffle() {
+    jsonRequest('/api/queue', 'GET').then(function (queue) {
+        return jsonRequest('/api/queue/shuffle', 'POST', {enabled: !queue.shuffle});
+    }).then(function (queue) {
+        prefetch(queue.next);
+    });
+}
+
+function cycleRepeat() {
+    var modes = ['off', 'all', 'one'];
+    jsonRequest('/api/queue', 'GET').then(function (queue) {
+        var mode = modes[(modes.indexOf(queue.repeat) + 1) % modes.length];
+        return jsonRequest('/api/queue/repeat', 'POST', {mode: mode});
+    }).then(function (queue) {
+        prefetch(queue.next);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', function () {
+    var audio = currentAudio();
+    if (!audio) {
+        return;
+    }
+    // Moving on to the next song in the queue, when a song ends
+    audio.addEventListener('ended', onSongEnded);
+
+    // The "stream" forms of the song lists play the song in place, instead of posting the page
+    document.addEventListener('submit', function (event) {
+        var submitter = event.submitter;
+        var songId = event.target.querySelector('input[name="song_id"]');
+        if (submitter && submitter.name === 'stream' && songId) {
+            event.preventDefault();
+            streamSong(songId.value);
+        }
+    });
+
+    // A page rendered with a song already playing: only the next song needs to be prefetched
+    if (audio.getAttribute('src')) {
+        jsonRequest('/api/queue', 'GET').then(function (queue) {
+            prefetch(queue.next);
+        });
+    }
+});
+
 function recordSong() {
 
 }
@@ -28,7 +196,7 @@ function recordSong() {
 // Then, it will stop showing the Now Playing song from everywhere in the page, and from the audio controls also.
 
 function stopSong() {
-    var audio = document.getElementById('audioElement');
+    var audio = currentAudio();
     audio.pause();
     audio.currentTime = 0;
-}
\ No newline at end of file
+}
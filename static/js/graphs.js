@@ -0,0 +1,32 @@
+// Dashboard graphs
+// The graph APIs return columnar series ({labels: [...], plays: [...]}), drawn here with Chart.js.
+
+var graphs = {};
+
+function drawGraph(canvasId, type, series, options) {
+    var canvas = document.getElementById(canvasId);
+    if (!canvas || !series) {
+        return;
+    }
+    if (graphs[canvasId]) {
+        graphs[canvasId].destroy();
+    }
+    graphs[canvasId] = new Chart(canvas, {
+        type: type,
+        data: {
+            labels: series.labels,
+            datasets: [{label: 'Plays', data: series.plays, backgroundColor: 'skyblue', borderColor: 'steelblue'}]
+        },
+        options: Object.assign({plugins: {legend: {display: false}}}, options)
+    });
+}
+
+// Fetches the series from a graph API (e.g. '/api/admin/graphs?granularity=week') and draws them
+function drawGraphs(url) {
+    fetch(url, {credentials: 'same-origin'}).then(function (response) {
+        return response.json();
+    }).then(function (payload) {
+        drawGraph('monthlyUsageGraph', 'line', payload.monthly_usage, {});
+        drawGraph('songVsPlaysGraph', 'bar', payload.song_plays, {indexAxis: 'y'});
+    });
+}